@@ -0,0 +1,131 @@
+# agenda_coleta.py
+"""
+Ordem de coleta da grade (competência x município) dos loaders CNES.
+
+Prioridade, para o painel ter os números de manchete cedo numa execução longa:
+  1. competências mais recentes primeiro;
+  2. dentro da competência, municípios maiores primeiro (peso = soma da métrica
+     principal na última competência carregada; sem histórico, ordem do IBGE);
+  3. células que falharam (etl_celula_falha) voltam à fila com backoff
+     exponencial: BACKOFF_INICIAL_MIN * 2**(tentativas-1), até BACKOFF_MAX_MIN.
+     Enquanto em espera, a célula é pulada; vencido o prazo, ela é re-tentada
+     mesmo que a competência já tenha dados no banco.
+
+Uso no loader:
+    agenda = AgendaColeta(conn, "leito", "fato_cnes_leito", "existente")
+    for vcomp in agenda.competencias(competencias): ...
+        for m in agenda.ordenar(municipios, vcomp): ...
+        agenda.falhou(cod, vcomp) / agenda.sucesso(cod, vcomp)
+    gravar_com_retentativa(conn, ..., pendencias=(agenda,))   # db_utils: flush + commit + limpar
+"""
+
+from datetime import datetime, timedelta, timezone
+
+BACKOFF_INICIAL_MIN = 30
+BACKOFF_MAX_MIN = 7 * 24 * 60
+
+
+def espera_falha(tentativas: int) -> timedelta:
+    return timedelta(minutes=min(BACKOFF_MAX_MIN, BACKOFF_INICIAL_MIN * 2 ** (tentativas - 1)))
+
+
+class AgendaColeta:
+    def __init__(self, conn, dataset: str, tabela_fato: str, metrica: str):
+        self.dataset = dataset
+        self.pesos = self._carregar_pesos(conn, tabela_fato, metrica)
+        self.falhas = self._carregar_falhas(conn)  # {(cod, vcomp): (tentativas, proxima)}
+        self._novas_falhas = {}
+        self._sucessos = set()
+        self.adiadas = 0
+
+    def _carregar_pesos(self, conn, tabela, metrica) -> dict[str, int]:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                WITH ultima AS (
+                    SELECT d.competencia_id
+                    FROM dim_competencia d
+                    WHERE EXISTS (SELECT 1 FROM {tabela} f WHERE f.competencia_id = d.competencia_id)
+                    ORDER BY d.vcomp DESC
+                    LIMIT 1
+                )
+                SELECT m.codigo_municipio, SUM(f.{metrica})
+                FROM {tabela} f
+                JOIN dim_municipio m ON m.municipio_id = f.municipio_id
+                WHERE f.competencia_id = (SELECT competencia_id FROM ultima)
+                GROUP BY m.codigo_municipio
+            """)
+            return {c: int(p or 0) for c, p in cur.fetchall()}
+
+    def _carregar_falhas(self, conn) -> dict:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT codigo_municipio, vcomp, tentativas, proxima_tentativa
+                FROM etl_celula_falha WHERE dataset = %s
+            """, (self.dataset,))
+            return {(c, v): (t, p) for c, v, t, p in cur.fetchall()}
+
+    # ---- ordem ----
+    @staticmethod
+    def competencias(competencias: list[str]) -> list[str]:
+        return sorted(competencias, reverse=True)
+
+    def ordenar(self, municipios: list[dict], vcomp: str, ignorar_backoff: bool = False) -> list[dict]:
+        """Maiores primeiro; sem as células em backoff (a não ser com ignorar_backoff)."""
+        agora = datetime.now(timezone.utc)
+        out = []
+        for m in municipios:
+            f = self.falhas.get((m["codigo"], vcomp))
+            if f and f[1] > agora and not ignorar_backoff:
+                self.adiadas += 1
+                continue
+            out.append(m)
+        return sorted(out, key=lambda m: -self.pesos.get(m["codigo"], 0))
+
+    def falhas_vencidas(self, municipios: list[dict], vcomp: str) -> list[dict]:
+        """Municípios com falha registrada nesta competência e backoff já vencido."""
+        agora = datetime.now(timezone.utc)
+        return [m for m in municipios
+                if (f := self.falhas.get((m["codigo"], vcomp))) and f[1] <= agora]
+
+    # ---- registro ----
+    def falhou(self, codigo: str, vcomp: str):
+        tent = self.falhas.get((codigo, vcomp), (0, None))[0] + 1
+        prox = datetime.now(timezone.utc) + espera_falha(tent)
+        self.falhas[(codigo, vcomp)] = (tent, prox)
+        self._novas_falhas[(codigo, vcomp)] = (tent, prox)
+        self._sucessos.discard((codigo, vcomp))
+
+    def sucesso(self, codigo: str, vcomp: str):
+        if (codigo, vcomp) in self.falhas:
+            del self.falhas[(codigo, vcomp)]
+            self._novas_falhas.pop((codigo, vcomp), None)
+            self._sucessos.add((codigo, vcomp))
+
+    def flush(self, conn) -> int:
+        """
+        Grava na transação corrente (commit com o chamador). As pendências só
+        saem da fila em limpar(), depois do commit: se a transação for desfeita
+        (deadlock, retentativa), o próximo flush grava tudo de novo.
+        """
+        n = len(self._novas_falhas) + len(self._sucessos)
+        if not n:
+            return 0
+        with conn.cursor() as cur:
+            if self._novas_falhas:
+                cur.executemany("""
+                    INSERT INTO etl_celula_falha (dataset, codigo_municipio, vcomp, tentativas, proxima_tentativa)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (dataset, codigo_municipio, vcomp) DO UPDATE
+                    SET tentativas = EXCLUDED.tentativas, ultima_falha = NOW(),
+                        proxima_tentativa = EXCLUDED.proxima_tentativa
+                """, [(self.dataset, c, v, t, p) for (c, v), (t, p) in sorted(self._novas_falhas.items())])
+            if self._sucessos:
+                cur.executemany(
+                    "DELETE FROM etl_celula_falha WHERE dataset=%s AND codigo_municipio=%s AND vcomp=%s",
+                    [(self.dataset, c, v) for c, v in sorted(self._sucessos)]
+                )
+        return n
+
+    def limpar(self):
+        self._novas_falhas.clear()
+        self._sucessos.clear()
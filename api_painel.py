@@ -0,0 +1,495 @@
+# api_painel.py
+"""
+API HTTP local (somente leitura) sobre os fatos CNES e SIOPS.
+
+Rotas (todas GET, respostas JSON):
+  /saude
+  /cnes/<dataset>/serie?municipio=140010[&item=74][&metrica=existente][&limite=&cursor=]
+      série temporal (soma da métrica por competência) de um município / item
+  /cnes/<dataset>/ranking?vcomp=202401[&metrica=][&item=][&limite=&cursor=]
+      municípios ordenados pela métrica (desc) numa competência
+  /cnes/<dataset>/ultimo[?municipio=][&limite=&cursor=]
+      snapshot da última competência carregada do dataset
+  /siops/tabelas?municipio=140010[&ano=][&periodo=][&limite=&cursor=]
+      tabelas SIOPS (matrix JSON) de um município
+
+<dataset> ∈ leito | equipamento | tipo_unidade.
+
+Paginação por keyset: a resposta traz "proximo_cursor" (opaco); basta repassá-lo
+em ?cursor= para a próxima página. Sem OFFSET, o custo da página N é o da primeira.
+
+Cache: respostas ficam num LRU em memória, versionado por etl_versao_dataset, que
+avança logo depois de cada commit de carga, numa transação curta à parte
+(eventos_carga.publicar_carga/avancar_versoes, também quando o --refresh só apaga
+linhas). Quando a versão avança as entradas
+antigas daquele dataset deixam de valer. A versão é consultada no máximo a cada
+VERSAO_TTL segundos; além disso a API escuta os eventos de carga (eventos_carga.py)
+e descarta o cache do dataset assim que um loader faz commit.
+
+Uso:
+  python api_painel.py [--host 127.0.0.1] [--port 8080] [--sem-eventos] [--pool-tamanho 8]
+
+/saude traz também as métricas do pool de conexões (espera por etapa, pico em uso).
+"""
+
+import json
+import time
+import base64
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from db_config import DBConfig
+from pool_db import conexao, pool
+from eventos_carga import escutar
+
+# -------------------- Config --------------------
+LIMITE_PADRAO = 100
+LIMITE_MAX = 1000
+CACHE_MAX_ENTRADAS = 2048
+VERSAO_TTL = 5.0  # segundos entre consultas de etl_versao_dataset
+
+DATASETS_CNES = {
+    "leito":        {"tabela": "fato_cnes_leito",        "metricas": ["existente", "sus", "habilitados"]},
+    "equipamento":  {"tabela": "fato_cnes_equipamento",  "metricas": ["existentes", "em_uso", "existentes_sus", "em_uso_sus"]},
+    "tipo_unidade": {"tabela": "fato_cnes_tipo_unidade", "metricas": ["total"]},
+}
+
+
+class ErroRequisicao(Exception):
+    """Parâmetro inválido/ausente -> HTTP 400 (ou 404 com status=404)."""
+    def __init__(self, msg: str, status: int = 400):
+        super().__init__(msg)
+        self.status = status
+
+
+# -------------------- cursor keyset --------------------
+
+def _codificar_cursor(chave) -> str:
+    raw = json.dumps(chave, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decodificar_cursor(cursor: str | None, tipos: tuple):
+    """
+    Lista com um valor por coluna da chave de ordenação, cada um do tipo em
+    'tipos' (ex.: (int, str)). Qualquer outra coisa é cursor inválido (400).
+    """
+    if not cursor:
+        return None
+    try:
+        chave = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ErroRequisicao("cursor inválido")
+    if (not isinstance(chave, list) or len(chave) != len(tipos)
+            or not all(isinstance(v, t) and not isinstance(v, bool) for v, t in zip(chave, tipos))):
+        raise ErroRequisicao("cursor inválido")
+    return chave
+
+
+# -------------------- cache --------------------
+
+class CacheRespostas:
+    """
+    LRU em memória: chave -> (versao_dataset, corpo_bytes).
+    Uma entrada só é servida se a versão gravada for igual à versão atual do dataset.
+    """
+    def __init__(self, max_entradas: int = CACHE_MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chave, versao):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None or item[0] != versao:
+                self.misses += 1
+                return None
+            self._dados.move_to_end(chave)
+            self.hits += 1
+            return item[1]
+
+    def put(self, chave, versao, corpo: bytes):
+        with self._lock:
+            self._dados[chave] = (versao, corpo)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_entradas:
+                self._dados.popitem(last=False)
+
+    def invalidar(self, dataset: str | None = None):
+        with self._lock:
+            if dataset is None:
+                self._dados.clear()
+                return
+            for k in [k for k in self._dados if k[0] == dataset]:
+                del self._dados[k]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entradas": len(self._dados), "hits": self.hits, "misses": self.misses}
+
+
+class VersoesDatasets:
+    """
+    Versão de cada dataset (etl_versao_dataset), relida no máximo a cada 'ttl'
+    segundos: uma consulta de 4 linhas pela PK, sem tocar nos fatos.
+    """
+    def __init__(self, ttl: float = VERSAO_TTL):
+        self.ttl = ttl
+        self._versoes = {}
+        self._lido_em = 0.0
+        self._lock = threading.Lock()
+
+    def atual(self, conn, dataset: str) -> str:
+        with self._lock:
+            if time.monotonic() - self._lido_em > self.ttl:
+                self._recarregar(conn)
+            return self._versoes.get(dataset, "")
+
+    def expirar(self):
+        with self._lock:
+            self._lido_em = 0.0
+
+    def _recarregar(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT dataset, versao FROM etl_versao_dataset")
+            self._versoes = {ds: str(v) for ds, v in cur.fetchall()}
+        self._lido_em = time.monotonic()
+
+
+# -------------------- consultas --------------------
+
+def _limite(qs) -> int:
+    try:
+        n = int(qs.get("limite", LIMITE_PADRAO))
+    except ValueError:
+        raise ErroRequisicao("limite deve ser inteiro")
+    return max(1, min(n, LIMITE_MAX))
+
+def _inteiro(qs, nome: str) -> int:
+    try:
+        return int(qs[nome])
+    except ValueError:
+        raise ErroRequisicao(f"{nome} deve ser inteiro")
+
+def _dataset_cnes(nome: str) -> dict:
+    spec = DATASETS_CNES.get(nome)
+    if spec is None:
+        raise ErroRequisicao(f"dataset desconhecido: {nome}", status=404)
+    return spec
+
+def _metrica(spec: dict, qs) -> str:
+    m = qs.get("metrica", spec["metricas"][0])
+    if m not in spec["metricas"]:
+        raise ErroRequisicao(f"métrica inválida: {m} (opções: {', '.join(spec['metricas'])})")
+    return m
+
+def _obrigatorio(qs, nome: str) -> str:
+    v = qs.get(nome)
+    if not v:
+        raise ErroRequisicao(f"parâmetro obrigatório: {nome}")
+    return v
+
+def _pagina(linhas: list, limite: int, chave_fn) -> dict:
+    """
+    'linhas' vem com limite+1 registros; o excedente só indica que há próxima página.
+    """
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    cursor = _codificar_cursor(chave_fn(linhas[-1])) if (tem_mais and linhas) else None
+    return {"dados": linhas, "proximo_cursor": cursor}
+
+def consultar_serie(conn, dataset: str, qs) -> dict:
+    spec = _dataset_cnes(dataset)
+    metrica = _metrica(spec, qs)
+    municipio = _obrigatorio(qs, "municipio")
+    item = qs.get("item")
+    limite = _limite(qs)
+    depois = _decodificar_cursor(qs.get("cursor"), (str,))
+
+    where = ["mu.codigo_municipio = %s"]
+    params = [municipio]
+    if item:
+        where.append("i.codigo = %s")
+        params.append(item)
+    if depois:
+        where.append("d.vcomp > %s")
+        params.append(depois[0])
+
+    q = f"""
+        SELECT d.vcomp, SUM(f.{metrica})::bigint AS valor
+        FROM {spec['tabela']} f
+        JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+        JOIN dim_municipio  mu ON mu.municipio_id  = f.municipio_id
+        JOIN dim_item_cnes   i ON i.item_id        = f.item_id
+        WHERE {' AND '.join(where)}
+        GROUP BY d.vcomp
+        ORDER BY d.vcomp
+        LIMIT %s
+    """
+    with conn.cursor() as cur:
+        cur.execute(q, params + [limite + 1])
+        linhas = [{"vcomp": v, "valor": int(val or 0)} for v, val in cur.fetchall()]
+    out = _pagina(linhas, limite, lambda r: [r["vcomp"]])
+    out.update({"dataset": dataset, "metrica": metrica, "municipio": municipio, "item": item})
+    return out
+
+def consultar_ranking(conn, dataset: str, qs) -> dict:
+    spec = _dataset_cnes(dataset)
+    metrica = _metrica(spec, qs)
+    vcomp = _obrigatorio(qs, "vcomp")
+    item = qs.get("item")
+    limite = _limite(qs)
+    depois = _decodificar_cursor(qs.get("cursor"), (int, str))
+
+    where = ["d.vcomp = %s"]
+    params = [vcomp]
+    if item:
+        where.append("i.codigo = %s")
+        params.append(item)
+
+    filtro_cursor = ""
+    if depois:
+        # ordem: valor DESC, codigo_municipio ASC
+        filtro_cursor = "WHERE (s.valor < %s OR (s.valor = %s AND s.codigo_municipio > %s))"
+        params += [depois[0], depois[0], depois[1]]
+
+    q = f"""
+        SELECT s.codigo_municipio, s.nome, s.uf, s.valor
+        FROM (
+            SELECT mu.codigo_municipio, mu.nome, mu.uf, SUM(f.{metrica})::bigint AS valor
+            FROM {spec['tabela']} f
+            JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+            JOIN dim_municipio  mu ON mu.municipio_id  = f.municipio_id
+            JOIN dim_item_cnes   i ON i.item_id        = f.item_id
+            WHERE {' AND '.join(where)}
+            GROUP BY mu.codigo_municipio, mu.nome, mu.uf
+        ) s
+        {filtro_cursor}
+        ORDER BY s.valor DESC, s.codigo_municipio ASC
+        LIMIT %s
+    """
+    with conn.cursor() as cur:
+        cur.execute(q, params + [limite + 1])
+        linhas = [
+            {"codigo_municipio": c, "municipio": n, "uf": uf, "valor": int(v or 0)}
+            for c, n, uf, v in cur.fetchall()
+        ]
+    out = _pagina(linhas, limite, lambda r: [r["valor"], r["codigo_municipio"]])
+    out.update({"dataset": dataset, "metrica": metrica, "vcomp": vcomp, "item": item})
+    return out
+
+def consultar_ultimo(conn, dataset: str, qs) -> dict:
+    spec = _dataset_cnes(dataset)
+    municipio = qs.get("municipio")
+    limite = _limite(qs)
+    depois = _decodificar_cursor(qs.get("cursor"), (str, str))
+
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT MAX(d.vcomp)
+            FROM {spec['tabela']} f
+            JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+        """)
+        vcomp = cur.fetchone()[0]
+    if vcomp is None:
+        return {"dataset": dataset, "vcomp": None, "dados": [], "proximo_cursor": None}
+
+    where = ["d.vcomp = %s"]
+    params = [vcomp]
+    if municipio:
+        where.append("mu.codigo_municipio = %s")
+        params.append(municipio)
+    if depois:
+        where.append("(mu.codigo_municipio, i.codigo) > (%s, %s)")
+        params += [depois[0], depois[1]]
+
+    cols_metricas = ", ".join(f"f.{m}" for m in spec["metricas"])
+    q = f"""
+        SELECT mu.codigo_municipio, mu.nome, i.codigo, i.grupo, i.descricao, {cols_metricas}
+        FROM {spec['tabela']} f
+        JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+        JOIN dim_municipio  mu ON mu.municipio_id  = f.municipio_id
+        JOIN dim_item_cnes   i ON i.item_id        = f.item_id
+        WHERE {' AND '.join(where)}
+        ORDER BY mu.codigo_municipio, i.codigo
+        LIMIT %s
+    """
+    with conn.cursor() as cur:
+        cur.execute(q, params + [limite + 1])
+        linhas = []
+        for r in cur.fetchall():
+            rec = {
+                "codigo_municipio": r[0], "municipio": r[1],
+                "codigo_item": r[2], "grupo_item": r[3], "descricao_item": r[4],
+            }
+            rec.update(dict(zip(spec["metricas"], r[5:])))
+            linhas.append(rec)
+    out = _pagina(linhas, limite, lambda r: [r["codigo_municipio"], r["codigo_item"]])
+    out.update({"dataset": dataset, "vcomp": vcomp})
+    return out
+
+def consultar_siops(conn, qs) -> dict:
+    municipio = _obrigatorio(qs, "municipio")
+    limite = _limite(qs)
+    depois = _decodificar_cursor(qs.get("cursor"), (int, str, int))
+
+    where = ["mu.codigo_municipio = %s"]
+    params = [municipio]
+    if qs.get("ano"):
+        where.append("s.ano = %s")
+        params.append(_inteiro(qs, "ano"))
+    if qs.get("periodo"):
+        where.append("s.periodo = %s")
+        params.append(qs["periodo"])
+    if depois:
+        where.append("(s.ano, s.periodo, s.tabela_idx) > (%s, %s, %s)")
+        params += depois
+
+    q = f"""
+        SELECT s.ano, s.periodo, s.tabela_idx, s.titulo, s.matrix
+        FROM siops_tabelas s
+        JOIN dim_municipio mu ON mu.municipio_id = s.municipio_id
+        WHERE {' AND '.join(where)}
+        ORDER BY s.ano, s.periodo, s.tabela_idx
+        LIMIT %s
+    """
+    with conn.cursor() as cur:
+        cur.execute(q, params + [limite + 1])
+        linhas = [
+            {"ano": a, "periodo": p, "tabela_idx": t, "titulo": tit, "matrix": mx}
+            for a, p, t, tit, mx in cur.fetchall()
+        ]
+    out = _pagina(linhas, limite, lambda r: [r["ano"], r["periodo"], r["tabela_idx"]])
+    out.update({"municipio": municipio})
+    return out
+
+
+# -------------------- roteamento --------------------
+
+def resolver_rota(path: str):
+    """
+    Retorna (dataset_da_versao, funcao(conn, qs)) ou levanta ErroRequisicao(404).
+    """
+    partes = [p for p in path.split("/") if p]
+    if len(partes) == 3 and partes[0] == "cnes":
+        ds, acao = partes[1], partes[2]
+        _dataset_cnes(ds)
+        fn = {"serie": consultar_serie, "ranking": consultar_ranking, "ultimo": consultar_ultimo}.get(acao)
+        if fn is None:
+            raise ErroRequisicao(f"rota desconhecida: {path}", status=404)
+        return ds, (lambda conn, qs: fn(conn, ds, qs))
+    if partes == ["siops", "tabelas"]:
+        return "siops", consultar_siops
+    raise ErroRequisicao(f"rota desconhecida: {path}", status=404)
+
+
+class PainelAPI:
+    """
+    Estado compartilhado do servidor: cache e versões. Conexões vêm do pool do
+    processo (pool_db, etapa "leitura"): o ThreadingHTTPServer abre uma thread
+    por cliente, e o pool limita quantas viram conexão no Postgres.
+    """
+    def __init__(self, cfg: DBConfig):
+        self.cfg = cfg
+        self.cache = CacheRespostas()
+        self.versoes = VersoesDatasets()
+        self._parar = threading.Event()
+
+    def iniciar_ouvinte(self):
+        """
+        Thread daemon que invalida o cache a cada evento de carga.
+        Se a conexão cair, o TTL de versão continua garantindo a invalidação.
+        """
+        def loop():
+            try:
+                for ev in escutar(self.cfg, parar=self._parar.is_set):
+                    self.cache.invalidar(ev.get("dataset"))
+                    self.versoes.expirar()
+            except Exception as e:
+                print(f"[API] ouvinte de eventos encerrado ({e}); seguindo só com TTL.")
+        threading.Thread(target=loop, name="ouvinte-carga", daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
+
+    def responder(self, path: str, qs: dict) -> tuple[int, bytes, str]:
+        """
+        Retorna (status, corpo, origem) onde origem ∈ HIT | MISS | -.
+        """
+        if path.rstrip("/") == "/saude":
+            corpo = {"status": "ok", "cache": self.cache.stats(), "pool": pool(self.cfg).stats()}
+            return 200, json.dumps(corpo).encode("utf-8"), "-"
+
+        dataset, fn = resolver_rota(path)
+        # autocommit: somente leitura; evita transação aberta entre requisições
+        with conexao("leitura", self.cfg, autocommit=True) as conn:
+            versao = self.versoes.atual(conn, dataset)
+            chave = (dataset, path, tuple(sorted(qs.items())))
+
+            corpo = self.cache.get(chave, versao)
+            if corpo is not None:
+                return 200, corpo, "HIT"
+
+            resultado = fn(conn, qs)
+        corpo = json.dumps(resultado, ensure_ascii=False, default=str).encode("utf-8")
+        self.cache.put(chave, versao, corpo)
+        return 200, corpo, "MISS"
+
+
+def criar_handler(api: PainelAPI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # cabeçalho e corpo saem em writes separados
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            qs = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                status, corpo, origem = api.responder(url.path, qs)
+            except ErroRequisicao as e:
+                status, corpo, origem = e.status, json.dumps({"erro": str(e)}, ensure_ascii=False).encode("utf-8"), "-"
+            except Exception as e:
+                status, corpo, origem = 500, json.dumps({"erro": f"falha interna: {e}"}, ensure_ascii=False).encode("utf-8"), "-"
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.send_header("X-Cache", origem)
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, fmt, *args):
+            pass  # silencioso; o load test mede latência do lado do cliente
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description="API local de leitura do painelSaude")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--sem-eventos", action="store_true", help="Não escuta LISTEN/NOTIFY (só TTL de versão)")
+    ap.add_argument("--pool-tamanho", type=int, help="Máximo de conexões ao Postgres (padrão: $DB_POOL_TAMANHO ou 4)")
+    args = ap.parse_args()
+
+    cfg = DBConfig()
+    if args.pool_tamanho:
+        pool(cfg).tamanho = args.pool_tamanho
+    api = PainelAPI(cfg)
+    if not args.sem_eventos:
+        api.iniciar_ouvinte()
+    srv = ThreadingHTTPServer((args.host, args.port), criar_handler(api))
+    print(f"[API] Servindo em http://{args.host}:{args.port} (Ctrl+C para sair)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.parar()
+        srv.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# arquivo_paginas.py
+"""
+Arquivo das páginas brutas do CNES (HTML como veio do servidor, gzip).
+
+Ativado pela variável de ambiente CNES_ARQUIVO_PAGINAS=<dir> (vazio = desligado).
+Layout:
+    <dir>/<dataset>/<vcomp>/<vmun>.html.gz     dataset ∈ leito | equipamento | tipo_unidade
+
+Com as páginas guardadas dá para re-derivar o histórico após mudar um parser
+(reparse_paginas.py) sem voltar ao DATASUS.
+"""
+
+import os
+import gzip
+
+ARQUIVO_DIR = os.getenv("CNES_ARQUIVO_PAGINAS") or None
+
+
+def caminho_pagina(base: str, dataset: str, vmun: str, vcomp: str) -> str:
+    return os.path.join(base, dataset, str(vcomp), f"{vmun}.html.gz")
+
+def arquivar_pagina(dataset: str, vmun: str, vcomp: str, html: str, base: str | None = None) -> str | None:
+    """
+    Grava a página (se o arquivo estiver ativo). Escrita atômica via .tmp + os.replace.
+    Retorna o caminho gravado ou None.
+    """
+    base = base or ARQUIVO_DIR
+    if not base:
+        return None
+    path = caminho_pagina(base, dataset, vmun, vcomp)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(html)
+    os.replace(tmp, path)
+    return path
+
+def ler_pagina(path: str) -> str:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+def iter_paginas(base: str, dataset: str, vcomp_inicio: str | None = None, vcomp_fim: str | None = None):
+    """
+    Gera (vmun, vcomp, caminho) em ordem de vcomp/vmun.
+    """
+    raiz = os.path.join(base, dataset)
+    if not os.path.isdir(raiz):
+        return
+    for vcomp in sorted(os.listdir(raiz)):
+        if not (vcomp.isdigit() and len(vcomp) == 6):
+            continue
+        if vcomp_inicio and vcomp < vcomp_inicio:
+            continue
+        if vcomp_fim and vcomp > vcomp_fim:
+            continue
+        d = os.path.join(raiz, vcomp)
+        for arq in sorted(os.listdir(d)):
+            if arq.endswith(".html.gz"):
+                yield arq[:-len(".html.gz")], vcomp, os.path.join(d, arq)
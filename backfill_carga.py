@@ -0,0 +1,314 @@
+# backfill_carga.py
+"""
+Modo backfill: carga inicial em massa com manutenção de índices adiada.
+
+Numa carga nacional do zero, cada linha que entra em fato_cnes_* / siops_tabelas
+atualiza também os índices secundários (idx_fato_*_mun_comp, BRIN de loaded_at,
+idx_siops_mun_ano e o GIN idx_siops_matrix_gin, o mais caro). Dentro de
+ModoBackfill:
+
+  1. os índices secundários das tabelas alvo (os de INDICES, create_db_and_tables)
+     são removidos — a carga continua pelo caminho de sempre (COPY para staging
+     temporária, sem índices e sem WAL, e um INSERT ... SELECT ... ON CONFLICT);
+  2. a conexão da carga vem do pool na etapa "bulk" (synchronous_commit=off e
+     work_mem maior para o GROUP BY da staging; ver pool_db.ETAPAS);
+  3. no fim (inclusive se a carga falhar) os índices são reconstruídos uma vez,
+     vários ao mesmo tempo em conexões do pool (etapa "indice") e cada B-tree com workers
+     paralelos (max_parallel_maintenance_workers; BRIN paralelo só no PG 17+);
+  O GIN só é adiado no PG 18+, onde o build dele também é paralelo: antes disso,
+  medido aqui (PG 16, 72 mil matrizes), o build serial do zero custa o mesmo que
+  a manutenção incremental (fastupdate já agrupa as inserções) e só alongaria o fim.
+  4. ANALYZE nas tabelas alvo e dimensões, e um resumo dos tempos.
+
+A PK fica: o merge por ON CONFLICT (idempotência, soma de duplicatas entre
+arquivos) depende dela.
+
+Só para carga inicial: com alguma tabela alvo já populada o backfill recusa
+(o painel ficaria sem os índices secundários até o fim), a menos de forcar=True
+(--forcar nos importadores). Exige um pool de ao menos 2 conexões: a carga segura
+uma e os builds dos índices usam as demais.
+
+Segurança: ao entrar, o registro da migração de índices é removido de
+etl_schema_migracao. Se o processo morrer no meio, o próximo
+create_db_and_tables.py reaplica a migração (CREATE INDEX CONCURRENTLY IF NOT
+EXISTS) e os índices voltam sozinhos. O lock de migração fica preso durante o
+backfill, então um main.py em paralelo espera na etapa do schema em vez de
+recriar os índices no meio da carga.
+
+Uso (via importar_offline.py / reparse_paginas.py):
+  python importar_offline.py --backfill saida_cnes/leito saida_siops/siops
+  python reparse_paginas.py --dataset leito --backfill
+  python importar_offline.py --backfill --forcar saida_cnes/leito   # alvo já populado
+
+Ganho sobre o caminho normal, num schema descartável (bench_backfill):
+  python backfill_carga.py --medir --competencias 24 --municipios 300
+"""
+
+import io
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql
+
+from db_config import DBConfig
+from pool_db import conexao, pool
+from create_db_and_tables import INDICES, MIGRACOES, TABELA_MIGRACAO, _LOCK_MIGRACAO, aplicar_migracoes
+
+TABELAS_FATO = ["fato_cnes_leito", "fato_cnes_equipamento", "fato_cnes_tipo_unidade", "siops_tabelas"]
+DIMENSOES = ["dim_municipio", "dim_competencia", "dim_item_cnes"]
+
+PARALELO = 4                    # índices construídos ao mesmo tempo
+WORKERS_POR_INDICE = 2          # max_parallel_maintenance_workers de cada build
+MAINTENANCE_WORK_MEM_MB = 1024  # total, dividido entre os builds simultâneos
+
+_RE_INDICE = re.compile(r"IF NOT EXISTS\s+(\w+)\s+ON\s+(\w+)(?:\s+USING\s+(\w+))?", re.IGNORECASE)
+
+
+def indices_de(tabelas) -> list[tuple[str, str, str, str]]:
+    """(nome, tabela, método, comando) dos índices de INDICES sobre 'tabelas'."""
+    out = []
+    for cmd in INDICES:
+        m = _RE_INDICE.search(cmd)
+        if m and m[2] in tabelas:
+            out.append((m[1], m[2], (m[3] or "btree").lower(), cmd))
+    return out
+
+def _migracao_indices():
+    return next(m for m in MIGRACOES if set(INDICES) <= set(m.comandos))
+
+
+class ModoBackfill:
+    """
+    with conexao("bulk", cfg) as conn, ModoBackfill(conn, cfg, ["fato_cnes_leito"]) as bf:
+        importar_blocos_cnes(conn, ...)
+    print(bf.tempos)
+    """
+
+    def __init__(self, conn, cfg: DBConfig, tabelas=TABELAS_FATO, paralelo: int = PARALELO,
+                 workers_por_indice: int = WORKERS_POR_INDICE,
+                 maintenance_work_mem_mb: int = MAINTENANCE_WORK_MEM_MB,
+                 adiar_gin: bool | None = None, forcar: bool = False):
+        self.conn = conn
+        self.cfg = cfg
+        self.tabelas = list(tabelas)
+        self.forcar = forcar
+        # a conexão da carga já ocupa uma do pool; os builds dividem o resto
+        tamanho = pool(cfg).tamanho
+        if tamanho < 2:
+            raise SystemExit(f"[BACKFILL] pool com {tamanho} conexão: a carga segura uma e os índices "
+                             "precisam de outra (ajuste DB_POOL_TAMANHO >= 2)")
+        self.paralelo = max(1, min(paralelo, tamanho - 1))
+        self.workers_por_indice = workers_por_indice
+        self.maintenance_work_mem_mb = maintenance_work_mem_mb
+        self.indices = indices_de(self.tabelas)
+        self.adiar_gin = adiar_gin  # None: decide pela versão do servidor
+        self.tempos: dict[str, float] = {}
+        self._t0 = None
+        self._search_path = None
+
+    # ---------------- entrada ----------------
+
+    def __enter__(self):
+        conn = self.conn
+        with conn.cursor() as cur:
+            populadas = []
+            for t in self.tabelas:
+                cur.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {})").format(sql.Identifier(t)))
+                if cur.fetchone()[0]:
+                    populadas.append(t)
+            if populadas and not self.forcar:
+                conn.rollback()
+                raise SystemExit(f"[BACKFILL] {', '.join(populadas)} já tem dados: o backfill é para carga "
+                                 "inicial (use --forcar para adiar os índices mesmo assim)")
+            for t in populadas:
+                print(f"[BACKFILL] aviso: {t} já tem dados — consultas ficam sem os índices secundários até o fim")
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (_LOCK_MIGRACAO,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                raise SystemExit("[BACKFILL] migração ou outro backfill em andamento (lock ocupado)")
+            if self.adiar_gin is None:
+                self.adiar_gin = conn.server_version >= 180000
+            if not self.adiar_gin:
+                self.indices = [i for i in self.indices if i[2] != "gin"]
+            # se morrermos no meio, o próximo create_db_and_tables recria os índices
+            cur.execute(f"DELETE FROM {TABELA_MIGRACAO} WHERE versao = %s", (_migracao_indices().versao,))
+            cur.execute(sql.SQL("COMMENT ON TABLE {} IS NULL").format(sql.Identifier(TABELA_MIGRACAO)))
+            for nome, tabela, metodo, _ in self.indices:
+                cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(nome)))
+            cur.execute("SHOW search_path")  # as conexões dos builds enxergam o mesmo schema
+            self._search_path = cur.fetchone()[0]
+        conn.commit()
+        print(f"[BACKFILL] {len(self.indices)} índice(s) adiado(s): {', '.join(n for n, *_ in self.indices)}")
+        self._t0 = time.perf_counter()
+        return self
+
+    # ---------------- saída ----------------
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self.conn
+        self.tempos["carga"] = time.perf_counter() - self._t0
+        conn.rollback()  # importadores já comitaram o que valia; com erro, descarta o resto
+        try:
+            t = time.perf_counter()
+            self.reconstruir_indices()
+            self.tempos["indices"] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            conn.autocommit = True  # ANALYZE fora de transação: um commit por tabela
+            with conn.cursor() as cur:
+                for tab in self.tabelas + DIMENSOES:
+                    cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(tab)))
+            self.tempos["analyze"] = time.perf_counter() - t
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_MIGRACAO,))
+            conn.autocommit = False
+            # re-registra a migração de índices; se algum build falhou, ela recria o que faltar
+            with conexao("padrao", self.cfg, autocommit=True, search_path=self._search_path) as c:
+                aplicar_migracoes(c)
+        self.tempos["total"] = sum(self.tempos[k] for k in ("carga", "indices", "analyze"))
+        print("[BACKFILL] carga {carga:.1f}s + índices {indices:.1f}s + analyze {analyze:.1f}s "
+              "= {total:.1f}s".format(**self.tempos))
+        return False
+
+    def _construir(self, indice) -> tuple[str, float]:
+        nome, _, _, cmd = indice
+        mem = max(64, self.maintenance_work_mem_mb // min(self.paralelo, len(self.indices)))
+        t = time.perf_counter()
+        with conexao("indice", self.cfg, autocommit=True, search_path=self._search_path,
+                     maintenance_work_mem=f"{int(mem)}MB",
+                     max_parallel_maintenance_workers=int(self.workers_por_indice)) as c:
+            with c.cursor() as cur:
+                cur.execute(cmd)
+        return nome, time.perf_counter() - t
+
+    def reconstruir_indices(self):
+        """Um CREATE INDEX (não concorrente) por índice, 'paralelo' de cada vez."""
+        if not self.indices:
+            return
+        ordem = sorted(self.indices, key=lambda i: {"gin": 0, "btree": 1}.get(i[2], 2))  # os mais lentos antes
+        with ThreadPoolExecutor(max_workers=self.paralelo) as ex:
+            for nome, dt in ex.map(self._construir, ordem):
+                print(f"[BACKFILL] índice {nome}: {dt:.1f}s")
+
+
+# ------------------------------ medição ------------------------------
+
+SCHEMA_MEDIR = "bench_backfill"
+
+def _blocos_leito(vcomps, municipios, n_itens, rnd):
+    import pandas as pd
+    for vcomp in vcomps:
+        linhas = [
+            (vcomp, "RR", cod, nome, f"GRUPO {i % 7}", str(i), f"LEITO {i}",
+             rnd.randint(0, 80), rnd.randint(0, 60), rnd.randint(0, 40))
+            for cod, nome in municipios for i in range(1, n_itens + 1)
+        ]
+        yield vcomp, pd.DataFrame(linhas, columns=["VComp", "UF", "Codigo_Municipio", "Municipio", "Grupo",
+                                                    "Codigo", "Descricao", "Existente", "SUS", "Habilitados"])
+
+def _blocos_siops(anos, municipios, n_tabelas, rnd):
+    import pandas as pd
+    for ano in anos:
+        linhas = []
+        for _, nome in municipios:
+            for periodo in ("1º", "2º", "3º", "4º", "5º", "6º"):
+                for idx in range(1, n_tabelas + 1):
+                    matrix = [["RECEITAS", "Previsão", "Realizado", "%"]] + [
+                        [f"Receita {r}", f"{rnd.randint(0, 10**7):,}", f"{rnd.randint(0, 10**7):,}",
+                         f"{rnd.random() * 100:.2f}"] for r in range(25)
+                    ]
+                    linhas.append((nome, ano, periodo, idx, f"Tabela {idx}",
+                                   json.dumps(matrix, ensure_ascii=False)))
+        yield ano, pd.DataFrame(linhas, columns=["municipio", "ano", "periodo", "tabela_idx", "titulo", "matrix"])
+
+def _rodar(cfg, backfill: bool, args) -> float:
+    with conexao("bulk", cfg, search_path=SCHEMA_MEDIR) as conn:
+        return _rodar_em(conn, cfg, backfill, args)
+
+def _rodar_em(conn, cfg, backfill: bool, args) -> float:
+    from db_utils import resolver_municipios
+    from importar_offline import importar_blocos_cnes, importar_blocos_siops
+
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA_MEDIR} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA_MEDIR}")
+    conn.commit()
+    conn.autocommit = True
+    with contextlib.redirect_stdout(io.StringIO()):
+        aplicar_migracoes(conn)
+    conn.autocommit = False
+
+    municipios = [(f"{140000 + i:06d}", f"Municipio Sintetico {i}") for i in range(args.municipios)]
+    resolver_municipios(conn, [(c, "RR", n) for c, n in municipios])
+    conn.commit()
+    vcomps = [f"{2010 + i // 12}{i % 12 + 1:02d}" for i in range(args.competencias)]
+    anos = list(range(2024 - args.anos + 1, 2025))
+
+    # dados gerados antes do cronômetro: a comparação é só do lado do banco
+    leito = list(_blocos_leito(vcomps, municipios, args.itens, random.Random(1)))
+    siops = list(_blocos_siops(anos, municipios, args.tabelas, random.Random(2)))
+
+    t0 = time.perf_counter()
+    bf = (ModoBackfill(conn, cfg, ["fato_cnes_leito", "siops_tabelas"], paralelo=args.paralelo,
+                       adiar_gin=True if args.adiar_gin else None)
+          if backfill else contextlib.nullcontext())
+    with contextlib.redirect_stdout(io.StringIO()) as saida:
+        with bf:
+            # um import por "arquivo" (competência / ano), como numa carga real
+            for vcomp, df in leito:
+                importar_blocos_cnes(conn, [df], "leito", vcomp)
+            for ano, df in siops:
+                importar_blocos_siops(conn, [df], str(ano))
+    dur = time.perf_counter() - t0
+    for linha in saida.getvalue().splitlines():
+        if linha.startswith("[BACKFILL]") and "adiado" not in linha:
+            print("  " + linha)
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT (SELECT count(*) FROM fato_cnes_leito), (SELECT count(*) FROM siops_tabelas)")
+        n_fato, n_siops = cur.fetchone()
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA_MEDIR} CASCADE")
+    conn.commit()
+    print(f"  {'backfill' if backfill else 'normal':8s}: {dur:7.1f}s  "
+          f"(fato_cnes_leito={n_fato}, siops_tabelas={n_siops})")
+    return dur
+
+def medir(args):
+    cfg = DBConfig()
+    n_fato = args.competencias * args.municipios * args.itens
+    n_siops = args.anos * args.municipios * 6 * args.tabelas
+    print(f"[BACKFILL] medindo em {SCHEMA_MEDIR}: {n_fato} linhas de fato_cnes_leito "
+          f"({args.competencias} imports), {n_siops} tabelas SIOPS ({args.anos} imports)")
+    normal = _rodar(cfg, False, args)
+    backfill = _rodar(cfg, True, args)
+    print(f"[BACKFILL] ganho sobre o caminho normal: {normal / backfill:.2f}x "
+          f"({normal:.1f}s -> {backfill:.1f}s)")
+    print(pool(cfg).resumo())
+
+def main():
+    ap = argparse.ArgumentParser(description="Mede o modo backfill (índices adiados) contra o caminho normal")
+    ap.add_argument("--medir", action="store_true", help="Roda normal x backfill num schema descartável")
+    ap.add_argument("--competencias", type=int, default=24)
+    ap.add_argument("--municipios", type=int, default=300)
+    ap.add_argument("--itens", type=int, default=40, help="Tipos de leito por município e competência")
+    ap.add_argument("--anos", type=int, default=2, help="Anos SIOPS (6 períodos cada)")
+    ap.add_argument("--tabelas", type=int, default=10, help="Tabelas SIOPS por município e período")
+    ap.add_argument("--paralelo", type=int, default=PARALELO)
+    ap.add_argument("--adiar-gin", action="store_true", help="Adia o GIN mesmo antes do PG 18")
+    args = ap.parse_args()
+    if not args.medir:
+        ap.print_help()
+        sys.exit(2)
+    medir(args)
+
+if __name__ == "__main__":
+    main()
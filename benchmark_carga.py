@@ -0,0 +1,352 @@
+# benchmark_carga.py
+"""
+Benchmark ponta a ponta da carga CNES: fetch -> parse -> normalização -> load.
+
+Sobe o mock_datasus.py num subprocesso e roda o mesmo caminho dos loaders
+(parsers dos scrape_cnes_*, df_to_rows_fato/dedupe dos cnes_*_to_pg, upsert_dicts)
+contra o Postgres local, num schema descartável (bench_carga) — os dados do
+painel não são tocados. Cada escala roda num processo novo, para o pico de RSS
+ser só dela:
+
+  rr         Roraima (15 municípios)
+  uf_grande  São Paulo (645 municípios)
+  nacional   27 UFs (5.570 municípios)
+
+Mede por escala e dataset: linhas/s, round trips (HTTP e banco, por etapa),
+tempo de cada etapa e pico de RSS. O espaçamento educado do cliente_cnes
+(AIMD, limite global) fica de fora de propósito: aqui o fetch é só transporte.
+Resultados vão para JSON (bench_resultados/) para comparar execuções:
+
+  python benchmark_carga.py --escalas rr,uf_grande
+  python benchmark_carga.py --escalas rr --comparar bench_resultados/carga_20240101_120000.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import resource
+import subprocess
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import psycopg2
+import psycopg2.extensions
+
+ESCALAS = {
+    "rr": [14],
+    "uf_grande": [35],
+    "nacional": None,  # todas as UFs do mock
+}
+SCHEMA = "bench_carga"
+SAIDA_DIR = "bench_resultados"
+
+# -------------------- contadores de round trip --------------------
+
+_rt = {"db": 0, "http": 0}
+_rt_lock = threading.Lock()
+
+def _contar(tipo: str, n: int = 1):
+    with _rt_lock:
+        _rt[tipo] += n
+
+class CursorContado(psycopg2.extensions.cursor):
+    """Cada execute (inclusive as páginas do execute_values) é um round trip."""
+
+    def execute(self, query, vars=None):
+        _contar("db")
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        _contar("db", len(vars_list))
+        return super().executemany(query, vars_list)
+
+def _rss_pico_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # KB no Linux
+
+# -------------------- datasets --------------------
+
+def _datasets() -> dict:
+    import cnes_tipo_leito_to_pg as leito
+    import cnes_equipamentos_to_pg as equip
+    import cnes_tipo_unidade_to_pg as unidade
+    from scrape_cnes_leito import parse_tabela_tipo_leito
+    from scrape_cnes_rr_equipamentos import parse_equipamentos
+    from scrape_cnes_rr_tipo_unidade import parse_tipos_unidade
+    return {
+        "leito": dict(pagina="/Mod_Ind_Tipo_Leito.asp", parse=parse_tabela_tipo_leito,
+                      normalizar=leito.df_to_rows_fato, dedupe=leito.dedupe_leito_batch,
+                      tabela="fato_cnes_leito", update=["existente", "sus", "habilitados"]),
+        "equipamento": dict(pagina="/Mod_Ind_Equipamento.asp", parse=parse_equipamentos,
+                            normalizar=equip.df_to_rows_fato, dedupe=equip.dedupe_equip_batch,
+                            tabela="fato_cnes_equipamento",
+                            update=["existentes", "em_uso", "existentes_sus", "em_uso_sus"]),
+        "tipo_unidade": dict(pagina="/Mod_Ind_Unidade.asp", parse=parse_tipos_unidade,
+                             normalizar=unidade.df_to_rows_fato, dedupe=unidade.dedupe_batch,
+                             tabela="fato_cnes_tipo_unidade", update=["total"]),
+    }
+
+def competencias_ate(vcomp_fim: str, n: int) -> list[str]:
+    a, m = int(vcomp_fim[:4]), int(vcomp_fim[4:])
+    out = []
+    for _ in range(n):
+        out.append(f"{a:04d}{m:02d}")
+        a, m = (a - 1, 12) if m == 1 else (a, m - 1)
+    return out
+
+# -------------------- uma escala (processo filho) --------------------
+
+def preparar_schema(conn):
+    from create_db_and_tables import DDL
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute(DDL)
+    conn.commit()
+
+def rodar_escala(escala: str, base: str, datasets: list[str], competencias: list[str], conc: int) -> dict:
+    from db_config import DBConfig
+    from db_utils import get_conn, upsert_dicts
+    from mock_datasus import UFS
+
+    cfg_ds = _datasets()
+    ufs = ESCALAS[escala] or sorted(UFS)
+    conn = get_conn(DBConfig())
+    conn.cursor_factory = CursorContado
+    preparar_schema(conn)
+    _rt.update(db=0, http=0)
+
+    local = threading.local()
+
+    def _sessao():
+        s = getattr(local, "s", None)
+        if s is None:
+            s = local.s = requests.Session()
+        return s
+
+    def _get(url, params=None):
+        _contar("http")
+        r = _sessao().get(url, params=params, timeout=60)
+        r.raise_for_status()
+        return r
+
+    municipios = {}
+    for uf in ufs:
+        lista = _get(f"{base}/api/v1/localidades/estados/{uf}/municipios").json()
+        municipios[uf] = [{"codigo": str(m["id"])[:6], "nome": m["nome"]} for m in lista]
+    n_mun = sum(len(v) for v in municipios.values())
+    print(f"[BENCH] {escala}: {len(ufs)} UF(s), {n_mun} municípios, {len(competencias)} competência(s), "
+          f"datasets={','.join(datasets)}")
+
+    resultado = {"municipios": n_mun, "ufs": len(ufs), "competencias": competencias, "datasets": {}}
+    t_escala = time.perf_counter()
+    for ds in datasets:
+        d = cfg_ds[ds]
+        st = {"fetch_s": 0.0, "parse_s": 0.0, "normalizar_s": 0.0, "load_s": 0.0,
+              "paginas": 0, "paginas_vazias": 0, "erros_fetch": 0, "erros_parse": 0,
+              "linhas": 0, "http_rt": 0, "db_rt_normalizar": 0, "db_rt_load": 0, "bytes": 0}
+        t_ds = time.perf_counter()
+        for vcomp in competencias:
+            for uf in ufs:
+                sigla = UFS[uf][0]
+                muns = municipios[uf]
+
+                # 1) fetch: só transporte, concorrente
+                def _um(m):
+                    try:
+                        return m, _get(base + d["pagina"], {"VEstado": uf, "VMun": m["codigo"], "VComp": vcomp}).content
+                    except Exception:
+                        return m, None
+                h0, t0 = _rt["http"], time.perf_counter()
+                with ThreadPoolExecutor(max_workers=conc) as ex:
+                    paginas = list(ex.map(_um, muns))
+                st["fetch_s"] += time.perf_counter() - t0
+                st["http_rt"] += _rt["http"] - h0
+
+                # 2) parse (mesmo decode do cliente_cnes)
+                t0 = time.perf_counter()
+                dfs = []
+                for m, corpo in paginas:
+                    if corpo is None:
+                        st["erros_fetch"] += 1
+                        continue
+                    st["paginas"] += 1
+                    st["bytes"] += len(corpo)
+                    try:
+                        df = d["parse"](corpo.decode("latin-1"))
+                    except Exception:
+                        st["erros_parse"] += 1
+                        continue
+                    if df is None or df.empty:
+                        st["paginas_vazias"] += 1
+                        continue
+                    dfs.append((m, df))
+                st["parse_s"] += time.perf_counter() - t0
+                del paginas
+
+                # 3) normalização (FKs via get_or_create_*)
+                r0, t0 = _rt["db"], time.perf_counter()
+                batch = []
+                for m, df in dfs:
+                    batch.extend(d["normalizar"](conn, df, vcomp, m["codigo"], sigla, m["nome"]))
+                st["normalizar_s"] += time.perf_counter() - t0
+                st["db_rt_normalizar"] += _rt["db"] - r0
+                del dfs
+
+                # 4) load: dedupe + upsert + commit, como no loader
+                r0, t0 = _rt["db"], time.perf_counter()
+                if batch:
+                    batch = d["dedupe"](batch)
+                    st["linhas"] += upsert_dicts(conn, table=d["tabela"], rows=batch,
+                                                 pkey_cols=["competencia_id", "municipio_id", "item_id"],
+                                                 update_cols=d["update"])
+                conn.commit()
+                st["load_s"] += time.perf_counter() - t0
+                st["db_rt_load"] += _rt["db"] - r0 + 1  # + commit
+        st["total_s"] = time.perf_counter() - t_ds
+        st["linhas_s"] = st["linhas"] / st["total_s"] if st["total_s"] else 0.0
+        for k in ("fetch_s", "parse_s", "normalizar_s", "load_s", "total_s", "linhas_s"):
+            st[k] = round(st[k], 3)
+        resultado["datasets"][ds] = st
+        print(f"[BENCH] {escala}/{ds}: {st['linhas']} linhas em {st['total_s']:.2f}s ({st['linhas_s']:.0f} linhas/s) | "
+              f"fetch={st['fetch_s']:.2f}s parse={st['parse_s']:.2f}s normalizar={st['normalizar_s']:.2f}s "
+              f"load={st['load_s']:.2f}s | rt http={st['http_rt']} db={st['db_rt_normalizar'] + st['db_rt_load']}")
+
+    total_s = time.perf_counter() - t_escala
+    linhas = sum(s["linhas"] for s in resultado["datasets"].values())
+    resultado.update(total_s=round(total_s, 3), linhas=linhas,
+                     linhas_s=round(linhas / total_s, 1) if total_s else 0.0,
+                     http_rt=_rt["http"], db_rt=_rt["db"], rss_pico_mb=round(_rss_pico_mb(), 1))
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
+    return resultado
+
+# -------------------- orquestração (processo pai) --------------------
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def subir_mock(args) -> tuple[subprocess.Popen, str]:
+    porta = _porta_livre()
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_datasus.py"),
+           "--port", str(porta), "--latencia-ms", str(args.latencia_ms), "--jitter-ms", str(args.latencia_ms / 4),
+           "--ultima", args.vcomp_fim, "--seed", str(args.seed)]
+    if args.municipios_por_uf:
+        cmd += ["--municipios-por-uf", str(args.municipios_por_uf)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{porta}"
+    for _ in range(100):
+        try:
+            requests.get(base + "/_stats", timeout=1)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("[BENCH] mock_datasus.py não subiu")
+
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+def comparar(atual: dict, anterior_path: str):
+    with open(anterior_path, encoding="utf-8") as f:
+        anterior = json.load(f)
+    print(f"[BENCH] comparação com {anterior_path} (commit {anterior.get('commit')})")
+    p_ant, p_atu = anterior.get("parametros", {}), atual["parametros"]
+    difs = [k for k in p_atu if k != "escalas" and p_ant.get(k) != p_atu[k]]
+    if difs:
+        print(f"[WARN] parâmetros diferentes ({', '.join(difs)}): a comparação não é direta")
+    for escala, r in atual["escalas"].items():
+        a = anterior.get("escalas", {}).get(escala)
+        if not a:
+            continue
+        for ds, st in r["datasets"].items():
+            sa = a["datasets"].get(ds)
+            if not sa or not sa["linhas_s"]:
+                continue
+            delta = (st["linhas_s"] / sa["linhas_s"] - 1) * 100
+            print(f"  {escala}/{ds}: {sa['linhas_s']:.0f} -> {st['linhas_s']:.0f} linhas/s ({delta:+.1f}%) | "
+                  f"db rt {sa['db_rt_normalizar'] + sa['db_rt_load']} -> {st['db_rt_normalizar'] + st['db_rt_load']}")
+        print(f"  {escala}: RSS pico {a['rss_pico_mb']} -> {r['rss_pico_mb']} MB")
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark ponta a ponta da carga CNES (mock + Postgres local)")
+    ap.add_argument("--escalas", default="rr", help="rr,uf_grande,nacional")
+    ap.add_argument("--datasets", default="leito,equipamento,tipo_unidade")
+    ap.add_argument("--competencias", type=int, default=1, help="Quantas competências (terminando em --vcomp-fim)")
+    ap.add_argument("--vcomp-fim", default="202401")
+    ap.add_argument("--concorrencia", type=int, default=8, help="Requisições HTTP simultâneas no fetch")
+    ap.add_argument("--latencia-ms", type=float, default=0.0, help="Latência simulada pelo mock")
+    ap.add_argument("--municipios-por-uf", type=int, help="Repassado ao mock (reduz/aumenta a cardinalidade)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--saida", help=f"Arquivo JSON (padrão: {SAIDA_DIR}/carga_<data>.json)")
+    ap.add_argument("--comparar", metavar="JSON", help="Resultado anterior para comparar")
+    ap.add_argument("--_filho", help=argparse.SUPPRESS)  # escala,base,saida (uso interno)
+    args = ap.parse_args()
+
+    datasets = [d.strip() for d in args.datasets.split(",") if d.strip()]
+    competencias = competencias_ate(args.vcomp_fim, args.competencias)
+
+    if args._filho:
+        escala, base, saida = args._filho.split(",", 2)
+        r = rodar_escala(escala, base, datasets, competencias, args.concorrencia)
+        with open(saida, "w", encoding="utf-8") as f:
+            json.dump(r, f)
+        return
+
+    escalas = [e.strip() for e in args.escalas.split(",") if e.strip()]
+    for e in escalas:
+        if e not in ESCALAS:
+            raise SystemExit(f"Escala inválida: {e!r} (use {', '.join(ESCALAS)})")
+
+    proc, base = subir_mock(args)
+    doc = {
+        "inicio": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("_filho", "saida", "comparar")},
+        "escalas": {},
+    }
+    try:
+        for e in escalas:
+            tmp = os.path.join(SAIDA_DIR, f".{e}.{os.getpid()}.json")
+            os.makedirs(SAIDA_DIR, exist_ok=True)
+            cmd = [sys.executable, os.path.abspath(__file__), "--_filho", f"{e},{base},{tmp}",
+                   "--datasets", args.datasets, "--competencias", str(args.competencias),
+                   "--vcomp-fim", args.vcomp_fim, "--concorrencia", str(args.concorrencia)]
+            subprocess.run(cmd, check=True)
+            with open(tmp, encoding="utf-8") as f:
+                doc["escalas"][e] = json.load(f)
+            os.remove(tmp)
+            r = doc["escalas"][e]
+            print(f"[BENCH] {e}: {r['linhas']} linhas em {r['total_s']:.2f}s = {r['linhas_s']:.0f} linhas/s | "
+                  f"rt http={r['http_rt']} db={r['db_rt']} | RSS pico={r['rss_pico_mb']} MB")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    saida = args.saida or os.path.join(SAIDA_DIR, f"carga_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+    print(f"[BENCH] resultado salvo em {saida}")
+    if args.comparar:
+        comparar(doc, args.comparar)
+
+if __name__ == "__main__":
+    main()
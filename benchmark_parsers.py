@@ -0,0 +1,343 @@
+# benchmark_parsers.py
+"""
+Micro-benchmark dos parsers sobre um corpus fixo de páginas (fixtures/paginas).
+
+Parsers medidos:
+  leito         scrape_cnes_leito.parse_tabela_tipo_leito
+  equipamento   scrape_cnes_rr_equipamentos.parse_equipamentos
+  tipo_unidade  scrape_cnes_rr_tipo_unidade.parse_tipos_unidade
+  siops         tabela_siops.table_to_matrix + guess_title_from_table
+                (sobre as tabelas table.tam2.tdExterno, via um adaptador
+                BeautifulSoup com a mesma interface do WebElement do Selenium)
+
+Para cada página: tempo de parse (ms, melhor de N execuções, como o timeit) e
+alocações de um parse sob tracemalloc: pico (KB), o que continua alocado ao fim
+(a saída; KB) e quantos blocos ficam vivos. A saída de cada página vira uma impressão digital (sha1 do
+CSV/matriz); fixtures/paginas/esperado.json guarda as impressões e os tempos
+de referência. O script sai com código 1 se alguma saída mudou ou se um parser
+ficou mais lento que a referência além de --tolerancia, e também se um dataset
+com referência em esperado.json não pôde ser medido (parser que não importa,
+fixtures sumidas) — para deixá-lo de fora de propósito, use --pular. Os tempos são
+normalizados por uma calibração de CPU para a referência valer entre máquinas
+parecidas.
+
+Corpus:
+  fixtures/paginas/<dataset>/<nome>.html.gz   (mesmo formato do arquivo_paginas)
+  - real_<vcomp>_<vmun>: páginas reais copiadas do arquivo (--gravar)
+  - sint_<era>_<vmun>:   variações sintéticas de layout geradas a partir do
+                         mock_datasus.py (--gerar-sinteticas)
+  As sintéticas só cobrem o que o mock sabe imitar; cada dataset precisa de
+  páginas reais de cada era de layout. Dataset sem nenhuma real_* sai com
+  [WARN] no relatório, e com --exigir-reais vira falha.
+
+Uso:
+  python benchmark_parsers.py                       # mede e compara com esperado.json
+  python benchmark_parsers.py --atualizar           # aceita saídas/tempos atuais como referência
+  python benchmark_parsers.py --pular siops         # sem bs4/lxml: mede só os parsers do CNES
+  CNES_ARQUIVO_PAGINAS=paginas python benchmark_parsers.py --gravar leito:140010:201205,equipamento:140010:202401
+  python benchmark_parsers.py --gravar-siops resultado_siops.html   # page_source salvo do Selenium
+"""
+
+import gc
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import hashlib
+import argparse
+import tracemalloc
+import importlib
+
+from arquivo_paginas import ARQUIVO_DIR, caminho_pagina, ler_pagina
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "paginas")
+ESPERADO = os.path.join(FIXTURES_DIR, "esperado.json")
+TOLERANCIA = 0.30  # +30% sobre o tempo de referência (já normalizado pela calibração)
+
+PARSERS = {
+    "leito":        ("scrape_cnes_leito", "parse_tabela_tipo_leito"),
+    "equipamento":  ("scrape_cnes_rr_equipamentos", "parse_equipamentos"),
+    "tipo_unidade": ("scrape_cnes_rr_tipo_unidade", "parse_tipos_unidade"),
+}
+
+# -------------------- adaptador Selenium -> BeautifulSoup --------------------
+
+class ElementoBS:
+    """O pedaço da interface do WebElement que table_to_matrix usa."""
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def find_elements(self, by, xpath: str):
+        if xpath == ".//tr":
+            return [ElementoBS(t) for t in self.tag.find_all("tr")]
+        if xpath == ".//th | .//td":
+            return [ElementoBS(t) for t in self.tag.find_all(["th", "td"])]
+        raise ValueError(f"xpath não suportado pelo adaptador: {xpath}")
+
+    def get_attribute(self, nome: str):
+        if nome == "innerText":
+            return self.tag.get_text(" ", strip=True)
+        v = self.tag.get(nome)
+        return None if v is None else str(v)
+
+def _parser_siops():
+    from bs4 import BeautifulSoup
+    siops = importlib.import_module("tabela_siops")
+
+    def parse(html: str):
+        soup = BeautifulSoup(html, "lxml")
+        out = []
+        for t in soup.select("table.tam2.tdExterno"):
+            matriz = siops.table_to_matrix(ElementoBS(t))
+            out.append((siops.guess_title_from_table(matriz), matriz))
+        return out
+    return parse
+
+def carregar_parsers(datasets) -> tuple[dict, dict]:
+    """({dataset: parser}, {dataset: motivo}) — quem não importa vai para o segundo."""
+    out, indisponiveis = {}, {}
+    for ds in datasets:
+        try:
+            if ds == "siops":
+                out[ds] = _parser_siops()
+            else:
+                mod, nome = PARSERS[ds]
+                out[ds] = getattr(importlib.import_module(mod), nome)
+        except Exception as e:
+            indisponiveis[ds] = f"parser indisponível ({type(e).__name__}: {e})"
+    return out, indisponiveis
+
+# -------------------- medição --------------------
+
+def impressao(saida) -> str:
+    """sha1 estável da saída do parser (DataFrame, None ou lista de matrizes)."""
+    if saida is None:
+        txt = "None"
+    elif hasattr(saida, "to_csv"):
+        txt = saida.to_csv(index=False) + "|" + ",".join(map(str, saida.dtypes))
+    else:
+        txt = json.dumps(saida, ensure_ascii=False)
+    return hashlib.sha1(txt.encode("utf-8")).hexdigest()
+
+def calibrar() -> float:
+    """ms de uma carga fixa em Python puro (regex + dict), para normalizar tempos entre máquinas."""
+    amostras = []
+    texto = "Codigo Descrição Existente SUS 01 CIRURGIA GERAL 1.234 567 " * 200
+    for _ in range(8):
+        t0 = time.perf_counter()
+        for _ in range(20):
+            d = {}
+            for tok in re.findall(r"\w+", texto):
+                d[tok] = d.get(tok, 0) + 1
+        amostras.append((time.perf_counter() - t0) * 1000)
+    return min(amostras[1:])  # a 1ª é aquecimento
+
+def medir(fn, html: str, repeticoes: int) -> dict:
+    """
+    {'sha1', 'ms', 'pico_kb', 'retido_kb', 'blocos'} de uma página. 'ms' é o
+    melhor de 'repeticoes' (o mínimo é o menos sensível a ruído do sistema);
+    a memória vem de um parse sob tracemalloc: pico, o que continua alocado
+    enquanto a saída está viva e em quantos blocos.
+    """
+    saida = fn(html)  # aquecimento (imports preguiçosos, caches do lxml)
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn(html)
+        tempos.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    retida = fn(html)
+    gc.collect()  # árvores de bs4/lxml têm ciclos: o que sobrar é a saída
+    atual, pico = tracemalloc.get_traced_memory()
+    snap = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    tracemalloc.stop()
+    blocos = sum(st.count for st in snap.statistics("filename"))
+    del retida
+    return {"sha1": impressao(saida), "ms": round(min(tempos), 3), "pico_kb": round(pico / 1024, 1),
+            "retido_kb": round(atual / 1024, 1), "blocos": blocos}
+
+def fixtures(dataset: str) -> list[tuple[str, str]]:
+    d = os.path.join(FIXTURES_DIR, dataset)
+    if not os.path.isdir(d):
+        return []
+    return [(a[:-len(".html.gz")], os.path.join(d, a)) for a in sorted(os.listdir(d)) if a.endswith(".html.gz")]
+
+# -------------------- corpus --------------------
+
+def _gravar_fixture(dataset: str, nome: str, html: str) -> str:
+    path = os.path.join(FIXTURES_DIR, dataset, f"{nome}.html.gz")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # mtime=0: o mesmo conteúdo gera o mesmo .gz (diffs limpos no git)
+    with open(path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=9, mtime=0) as f:
+        f.write(html.encode("utf-8"))
+    return path
+
+def gravar_do_arquivo(especs: str, base: str | None):
+    base = base or ARQUIVO_DIR
+    if not base:
+        raise SystemExit("Defina CNES_ARQUIVO_PAGINAS (ou --dir) com o arquivo de páginas reais")
+    for spec in especs.split(","):
+        dataset, vmun, vcomp = spec.strip().split(":")
+        html = ler_pagina(caminho_pagina(base, dataset, vmun, vcomp))
+        print(f"[FIXTURE] {_gravar_fixture(dataset, f'real_{vcomp}_{vmun}', html)}")
+
+def _milhar(n: str) -> str:
+    return n if len(n) <= 3 else f"{int(n):,}".replace(",", ".")
+
+def _era_antiga(html: str) -> str:
+    # layout antigo do cnes2: tags em maiúsculas, números dentro de <FONT>,
+    # separador de milhar e cabeçalhos quebrados com <BR>
+    html = re.sub(r"<td>(\d+)</td>", lambda m: f"<TD><FONT face='Verdana' size='1'>{_milhar(m[1])}</FONT></TD>", html)
+    html = re.sub(r"<td align='right'>(\d+)</td>", lambda m: f"<TD ALIGN=RIGHT>&nbsp;{_milhar(m[1])}&nbsp;</TD>", html)
+    html = (html.replace("<b>Existente</b>", "<b>Quantidade<br>Existente</b>")
+                .replace("<td>Existentes SUS</td>", "<td>Existentes<br>SUS</td>")
+                .replace("<td>Em Uso SUS</td>", "<td>Em Uso<br>SUS</td>"))
+    return re.sub(r"<(/?)(table|tbody|tr|td|b|a|p)\b", lambda m: f"<{m[1]}{m[2].upper()}", html)
+
+def gerar_sinteticas():
+    import mock_datasus as mock
+    eras = {"atual": lambda h: h, "antiga": _era_antiga}
+    # capital (tabela cheia), município pequeno (poucos itens)
+    for ds in PARSERS:
+        for vmun in ("140010", "140070"):
+            for era, f in eras.items():
+                html = f(mock.pagina_cnes(ds, 14, vmun, "202401", seed=7, ultima="202401"))
+                print(f"[FIXTURE] {_gravar_fixture(ds, f'sint_{era}_{vmun}', html)}")
+        html = mock.pagina_cnes(ds, 14, "140010", "209912", seed=7, ultima="202401")
+        print(f"[FIXTURE] {_gravar_fixture(ds, 'sint_sem_dados_140010', html)}")
+    for mun, ano, per in (("BOA VISTA", "2023", "6º Bimestre"), ("UIRAMUTÃ", "2012", "3º Bimestre")):
+        html = mock.pagina_siops_resultado(mun, ano, per, seed=7)
+        nome = f"sint_{ano}_{re.sub(r'[^a-z]', '', mun.lower().replace('ã', 'a'))}"
+        print(f"[FIXTURE] {_gravar_fixture('siops', nome, html)}")
+
+# -------------------- execução --------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmark dos parsers CNES/SIOPS sobre fixtures gravadas")
+    ap.add_argument("--datasets", default="leito,equipamento,tipo_unidade,siops")
+    ap.add_argument("--pular", default="", metavar="DS,...",
+                    help="Datasets deixados de fora de propósito (ex.: siops sem bs4); os demais têm de ser medidos")
+    ap.add_argument("--repeticoes", type=int, default=15, help="Execuções por página (vale a melhor)")
+    ap.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Lentidão aceita sobre a referência (0.30 = +30%%)")
+    ap.add_argument("--atualizar", action="store_true", help="Grava saídas e tempos atuais em esperado.json")
+    ap.add_argument("--saida", help="Também grava o resultado completo neste JSON")
+    ap.add_argument("--exigir-reais", action="store_true",
+                    help="Falha se algum dataset medido não tiver fixture real_* (só sintéticas)")
+    ap.add_argument("--gravar", metavar="DS:VMUN:VCOMP,...", help="Copia páginas reais do arquivo para as fixtures")
+    ap.add_argument("--dir", help="Arquivo de páginas (padrão: CNES_ARQUIVO_PAGINAS)")
+    ap.add_argument("--gravar-siops", metavar="HTML", help="Adiciona um resultado SIOPS salvo (page_source)")
+    ap.add_argument("--gerar-sinteticas", action="store_true", help="(Re)gera as fixtures sintéticas a partir do mock")
+    args = ap.parse_args()
+
+    if args.gravar or args.gravar_siops or args.gerar_sinteticas:
+        if args.gravar:
+            gravar_do_arquivo(args.gravar, args.dir)
+        if args.gravar_siops:
+            with open(args.gravar_siops, encoding="utf-8", errors="replace") as f:
+                nome = "real_" + re.sub(r"\W+", "_", os.path.splitext(os.path.basename(args.gravar_siops))[0])
+                print(f"[FIXTURE] {_gravar_fixture('siops', nome, f.read())}")
+        if args.gerar_sinteticas:
+            gerar_sinteticas()
+        print("[FIXTURE] rode com --atualizar para registrar as saídas esperadas")
+        return
+
+    esperado = {}
+    if os.path.exists(ESPERADO):
+        with open(ESPERADO, encoding="utf-8") as f:
+            esperado = json.load(f)
+    ref_calib = esperado.get("calibracao_ms")
+    calib = calibrar()
+    fator = (ref_calib / calib) if ref_calib else 1.0  # >1: máquina atual mais rápida que a da referência
+    print(f"[PARSE] calibração {calib:.2f} ms (referência {ref_calib or '-'}; fator {fator:.2f})")
+
+    pular = {d.strip() for d in args.pular.split(",") if d.strip()}
+    datasets = [d.strip() for d in args.datasets.split(",") if d.strip() and d.strip() not in pular]
+    desconhecidos = [d for d in datasets if d != "siops" and d not in PARSERS]
+    if desconhecidos:
+        raise SystemExit(f"Dataset desconhecido: {', '.join(desconhecidos)}")
+    parsers, nao_medidos = carregar_parsers(datasets)
+    for ds in pular:
+        print(f"[WARN] {ds}: pulado (--pular)")
+    resultado = {"calibracao_ms": round(calib, 3), "parsers": {}, "paginas": {}}
+    falhas = []
+    for ds, fn in parsers.items():
+        arquivos = fixtures(ds)
+        if not arquivos:
+            nao_medidos[ds] = f"sem fixtures em {os.path.join(FIXTURES_DIR, ds)}"
+            continue
+        reais = [n for n, _ in arquivos if n.startswith("real_")]
+        if not reais:
+            aviso = f"{ds}: só fixtures sintéticas; grave páginas reais de cada era com --gravar"
+            if args.exigir_reais:
+                falhas.append(aviso)
+            else:
+                print(f"[WARN] {aviso}")
+        tempos, picos, blocos = [], [], []
+        for nome, path in arquivos:
+            chave = f"{ds}/{nome}"
+            med = medir(fn, ler_pagina(path), args.repeticoes)
+            tempos.append(med["ms"])
+            picos.append(med["pico_kb"])
+            blocos.append(med["blocos"])
+            resultado["paginas"][chave] = med
+            ref = esperado.get("paginas", {}).get(chave)
+            marca = ""
+            if ref and ref["sha1"] != med["sha1"]:
+                falhas.append(f"{chave}: saída mudou")
+                marca = "  <-- SAÍDA MUDOU"
+            elif not ref:
+                marca = "  (nova)"
+            print(f"  {chave:42s} {med['ms']:8.2f} ms  pico {med['pico_kb']:8.1f} KB  "
+                  f"retido {med['retido_kb']:7.1f} KB  {med['blocos']:6d} blocos{marca}")
+        total = sum(tempos)
+        resultado["parsers"][ds] = {"ms_pagina": round(total / len(tempos), 3), "paginas": len(tempos),
+                                    "pico_kb_pagina": round(sum(picos) / len(picos), 1),
+                                    "blocos_pagina": round(sum(blocos) / len(blocos)),
+                                    "reais": len(reais)}
+        ref = esperado.get("parsers", {}).get(ds)
+        linha = (f"[PARSE] {ds}: {total / len(tempos):.2f} ms/página, pico {sum(picos) / len(picos):.1f} KB/página, "
+                 f"{sum(blocos) / len(blocos):.0f} blocos/página ({len(tempos)} páginas, {len(reais)} reais)")
+        if ref:
+            # só compara se o conjunto de páginas é o mesmo da referência
+            ref_pag = sorted(k for k in esperado.get("paginas", {}) if k.startswith(ds + "/"))
+            atu_pag = sorted(f"{ds}/{n}" for n, _ in arquivos)
+            if ref_pag == atu_pag:
+                norm = (total / len(tempos)) * fator
+                delta = norm / ref["ms_pagina"] - 1
+                linha += f" | referência {ref['ms_pagina']:.2f} ms ({delta:+.0%} normalizado)"
+                if ref.get("pico_kb_pagina"):
+                    linha += f", pico {sum(picos) / len(picos) / ref['pico_kb_pagina'] - 1:+.0%}"
+                if delta > args.tolerancia:
+                    falhas.append(f"{ds}: {delta:+.0%} mais lento que a referência (tolerância {args.tolerancia:.0%})")
+            else:
+                linha += " | conjunto de fixtures mudou: rode --atualizar"
+        print(linha)
+
+    # um portão de regressão não pode passar aberto: dataset com referência
+    # que não foi medido é falha, a menos que tenha sido pulado de propósito
+    com_referencia = {k.split("/", 1)[0] for k in esperado.get("paginas", {})} | set(esperado.get("parsers", {}))
+    for ds, motivo in nao_medidos.items():
+        if ds in com_referencia:
+            falhas.append(f"{ds}: não medido, {motivo} (use --pular {ds} para deixá-lo de fora)")
+        else:
+            print(f"[WARN] {ds}: {motivo} — pulando")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+    if args.atualizar:
+        with open(ESPERADO, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"[PARSE] referência atualizada em {ESPERADO}")
+        return
+    if falhas:
+        print("[FALHA] " + "\n[FALHA] ".join(falhas))
+        sys.exit(1)
+    print("[PARSE] OK: saídas idênticas e sem regressão de tempo")
+
+if __name__ == "__main__":
+    main()
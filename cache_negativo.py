@@ -0,0 +1,108 @@
+# cache_negativo.py
+"""
+Cache negativo de células (dataset, município, competência) confirmadamente vazias.
+
+Uma célula só entra aqui quando a página veio com sucesso e sem dados (fetch_*
+devolve DataFrame vazio); falhas de rede/parse não são registradas.
+
+Política de expiração:
+  - competências com mais de PERMANENTE_APOS_MESES meses: vazio é definitivo;
+  - competências recentes: vazio vale por RECHECAR_DIAS dias e depois é revisto
+    (o CNES ainda revisa os últimos meses).
+
+Uso no loader:
+    neg = CacheNegativo(conn, "leito")
+    if neg.vazio(cod, vcomp): pula
+    ...
+    neg.registrar(cod, vcomp)      # página OK sem dados
+    neg.remover(cod, vcomp)        # página com dados (no-op se a célula não está na tabela)
+    gravar_com_retentativa(conn, ..., pendencias=(neg,))   # db_utils: flush + commit + limpar
+"""
+
+from datetime import date
+
+PERMANENTE_APOS_MESES = 12
+RECHECAR_DIAS = 7
+
+
+def _vcomp_corte(hoje: date | None = None) -> str:
+    hoje = hoje or date.today()
+    m = hoje.year * 12 + (hoje.month - 1) - PERMANENTE_APOS_MESES
+    return f"{m // 12:04d}{m % 12 + 1:02d}"
+
+
+class CacheNegativo:
+    def __init__(self, conn, dataset: str):
+        self.dataset = dataset
+        self._vazios = set()
+        self._gravados = set()  # tudo que está em etl_celula_vazia, vencido ou não
+        self._novos = set()
+        self._remover = set()
+        self.pulos = 0
+        self._carregar(conn)
+
+    def _carregar(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT codigo_municipio, vcomp,
+                       vcomp < %s OR verificado_em > NOW() - make_interval(days => %s)
+                FROM etl_celula_vazia
+                WHERE dataset = %s
+            """, (_vcomp_corte(), RECHECAR_DIAS, self.dataset))
+            linhas = cur.fetchall()
+        self._gravados = {(c, v) for c, v, _ in linhas}
+        self._vazios = {(c, v) for c, v, valido in linhas if valido}
+
+    def vazio(self, codigo_municipio: str, vcomp: str) -> bool:
+        if (codigo_municipio, vcomp) in self._vazios:
+            self.pulos += 1
+            return True
+        return False
+
+    def registrar(self, codigo_municipio: str, vcomp: str):
+        k = (codigo_municipio, vcomp)
+        self._vazios.add(k)
+        self._gravados.add(k)
+        self._novos.add(k)
+        self._remover.discard(k)
+
+    def remover(self, codigo_municipio: str, vcomp: str):
+        """
+        A célula veio com dados: some do cache. Chamado para toda página com dados —
+        um vazio recente vencido (rechecado) que ficasse na tabela viraria permanente
+        quando a competência passasse de PERMANENTE_APOS_MESES.
+        """
+        k = (codigo_municipio, vcomp)
+        if k not in self._gravados:
+            return
+        self._vazios.discard(k)
+        self._gravados.discard(k)
+        self._novos.discard(k)
+        self._remover.add(k)
+
+    def flush(self, conn) -> int:
+        """
+        Grava pendências na transação corrente de 'conn' (o commit fica com o chamador).
+        Ficam na fila até limpar(), chamado depois do commit.
+        """
+        n = len(self._novos) + len(self._remover)
+        if not n:
+            return 0
+        with conn.cursor() as cur:
+            if self._novos:
+                cur.executemany("""
+                    INSERT INTO etl_celula_vazia (dataset, codigo_municipio, vcomp)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (dataset, codigo_municipio, vcomp)
+                    DO UPDATE SET verificado_em = NOW()
+                """, [(self.dataset, c, v) for c, v in sorted(self._novos)])
+            if self._remover:
+                cur.executemany(
+                    "DELETE FROM etl_celula_vazia WHERE dataset=%s AND codigo_municipio=%s AND vcomp=%s",
+                    [(self.dataset, c, v) for c, v in sorted(self._remover)]
+                )
+        return n
+
+    def limpar(self):
+        self._novos.clear()
+        self._remover.clear()
@@ -0,0 +1,230 @@
+# change_feed.py
+"""
+Extração incremental ("o que mudou desde T") por watermark de loaded_at.
+
+Cada consumidor tem um cursor persistido em etl_change_cursor(consumidor, dataset).
+Uma execução lê as linhas com  watermark <= loaded_at < limite  e, só depois de
+entregar tudo, grava  watermark = limite.
+
+O 'limite' é o menor entre NOW() e o início da transação mais antiga ainda aberta
+no banco: uma carga que começou antes (loaded_at = NOW() do início dela) mas ainda
+não fez commit teria linhas "no passado" quando aparecer. Com esse corte ela cai
+inteira na próxima janela e nada se perde.
+
+Permissão: o usuário do feed precisa enxergar o xact_start das sessões de outros
+roles no pg_stat_activity — superusuário ou membro de pg_read_all_stats:
+    GRANT pg_read_all_stats TO <usuario_do_feed>;
+Sem isso o Postgres devolve essas colunas como NULL e o corte ignoraria cargas
+abertas; limite_seguro() então recusa (RuntimeError) em vez de pular linhas.
+
+Remoções: o --refresh apaga itens que saíram da página e deixa uma lápide em
+etl_remocao (removido_em = NOW() da transação, mesma regra do loaded_at). O feed
+mescla as lápides às linhas, em ordem de tempo: cada linha traz
+operacao = "upsert" | "remocao"; numa remoção só as colunas de chave vêm
+preenchidas e loaded_at é o instante da remoção.
+
+API:
+    with get_conn(cfg) as conn:
+        for linha in ler_alteracoes(conn, "leito", desde, ate): ...
+    feed = FeedAlteracoes(conn, "nightly", "leito")
+    for linha in feed.linhas(): ...
+    feed.confirmar()
+
+CLI:
+    python change_feed.py --consumidor nightly --dataset leito [--formato jsonl|csv] [--saida arq]
+    python change_feed.py --consumidor nightly --dataset siops --desde 2025-01-01T00:00:00Z --sem-confirmar
+"""
+
+import csv
+import sys
+import json
+import argparse
+from datetime import datetime
+
+from db_config import DBConfig
+from db_utils import get_conn
+
+DATASETS_FEED = {
+    "leito": {
+        "view": "vw_cnes_leito",
+        "tabela": "fato_cnes_leito",
+        "colunas": ["vcomp", "codigo_municipio", "municipio_nome", "uf", "codigo_item", "grupo_item",
+                    "descricao_item", "existente", "sus", "habilitados", "loaded_at"],
+    },
+    "equipamento": {
+        "view": "vw_cnes_equipamento",
+        "tabela": "fato_cnes_equipamento",
+        "colunas": ["vcomp", "codigo_municipio", "municipio_nome", "uf", "codigo_item", "grupo_item",
+                    "descricao_item", "existentes", "em_uso", "existentes_sus", "em_uso_sus", "loaded_at"],
+    },
+    "tipo_unidade": {
+        "view": "vw_cnes_tipo_unidade",
+        "tabela": "fato_cnes_tipo_unidade",
+        "colunas": ["vcomp", "codigo_municipio", "municipio_nome", "uf", "codigo_item", "grupo_item",
+                    "descricao_item", "total", "loaded_at"],
+    },
+    "siops": {
+        "view": "vw_siops_tabelas",
+        "colunas": ["codigo_municipio", "municipio_nome", "uf", "ano", "periodo", "tabela_idx",
+                    "titulo", "matrix", "loaded_at"],
+    },
+}
+
+# colunas que uma lápide preenche (as demais vão NULL); o SIOPS não tem remoção
+SQL_REMOCAO = {
+    "vcomp": "c.vcomp", "codigo_municipio": "m.codigo_municipio", "municipio_nome": "m.nome", "uf": "m.uf",
+    "codigo_item": "i.codigo", "grupo_item": "i.grupo", "descricao_item": "i.descricao",
+}
+
+ITENS_POR_FETCH = 5000  # tamanho do lote do cursor server-side
+
+def _spec(dataset: str) -> dict:
+    spec = DATASETS_FEED.get(dataset)
+    if spec is None:
+        raise ValueError(f"dataset desconhecido: {dataset} (opções: {', '.join(DATASETS_FEED)})")
+    return spec
+
+def limite_seguro(conn) -> datetime:
+    """
+    LEAST(NOW(), início da transação aberta mais antiga de outra sessão neste banco).
+
+    Não dá para usar pg_snapshot_xmin(pg_current_snapshot()): a transação só ganha
+    xid na primeira escrita, mas o loaded_at é o NOW() do início dela, e um xid
+    não tem instante. Daí o pg_stat_activity, que exige pg_read_all_stats.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT LEAST(NOW(), MIN(xact_start)),
+                   pg_has_role('pg_read_all_stats', 'MEMBER'),
+                   COUNT(*) FILTER (WHERE state IS NULL AND xact_start IS NULL)
+            FROM pg_stat_activity
+            WHERE datname = current_database()
+              AND pid <> pg_backend_pid()
+        """)
+        limite, ve_tudo, ocultas = cur.fetchone()
+    if not ve_tudo and ocultas:
+        raise RuntimeError(
+            f"change feed: {ocultas} sessão(ões) de outros roles sem xact_start visível; "
+            "o limite seguro não pode ser calculado (GRANT pg_read_all_stats TO o usuário do feed)"
+        )
+    return limite
+
+def ler_alteracoes(conn, dataset: str, desde: datetime | None, ate: datetime):
+    """
+    Gera dicts das linhas (e lápides) com desde <= loaded_at < ate, em ordem de
+    loaded_at; cada dict traz também "operacao".
+    Usa cursor nomeado (server-side): memória constante mesmo em deltas grandes.
+    """
+    spec = _spec(dataset)
+    cols = spec["colunas"]
+    where = ["loaded_at < %s"]
+    params = [ate]
+    if desde is not None:
+        where.insert(0, "loaded_at >= %s")
+        params.insert(0, desde)
+    q = f"SELECT {', '.join(cols)}, 'upsert' AS operacao FROM {spec['view']} WHERE {' AND '.join(where)}"
+    if spec.get("tabela"):
+        sel = [SQL_REMOCAO[c] if c in SQL_REMOCAO else ("r.removido_em" if c == "loaded_at" else "NULL")
+               for c in cols]
+        q += f"""
+            UNION ALL
+            SELECT {', '.join(sel)}, 'remocao'
+            FROM etl_remocao r
+            JOIN dim_competencia c ON c.competencia_id = r.competencia_id
+            JOIN dim_municipio m ON m.municipio_id = r.municipio_id
+            JOIN dim_item_cnes i ON i.item_id = r.item_id
+            WHERE r.tabela = %s AND {' AND '.join(w.replace('loaded_at', 'r.removido_em') for w in where)}"""
+        params += [spec["tabela"]] + params
+    q += " ORDER BY loaded_at"
+    with conn.cursor(name=f"feed_{dataset}") as cur:
+        cur.itersize = ITENS_POR_FETCH
+        cur.execute(q, params)
+        for r in cur:
+            yield dict(zip(cols + ["operacao"], r))
+
+
+class FeedAlteracoes:
+    """
+    Janela [watermark do consumidor, limite_seguro) de um dataset.
+    confirmar() persiste o novo watermark (chame só depois de processar tudo).
+    """
+    def __init__(self, conn, consumidor: str, dataset: str, desde: datetime | None = None):
+        _spec(dataset)
+        self.conn = conn
+        self.consumidor = consumidor
+        self.dataset = dataset
+        self.desde = desde if desde is not None else self._watermark()
+        self.ate = limite_seguro(conn)
+        self.total = 0
+
+    def _watermark(self) -> datetime | None:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT watermark FROM etl_change_cursor WHERE consumidor=%s AND dataset=%s",
+                (self.consumidor, self.dataset)
+            )
+            r = cur.fetchone()
+            return r[0] if r else None
+
+    def linhas(self):
+        for linha in ler_alteracoes(self.conn, self.dataset, self.desde, self.ate):
+            self.total += 1
+            yield linha
+
+    def confirmar(self):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO etl_change_cursor (consumidor, dataset, watermark)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (consumidor, dataset)
+                DO UPDATE SET watermark=EXCLUDED.watermark, atualizado_em=NOW()
+            """, (self.consumidor, self.dataset, self.ate))
+        self.conn.commit()
+
+
+def _serializar(v):
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+def _json_default(v):
+    return v.isoformat() if isinstance(v, datetime) else str(v)
+
+def main():
+    ap = argparse.ArgumentParser(description="Change feed incremental por loaded_at")
+    ap.add_argument("--consumidor", required=True, help="Nome do consumidor (cursor persistido por consumidor+dataset)")
+    ap.add_argument("--dataset", required=True, choices=sorted(DATASETS_FEED))
+    ap.add_argument("--formato", choices=["jsonl", "csv"], default="jsonl")
+    ap.add_argument("--saida", help="Arquivo de saída (padrão: stdout)")
+    ap.add_argument("--desde", help="Ignora o cursor salvo e começa deste instante (ISO 8601)")
+    ap.add_argument("--sem-confirmar", action="store_true", help="Não avança o watermark do consumidor")
+    args = ap.parse_args()
+
+    desde = datetime.fromisoformat(args.desde.replace("Z", "+00:00")) if args.desde else None
+    out = open(args.saida, "w", newline="", encoding="utf-8") if args.saida else sys.stdout
+    try:
+        with get_conn(DBConfig()) as conn:
+            feed = FeedAlteracoes(conn, args.consumidor, args.dataset, desde=desde)
+            cols = DATASETS_FEED[args.dataset]["colunas"] + ["operacao"]
+            writer = csv.writer(out) if args.formato == "csv" else None
+            if writer:
+                writer.writerow(cols)
+            for linha in feed.linhas():
+                if writer:
+                    writer.writerow([
+                        json.dumps(linha[c], ensure_ascii=False) if c == "matrix" else _serializar(linha[c])
+                        for c in cols
+                    ])
+                else:
+                    out.write(json.dumps(linha, ensure_ascii=False, default=_json_default) + "\n")
+            out.flush()
+            if not args.sem_confirmar:
+                feed.confirmar()
+            print(f"[FEED] {args.consumidor}/{args.dataset}: {feed.total} linha(s) "
+                  f"[{feed.desde} .. {feed.ate})", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# checkpoint_carga.py
+"""
+Execuções com prazo (--max-runtime) e checkpoint durável por competência.
+
+- Prazo: a partir de prazo - margem nenhuma célula nova é buscada; as
+  requisições em voo terminam, o lote é gravado e o loader encerra. SIGTERM
+  (ex.: timeout do cron) tem o mesmo efeito. A margem é MARGEM_PRAZO_S, limitada
+  a FRACAO_MARGEM do prazo: um --max-runtime curto (ou o restante que o main.py
+  repassa) não expira antes de começar.
+- Checkpoint (etl_checkpoint): para a competência interrompida, guarda os
+  municípios já tratados (com dados, vazios ou com falha registrada). Gravado na
+  mesma transação do lote: ou os dois entram, ou nenhum. A próxima execução
+  retoma só o que falta nessa competência (ignora o "já existe no banco") e
+  apaga o checkpoint ao concluí-la — nada é perdido nem buscado de novo.
+"""
+
+import time
+import signal
+
+MARGEM_PRAZO_S = 30
+FRACAO_MARGEM = 0.1  # a margem nunca passa de 10% do prazo
+
+
+class Prazo:
+    def __init__(self, max_runtime_s: float | None, margem_s: float = MARGEM_PRAZO_S):
+        self.limite = None
+        self.interrompido = False
+        if max_runtime_s is None:
+            return
+        if max_runtime_s <= 0:
+            raise SystemExit(f"[PRAZO] --max-runtime deve ser positivo (recebido {max_runtime_s:g})")
+        margem = min(margem_s, FRACAO_MARGEM * max_runtime_s)
+        if margem < margem_s:
+            print(f"[PRAZO] --max-runtime {max_runtime_s:g}s menor que {margem_s / FRACAO_MARGEM:g}s: "
+                  f"margem reduzida de {margem_s:g}s para {margem:.1f}s (o lote em voo pode estourar o prazo)")
+        self.limite = time.monotonic() + max_runtime_s - margem
+
+    def instalar_sigterm(self):
+        def _h(signum, frame):
+            if not self.interrompido:
+                print("[PRAZO] SIGTERM recebido: finalizando o lote corrente")
+            self.interrompido = True
+        signal.signal(signal.SIGTERM, _h)
+
+    def esgotado(self) -> bool:
+        return self.interrompido or (self.limite is not None and time.monotonic() >= self.limite)
+
+
+class Checkpoint:
+    def __init__(self, conn, dataset: str):
+        self.dataset = dataset
+        with conn.cursor() as cur:
+            cur.execute("SELECT vcomp, concluidos FROM etl_checkpoint WHERE dataset = %s", (dataset,))
+            self.parciais = {v: set(c) for v, c in cur.fetchall()}
+        self._pendente = {}  # vcomp -> set (salvar) | None (limpar)
+
+    def concluidos(self, vcomp: str) -> set[str] | None:
+        """Municípios já tratados numa competência interrompida (None = sem checkpoint)."""
+        return self.parciais.get(vcomp)
+
+    def registrar(self, vcomp: str, tratados, completo: bool):
+        if completo:
+            if vcomp in self.parciais:
+                del self.parciais[vcomp]
+                self._pendente[vcomp] = None
+            return
+        feitos = self.parciais.setdefault(vcomp, set())
+        feitos.update(tratados)
+        self._pendente[vcomp] = set(feitos)
+
+    def flush(self, conn):
+        """Grava na transação corrente (commit com o chamador); limpar() depois do commit."""
+        with conn.cursor() as cur:
+            for vcomp, feitos in sorted(self._pendente.items()):
+                if feitos is None:
+                    cur.execute("DELETE FROM etl_checkpoint WHERE dataset=%s AND vcomp=%s", (self.dataset, vcomp))
+                else:
+                    cur.execute("""
+                        INSERT INTO etl_checkpoint (dataset, vcomp, concluidos)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (dataset, vcomp)
+                        DO UPDATE SET concluidos = EXCLUDED.concluidos, atualizado_em = NOW()
+                    """, (self.dataset, vcomp, sorted(feitos)))
+
+    def limpar(self):
+        self._pendente.clear()
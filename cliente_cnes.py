@@ -0,0 +1,421 @@
+# cliente_cnes.py
+"""
+Camada de fetch compartilhada pelos scrapers CNES (leito, equipamento, tipo_unidade).
+
+Política de retry:
+  - transitório (conexão/timeout, HTTP 5xx, 429): nova tentativa com backoff
+    exponencial com jitter ("full jitter": uniform(0, min(teto, base * 2**n)));
+  - permanente (HTTP 4xx, falha no parse): sem retry; loga UMA vez e guarda a
+    página bruta em FALHAS_DIR para inspeção (o mesmo layout do arquivo_paginas);
+    página sem tabela reconhecida e sem o aviso de "sem dados" do CNES também é
+    falha de parse (layout novo, página de erro com HTTP 200...);
+  - orçamento global de retries por execução (ORCAMENTO_RETRIES): esgotado, falhas
+    transitórias passam a desistir na primeira tentativa.
+
+Controle de vazão AIMD (ControleAIMD / CONTROLE):
+  - cada requisição passa por CONTROLE.aguardar() (espaçamento = 1/taxa, global
+    entre threads) e reporta latência/erro em CONTROLE.observar();
+  - a cada JANELA_AIMD observações: se p95 > LATENCIA_P95_ALVO ou taxa de erro
+    > ERRO_MAX -> taxa e concorrência caem pela metade (multiplicativo);
+    senão taxa += PASSO_TAXA e concorrência += 1 (aditivo), dentro de [piso, teto];
+  - buscar_lote() busca os municípios de uma competência em paralelo, com no
+    máximo CONTROLE.concorrencia requisições em voo;
+  - a taxa corrente é exposta em metricas() e logada como [AIMD] a cada ajuste.
+  Piso/teto via env: CNES_TAXA_MIN/MAX (req/s), CNES_CONC_MIN/MAX.
+  Acima disso vale o teto global entre processos (limite_global.py), se ativo.
+
+Hedge (opcional, CNES_HEDGE=1): se a resposta não chega em HEDGE_ATRASO (p95
+das latências recentes; HEDGE_ATRASO_PADRAO enquanto não há amostra), dispara
+uma cópia da requisição e usa a que responder primeiro. Limitado a
+HEDGE_ORCAMENTO das requisições (mais HEDGE_RAJADA); hedges e vitórias do
+hedge entram no resumo(). A cópia passa por CONTROLE.aguardar() e pelo limite
+global como qualquer requisição, e sua latência/erro entram no AIMD.
+A perdedora não é cancelável (o requests não interrompe uma leitura em curso):
+segue até responder ou até o timeout, segurando um worker do pool de hedge. Por
+isso no máximo HEDGE_EM_VOO pares ficam abertos ao mesmo tempo (um novo hedge é
+recusado enquanto isso) e o pool tem CONC_MAX + 2 * HEDGE_EM_VOO workers: as
+primárias nunca esperam na fila atrás de perdedoras.
+
+Retorno de buscar_pagina(): DataFrame com dados, DataFrame vazio (página com o
+aviso de "sem dados", ver pagina_sem_dados) ou None (falha). Só o vazio vai para
+o cache negativo.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import time
+import unicodedata
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from importacao_tardia import tardio
+from arquivo_paginas import arquivar_pagina
+from limite_global import limite_global
+
+pd = tardio("pandas")
+requests = tardio("requests")
+
+BACKOFF_BASE = 1.0     # s
+BACKOFF_TETO = 30.0    # s
+ORCAMENTO_RETRIES = int(os.getenv("CNES_ORCAMENTO_RETRIES", "300"))
+FALHAS_DIR = os.getenv("CNES_PAGINAS_FALHA", os.path.join(".cache_painel", "falhas"))
+
+TAXA_INICIAL = 1 / 0.8  # req/s (equivale ao antigo SLEEP_ENTRE_REQUISICOES = 0.8)
+TAXA_MIN = float(os.getenv("CNES_TAXA_MIN", "0.2"))
+TAXA_MAX = float(os.getenv("CNES_TAXA_MAX", "8"))
+CONC_MIN = int(os.getenv("CNES_CONC_MIN", "1"))
+CONC_MAX = int(os.getenv("CNES_CONC_MAX", "4"))
+PASSO_TAXA = 0.25          # aumento aditivo (req/s) por janela saudável
+FATOR_QUEDA = 0.5          # redução multiplicativa
+LATENCIA_P95_ALVO = 3.0    # s
+ERRO_MAX = 0.10            # fração de erros transitórios na janela
+JANELA_AIMD = 20           # observações por decisão
+
+HEDGE_ATIVO = os.getenv("CNES_HEDGE", "0") == "1"
+HEDGE_ORCAMENTO = float(os.getenv("CNES_HEDGE_ORCAMENTO", "0.05"))  # fração das requisições
+HEDGE_RAJADA = 2             # hedges permitidos antes de haver requisições suficientes
+HEDGE_ATRASO_PADRAO = 5.0    # s, até juntar HEDGE_AMOSTRA_MIN latências
+HEDGE_ATRASO_MIN = 0.5       # s
+HEDGE_AMOSTRA_MIN = 20
+HEDGE_EM_VOO = int(os.getenv("CNES_HEDGE_EM_VOO", "2"))  # pares (primária + cópia) abertos ao mesmo tempo
+
+# avisos de célula sem dados nas páginas do DATASUS (comparados sem acento, em
+# minúsculas e com espaços normalizados). Não há página real vazia arquivada no
+# repositório para conferir o texto exato; se o site usar outra frase, todo vazio
+# legítimo vira falha de parse (agenda com backoff, nunca o cache negativo) —
+# acrescente a frase em CNES_MARCADOR_SEM_DADOS (separadas por "|") e confira
+# uma página salva em FALHAS_DIR.
+MARCADORES_SEM_DADOS = (
+    "nenhum registro encontrado",
+    "nao foram encontrados registros",
+    "nenhum estabelecimento encontrado",
+    "nao ha dados",
+    "nao existem dados",
+    "sem registros",
+) + tuple(m.strip() for m in os.getenv("CNES_MARCADOR_SEM_DADOS", "").split("|") if m.strip())
+
+TRANSITORIO = "transitorio"
+PERMANENTE = "permanente"
+
+
+class FalhaParse(Exception):
+    """Página com HTTP 200 que o parser não entendeu (exceção ou nenhuma tabela reconhecida)."""
+
+
+def pagina_sem_dados(html: str) -> bool:
+    """True se a página traz o aviso de célula sem dados (e não só "nenhuma tabela casou")."""
+    txt = _sem_acento(re.sub(r"<[^>]+>", " ", html))
+    return any(_sem_acento(m) in txt for m in MARCADORES_SEM_DADOS)
+
+def _sem_acento(txt: str) -> str:
+    txt = unicodedata.normalize("NFKD", txt.lower())
+    return " ".join("".join(c for c in txt if not unicodedata.combining(c)).split())
+
+
+def classificar(exc: BaseException) -> str:
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return TRANSITORIO
+    if isinstance(exc, requests.exceptions.ChunkedEncodingError):
+        return TRANSITORIO
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        st = exc.response.status_code
+        return TRANSITORIO if st >= 500 or st == 429 else PERMANENTE
+    return PERMANENTE
+
+def espera_backoff(tentativa: int, base: float = BACKOFF_BASE, teto: float = BACKOFF_TETO) -> float:
+    return random.uniform(0, min(teto, base * 2 ** (tentativa - 1)))
+
+
+class OrcamentoRetry:
+    """Contador de retries da execução (thread-safe)."""
+
+    def __init__(self, limite: int):
+        self.limite = limite
+        self.usados = 0
+        self._avisado = False
+        self._lock = threading.Lock()
+
+    def consumir(self) -> bool:
+        with self._lock:
+            if self.usados >= self.limite:
+                if not self._avisado:
+                    self._avisado = True
+                    print(f"[RETRY] orçamento de {self.limite} retries esgotado; falhas transitórias não serão mais repetidas")
+                return False
+            self.usados += 1
+            return True
+
+
+ORCAMENTO = OrcamentoRetry(ORCAMENTO_RETRIES)
+
+
+def _percentil(valores, q: float) -> float:
+    v = sorted(valores)
+    return v[min(len(v) - 1, int(q * len(v)))]
+
+class ControleAIMD:
+    """Taxa (req/s) e concorrência adaptativas; thread-safe."""
+
+    def __init__(self, taxa=TAXA_INICIAL, taxa_min=TAXA_MIN, taxa_max=TAXA_MAX,
+                 conc=CONC_MIN, conc_min=CONC_MIN, conc_max=CONC_MAX, janela=JANELA_AIMD):
+        self.taxa_min, self.taxa_max = taxa_min, taxa_max
+        self.conc_min, self.conc_max = conc_min, conc_max
+        self.taxa = min(max(taxa, taxa_min), taxa_max)
+        self.concorrencia = min(max(conc, conc_min), conc_max)
+        self.janela = janela
+        self._lat = deque(maxlen=janela)
+        self._erros = 0
+        self._proximo = 0.0
+        self.ajustes = {"aumento": 0, "queda": 0}
+        self.ultimo_p95 = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._em_voo = 0
+
+    # ---- espaçamento entre requisições ----
+    def aguardar(self):
+        with self._lock:
+            agora = time.monotonic()
+            slot = max(agora, self._proximo)
+            self._proximo = slot + 1.0 / self.taxa
+        if slot > agora:
+            time.sleep(slot - agora)
+
+    # ---- limite de requisições em voo ----
+    def entrar(self):
+        with self._cond:
+            while self._em_voo >= self.concorrencia:
+                self._cond.wait()
+            self._em_voo += 1
+
+    def sair(self):
+        with self._cond:
+            self._em_voo -= 1
+            self._cond.notify_all()
+
+    # ---- AIMD ----
+    def observar(self, latencia: float, erro: bool = False):
+        with self._lock:
+            self._lat.append(latencia)
+            self._erros += int(erro)
+            if len(self._lat) < self.janela:
+                return
+            p95 = _percentil(self._lat, 0.95)
+            taxa_erro = self._erros / len(self._lat)
+            self.ultimo_p95 = p95
+            if p95 > LATENCIA_P95_ALVO or taxa_erro > ERRO_MAX:
+                self.taxa = max(self.taxa_min, self.taxa * FATOR_QUEDA)
+                conc = max(self.conc_min, int(self.concorrencia * FATOR_QUEDA))
+                self.ajustes["queda"] += 1
+                acao = "queda"
+            else:
+                self.taxa = min(self.taxa_max, self.taxa + PASSO_TAXA)
+                conc = min(self.conc_max, self.concorrencia + 1)
+                self.ajustes["aumento"] += 1
+                acao = "aumento"
+            self._lat.clear()
+            self._erros = 0
+        with self._cond:
+            self.concorrencia = conc
+            self._cond.notify_all()
+        print(f"[AIMD] {acao}: taxa={self.taxa:.2f} req/s conc={conc} (p95={p95:.2f}s erros={taxa_erro:.0%})")
+
+    def metricas(self) -> dict:
+        return {"taxa_req_s": round(self.taxa, 3), "concorrencia": self.concorrencia,
+                "p95_s": self.ultimo_p95, **self.ajustes}
+
+
+CONTROLE = ControleAIMD()
+_stats = {"requisicoes": 0, "retries": 0, TRANSITORIO: 0, PERMANENTE: 0, "hedges": 0, "hedge_vitorias": 0,
+          "hedges_em_voo": 0}
+_logados = set()
+_stats_lock = threading.Lock()
+
+def _contar(chave: str, n: int = 1):
+    with _stats_lock:
+        _stats[chave] += n
+
+def resumo() -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    out["orcamento_restante"] = max(0, ORCAMENTO.limite - ORCAMENTO.usados)
+    out.update(CONTROLE.metricas())
+    return out
+
+def _falha_permanente(dataset, vmun, vcomp, motivo, html=None):
+    k = (dataset, vmun, vcomp)
+    with _stats_lock:
+        if k in _logados:
+            return
+        _logados.add(k)
+    _contar(PERMANENTE)
+    path = arquivar_pagina(dataset, vmun, vcomp, html, base=FALHAS_DIR) if html is not None else None
+    extra = f" (página salva em {path})" if path else ""
+    print(f"[ERRO] {dataset} VMun={vmun} VComp={vcomp} -> falha permanente: {motivo}{extra}")
+
+
+# ---------------- hedge ----------------
+
+_latencias_ok = deque(maxlen=200)
+_hedge_pool = None
+_hedge_lock = threading.Lock()
+
+def _atraso_hedge() -> float:
+    amostra = list(_latencias_ok)
+    if len(amostra) < HEDGE_AMOSTRA_MIN:
+        return HEDGE_ATRASO_PADRAO
+    return max(HEDGE_ATRASO_MIN, _percentil(amostra, 0.95))
+
+def _pode_hedge() -> bool:
+    with _stats_lock:
+        if _stats["hedges"] >= HEDGE_RAJADA + HEDGE_ORCAMENTO * _stats["requisicoes"]:
+            return False
+        if _stats["hedges_em_voo"] >= HEDGE_EM_VOO:  # perdedoras ainda presas no pool
+            return False
+        _stats["hedges"] += 1
+        _stats["hedges_em_voo"] += 1
+        return True
+
+def _liberar_quando_terminarem(futuros):
+    """Devolve a vaga do par quando as duas requisições (inclusive a perdedora) terminarem."""
+    restantes = [len(futuros)]
+
+    def fim(_):
+        with _stats_lock:
+            restantes[0] -= 1
+            if restantes[0] == 0:
+                _stats["hedges_em_voo"] -= 1
+    for f in futuros:
+        f.add_done_callback(fim)
+
+def _get(url, params, headers, timeout):
+    r = requests.get(url, params=params, headers=headers, timeout=timeout, verify=False)
+    r.raise_for_status()
+    return r
+
+def _get_hedge(url, params, headers, timeout):
+    """GET com cópia após o atraso de hedge; devolve a primeira resposta OK."""
+    global _hedge_pool
+    if not HEDGE_ATIVO:
+        return _get(url, params, headers, timeout)
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=CONC_MAX + 2 * HEDGE_EM_VOO, thread_name_prefix="hedge")
+    primaria = _hedge_pool.submit(_get, url, params, headers, timeout)
+    feitos, _ = wait([primaria], timeout=_atraso_hedge())
+    if feitos or not _pode_hedge():
+        return primaria.result()
+
+    def copia():
+        # a cópia é uma requisição a mais no servidor: mesma vazão e mesmo AIMD
+        CONTROLE.aguardar()
+        lim = limite_global()
+        if lim is not None:
+            lim.adquirir()
+        t0 = time.monotonic()
+        try:
+            r = _get(url, params, headers, timeout)
+        except Exception as e:
+            CONTROLE.observar(time.monotonic() - t0, erro=(classificar(e) == TRANSITORIO))
+            raise
+        CONTROLE.observar(time.monotonic() - t0)
+        return r
+
+    hedge = _hedge_pool.submit(copia)
+    _liberar_quando_terminarem([primaria, hedge])
+    pendentes = {primaria, hedge}
+    erro = None
+    while pendentes:
+        feitos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+        for f in feitos:
+            if f.exception() is None:
+                if f is hedge:
+                    _contar("hedge_vitorias")
+                return f.result()  # a perdedora segue até o timeout, contada em hedges_em_voo
+            erro = erro or f.exception()
+    raise erro
+
+
+def buscar_pagina(dataset: str, url: str, params: dict, parser, vmun: str, vcomp: str,
+                  headers=None, timeout=30, max_retries=3) -> pd.DataFrame | None:
+    """
+    GET + parse de uma célula (município, competência) com a política acima.
+    """
+    for tentativa in range(1, max_retries + 1):
+        _contar("requisicoes")
+        CONTROLE.aguardar()
+        lim = limite_global()
+        if lim is not None:
+            lim.adquirir()
+        t0 = time.monotonic()
+        try:
+            r = _get_hedge(url, params, headers, timeout)
+        except Exception as e:
+            tipo = classificar(e)
+            CONTROLE.observar(time.monotonic() - t0, erro=(tipo == TRANSITORIO))
+            if tipo == PERMANENTE:
+                resp = getattr(e, "response", None)
+                _falha_permanente(dataset, vmun, vcomp, e, resp.text if resp is not None else None)
+                return None
+            _contar(TRANSITORIO)
+            if tentativa == max_retries or not ORCAMENTO.consumir():
+                print(f"[ERRO] {dataset} VMun={vmun} VComp={vcomp} -> {e} (tentativa {tentativa}/{max_retries})")
+                return None
+            _contar("retries")
+            time.sleep(espera_backoff(tentativa))
+            continue
+
+        lat = time.monotonic() - t0
+        CONTROLE.observar(lat)
+        _latencias_ok.append(lat)
+        r.encoding = "latin-1"  # páginas do CNES são ISO-8859-1
+        arquivar_pagina(dataset, vmun, vcomp, r.text)
+        try:
+            df = parser(r.text)
+        except Exception as e:
+            _falha_permanente(dataset, vmun, vcomp, FalhaParse(f"{type(e).__name__}: {e}"), r.text)
+            return None
+        if df is not None and not df.empty:
+            return df
+        # vazio só com o aviso explícito do CNES: é o que autoriza o cache negativo
+        if pagina_sem_dados(r.text):
+            return pd.DataFrame()
+        _falha_permanente(dataset, vmun, vcomp, FalhaParse(
+            "nenhuma tabela reconhecida e sem aviso de sem dados (se a página é um vazio legítimo, "
+            "acrescente a frase dela em CNES_MARCADOR_SEM_DADOS)"), r.text)
+        return None
+    return None
+
+
+_NAO_BUSCADO = object()
+
+def buscar_lote(fetch, municipios: list[dict], vcomp: str, parar=None):
+    """
+    Executa fetch(codigo, vcomp) para cada município com concorrência adaptativa.
+    Gera (municipio, df, erro) na ordem de conclusão. Se parar() ficar True, as
+    células ainda não iniciadas são descartadas (não aparecem no resultado) e as
+    que estão em voo terminam normalmente.
+    """
+    def tarefa(m):
+        CONTROLE.entrar()
+        try:
+            if parar is not None and parar():
+                return _NAO_BUSCADO
+            return fetch(m["codigo"], vcomp)
+        finally:
+            CONTROLE.sair()
+
+    with ThreadPoolExecutor(max_workers=CONTROLE.conc_max) as ex:
+        futuros = {ex.submit(tarefa, m): m for m in municipios}
+        for fut in as_completed(futuros):
+            try:
+                res = fut.result()
+            except Exception as e:
+                yield futuros[fut], None, e
+                continue
+            if res is not _NAO_BUSCADO:
+                yield futuros[fut], res, None
@@ -1,11 +1,23 @@
 # cnes_tipo_unidade_to_pg.py
-import time, re, argparse
-import pandas as pd
+from __future__ import annotations
+import re, argparse
 from db_config import DBConfig
 from db_utils import (
-    get_conn, upsert_dicts,
+    upsert_dicts, remover_ausentes, travar_celulas, celulas_existentes, competencias_refresh,
+    gravar_com_retentativa,
     get_or_create_competencia, get_or_create_municipio, get_or_create_item
 )
+from eventos_carga import publicar_carga
+from pool_db import conexao, imprimir_resumo
+from descoberta_competencias import competencias_publicadas, intervalo_competencias
+from cache_negativo import CacheNegativo
+from agenda_coleta import AgendaColeta
+from checkpoint_carga import Prazo, Checkpoint
+from seletores import adicionar_seletores_cnes, codigos_municipio, filtrar_municipios
+from cliente_cnes import buscar_lote, resumo as resumo_fetch
+from importacao_tardia import tardio
+
+pd = tardio("pandas")  # só na normalização
 
 # ========= integrações com seu scraper =========
 try:
@@ -20,16 +32,14 @@ def _resolve_fn(module, candidates):
     return None
 
 baixar_municipios_ibge   = _resolve_fn(mod_tu, ["baixar_municipios_ibge", "listar_municipios_rr", "get_municipios_rr"])
-gerar_competencias       = _resolve_fn(mod_tu, ["gerar_competencias", "listar_competencias"])
 fetch_tipo_unidade       = _resolve_fn(mod_tu, ["fetch_tipo_unidade", "fetch_unidade", "fetch_tipos_unidade", "baixar_tipo_unidade"])
 VCOMP_INICIO             = getattr(mod_tu, "VCOMP_INICIO", "201201")
-VCOMP_FIM                = getattr(mod_tu, "VCOMP_FIM", "203012")
-SLEEP_ENTRE_REQUISICOES  = getattr(mod_tu, "SLEEP_ENTRE_REQUISICOES", 0.6)
+VCOMP_FIM                = getattr(mod_tu, "VCOMP_FIM", None)
 
-if not baixar_municipios_ibge or not gerar_competencias or not fetch_tipo_unidade:
+if not baixar_municipios_ibge or not fetch_tipo_unidade:
     raise SystemExit(
         "Ajuste os nomes: não encontrei funções esperadas no scrape_cnes_rr_tipo_unidade.py "
-        "(preciso de baixar_municipios_ibge, gerar_competencias e uma fetch_* para tipo_unidade)."
+        "(preciso de baixar_municipios_ibge e uma fetch_* para tipo_unidade)."
     )
 
 # ========= helpers =========
@@ -165,64 +175,142 @@ def dedupe_batch(rows):
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--force", action="store_true")
+    ap.add_argument("--refresh", type=int, metavar="N",
+                    help="Reprocessa só as N últimas competências publicadas + as novas; grava só células alteradas")
+    ap.add_argument("--max-runtime", type=float, metavar="SEG",
+                    help="Prazo da execução em segundos: encerra gravando o lote e um checkpoint para retomar")
+    adicionar_seletores_cnes(ap)
     args = ap.parse_args()
 
     cfg = DBConfig()
-    municipios   = baixar_municipios_ibge()
-    competencias = gerar_competencias(VCOMP_INICIO, VCOMP_FIM)
+    codigos      = codigos_municipio(args.municipios)
+    municipios   = filtrar_municipios(baixar_municipios_ibge(), codigos)
+    if args.vcomp_inicio and args.vcomp_fim:
+        competencias = intervalo_competencias(args.vcomp_inicio, args.vcomp_fim)  # explícito: sem sondas
+    else:
+        competencias = competencias_publicadas(args.vcomp_inicio or VCOMP_INICIO, args.vcomp_fim or VCOMP_FIM,
+                                              dataset="tipo_unidade")
 
     total_upserts = 0
-    with get_conn(cfg) as conn:
-        for vcomp in competencias:
+    prazo = Prazo(args.max_runtime)
+    prazo.instalar_sigterm()
+    with conexao("carga", cfg) as conn:
+        neg = CacheNegativo(conn, "tipo_unidade")
+        agenda = AgendaColeta(conn, "tipo_unidade", "fato_cnes_tipo_unidade", "total")
+        ckpt = Checkpoint(conn, "tipo_unidade")
+        if args.refresh:
+            competencias = competencias_refresh(conn, "fato_cnes_tipo_unidade", competencias, args.refresh)
+            print(f"[REFRESH] {len(competencias)} competência(s): {', '.join(competencias)}")
+        for vcomp in agenda.competencias(competencias):  # mais recentes primeiro
+            if prazo.esgotado():
+                print(f"[PRAZO] tempo esgotado antes de {vcomp}; retomar na próxima execução")
+                break
+            alvo = municipios
+            feitos = ckpt.concluidos(vcomp)
+            if feitos is not None:
+                # competência interrompida numa execução anterior: só o que falta
+                alvo = [m for m in municipios if m["codigo"] not in feitos]
+                print(f"[RETOMA] {vcomp}: {len(feitos)} município(s) já tratados, {len(alvo)} restante(s)")
             # Skip rápido por competência (se já existir algo nessa comp)
-            if not args.force:
+            if not (args.force or args.refresh) and feitos is None:
                 with conn.cursor() as cur:
                     cur.execute("""
                         SELECT 1
                         FROM fato_cnes_tipo_unidade f
                         JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+                        JOIN dim_municipio m ON m.municipio_id = f.municipio_id
                         WHERE d.vcomp = %s
+                          AND (%s::text[] IS NULL OR m.codigo_municipio = ANY(%s::text[]))
                         LIMIT 1
-                    """, (vcomp,))
+                    """, (vcomp, sorted(codigos) if codigos else None, sorted(codigos) if codigos else None))
                     if cur.fetchone():
-                        print(f"[SKIP] {vcomp}: já existe em fato_cnes_tipo_unidade")
-                        continue
+                        # competência já carregada: só as células que falharam e venceram o backoff
+                        alvo = agenda.falhas_vencidas(municipios, vcomp)
+                        if not alvo:
+                            print(f"[SKIP] {vcomp}: já existe em fato_cnes_tipo_unidade")
+                            continue
+                        print(f"[RETRY] {vcomp}: {len(alvo)} célula(s) com falha anterior")
 
             batch = []
-            for m in municipios:
-                try:
-                    df = fetch_tipo_unidade(m["codigo"], vcomp)
-                except Exception as e:
-                    print(f"[WARN] {vcomp}/{m.get('nome','?')}: erro no fetch ({e}) — pulando.")
+            municipios_ok = []
+            vazios = []  # página OK sem dados: no --refresh, o que houver da célula no fato sai
+            pendentes = [m for m in agenda.ordenar(alvo, vcomp, ignorar_backoff=args.force)
+                         if args.force or not neg.vazio(m["codigo"], vcomp)]
+            # fetch concorrente com vazão adaptativa (cliente_cnes.CONTROLE); normalização segue serial
+            conn.commit()  # encerra as leituras de planejamento: nada de transação aberta durante o fetch
+            tratados = []
+            for m, df, erro in buscar_lote(fetch_tipo_unidade, pendentes, vcomp, parar=prazo.esgotado):
+                tratados.append(m["codigo"])
+                if erro is not None:
+                    print(f"[WARN] {vcomp}/{m.get('nome','?')}: erro no fetch ({erro}) — pulando.")
+                    agenda.falhou(m["codigo"], vcomp)
                     continue
-
-                time.sleep(SLEEP_ENTRE_REQUISICOES)
-                if df is None or df.empty:
+                if df is None:
+                    agenda.falhou(m["codigo"], vcomp)
                     continue
+                agenda.sucesso(m["codigo"], vcomp)
+                if df.empty:
+                    neg.registrar(m["codigo"], vcomp)
+                    vazios.append(m["codigo"])
+                    continue
+                neg.remover(m["codigo"], vcomp)  # vazio antigo (vencido) sai da tabela
 
                 try:
-                    rows = df_to_rows_fato(conn, df, vcomp, m["codigo"], "RR", m["nome"])
+                    # dimensões numa transação curta por município (commit já aqui, não no fim do lote)
+                    rows = gravar_com_retentativa(
+                        conn, lambda c: df_to_rows_fato(c, df, vcomp, m["codigo"], "RR", m["nome"]),
+                        rotulo=f"{vcomp}/{m['nome']} dimensões")
                 except Exception as e:
+                    conn.rollback()
                     print(f"[WARN] {vcomp}/{m['nome']}: falha na normalização ({e}) — pulando município.")
                     continue
                 batch.extend(rows)
+                municipios_ok.append(m["codigo"])
 
-            if batch:
+            incompleta = len(tratados) < len(pendentes)
+            ckpt.registrar(vcomp, tratados, completo=not incompleta)
+            if batch or (args.refresh and vazios):
                 batch = dedupe_batch(batch)
-                inserted = upsert_dicts(
-                    conn,
-                    table="fato_cnes_tipo_unidade",
-                    rows=batch,
-                    pkey_cols=["competencia_id", "municipio_id", "item_id"],
-                    update_cols=["total"]
-                )
-                conn.commit()
+
+                def gravar(conn):
+                    celulas_vazias = celulas_existentes(conn, vcomp, vazios) if args.refresh else []
+                    if args.refresh:  # upsert + remoção: refresh da mesma célula em fila, sem deadlock
+                        travar_celulas(conn, "fato_cnes_tipo_unidade", batch + celulas_vazias)
+                    inserted = upsert_dicts(
+                        conn,
+                        table="fato_cnes_tipo_unidade",
+                        rows=batch,
+                        pkey_cols=["competencia_id", "municipio_id", "item_id"],
+                        update_cols=["total"],
+                        somente_alterados=bool(args.refresh)
+                    )
+                    removidas = (remover_ausentes(conn, "fato_cnes_tipo_unidade", batch, vazias=celulas_vazias)
+                                 if args.refresh else 0)
+                    if inserted or removidas:  # no refresh, nada mudou = nada a notificar
+                        publicar_carga(conn, "tipo_unidade", municipios_ok + (vazios if removidas else []), vcomp=vcomp)
+                    return inserted, removidas
+
+                inserted, removidas = gravar_com_retentativa(
+                    conn, gravar, pendencias=(neg, agenda, ckpt), rotulo=f"{vcomp} lote")
+                if removidas:
+                    print(f"[REFRESH] {vcomp}: {removidas} célula(s) que saíram da página removidas")
                 total_upserts += inserted
                 print(f"[OK] {vcomp}: upsert {inserted} (acum={total_upserts})")
             else:
+                gravar_com_retentativa(conn, lambda c: None, pendencias=(neg, agenda, ckpt), rotulo=f"{vcomp} controle")
                 print(f"[SKIP] {vcomp}: sem dados")
-
-    print(f"Concluído. Total upsert: {total_upserts}")
+            if incompleta:
+                print(f"[PRAZO] {vcomp}: checkpoint com {len(ckpt.concluidos(vcomp))} município(s); encerrando")
+                break
+
+    print(f"Concluído. Total upsert: {total_upserts} | células vazias puladas (cache): {neg.pulos} | adiadas (backoff): {agenda.adiadas}")
+    rf = resumo_fetch()
+    print(f"[FETCH] requisições={rf['requisicoes']} retries={rf['retries']} transitórias={rf['transitorio']} "
+          f"permanentes={rf['permanente']} orçamento restante={rf['orcamento_restante']} "
+          f"hedges={rf['hedges']} (vitórias={rf['hedge_vitorias']})")
+    print(f"[AIMD] taxa final={rf['taxa_req_s']} req/s conc={rf['concorrencia']} "
+          f"(aumentos={rf['aumento']} quedas={rf['queda']})")
+    imprimir_resumo()
 
 if __name__ == "__main__":
     main()
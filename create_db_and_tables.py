@@ -1,6 +1,10 @@
 # create_db_and_tables.py
 """
-Cria/atualiza o schema do projeto (idempotente) usando db_config.py.
+Cria/atualiza o schema do projeto usando db_config.py, por migrações versionadas
+(MIGRACOES): cada execução aplica só os passos pendentes.
+
+  python create_db_and_tables.py            # aplica o que falta
+  python create_db_and_tables.py --status   # lista as migrações
 
 Dimensões:
   - dim_municipio(codigo_municipio, uf, nome)
@@ -16,16 +20,33 @@ SIOPS (raw):
   - siops_tabelas(matrix JSONB)
 
 Views:
-  - vw_cnes_leito, vw_cnes_equipamento, vw_cnes_tipo_unidade
+  - vw_cnes_leito, vw_cnes_equipamento, vw_cnes_tipo_unidade, vw_siops_tabelas
+
+Controle (ETL):
+  - etl_change_cursor(consumidor, dataset, watermark)  << change feed incremental
+  - etl_remocao(tabela, competencia_id, municipio_id, item_id, removido_em)
+                                                        << linhas apagadas pelo --refresh (change feed)
+  - etl_versao_dataset(dataset, versao)                 << versão do cache da API, +1 a cada carga
+  - etl_celula_vazia(dataset, codigo_municipio, vcomp) << cache negativo de páginas sem dados
+  - etl_rate_limit(chave, proximo_slot)                 << limite global de req/s entre processos
+  - etl_celula_falha(dataset, codigo_municipio, vcomp)  << células com falha, re-tentadas com backoff
+  - etl_checkpoint(dataset, vcomp, concluidos)          << competência interrompida por --max-runtime
+  - etl_schema_migracao(versao, nome, checksum)         << migrações aplicadas (ver MIGRACOES)
 """
 
+import re
+import time
+import hashlib
+import argparse
+from dataclasses import dataclass
+
 import psycopg2
 from psycopg2 import sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
 from db_config import DBConfig, as_admin_dsn, as_dsn
 
-DDL = r"""
+DDL_TABELAS = r"""
 -- =========================
 -- DIMENSÕES
 -- =========================
@@ -35,7 +56,6 @@ CREATE TABLE IF NOT EXISTS dim_municipio (
   uf                CHAR(2) NOT NULL,
   nome              TEXT NOT NULL
 );
-CREATE INDEX IF NOT EXISTS idx_dim_municipio_uf_nome ON dim_municipio(uf, nome);
 
 CREATE TABLE IF NOT EXISTS dim_competencia (
   competencia_id  SERIAL PRIMARY KEY,
@@ -44,7 +64,6 @@ CREATE TABLE IF NOT EXISTS dim_competencia (
   mes             INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
   data_ref        DATE NOT NULL              -- 1º dia do mês
 );
-CREATE INDEX IF NOT EXISTS idx_dim_competencia_ano_mes ON dim_competencia(ano, mes);
 
 CREATE TABLE IF NOT EXISTS dim_item_cnes (
   item_id   SERIAL PRIMARY KEY,
@@ -54,7 +73,6 @@ CREATE TABLE IF NOT EXISTS dim_item_cnes (
   descricao TEXT,
   UNIQUE (tipo, codigo)
 );
-CREATE INDEX IF NOT EXISTS idx_dim_item_cnes_tipo_grupo ON dim_item_cnes(tipo, grupo);
 
 -- =========================
 -- FATOS CNES
@@ -71,7 +89,6 @@ CREATE TABLE IF NOT EXISTS fato_cnes_leito (
   loaded_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   PRIMARY KEY (competencia_id, municipio_id, item_id)
 );
-CREATE INDEX IF NOT EXISTS idx_fato_leito_mun_comp ON fato_cnes_leito(municipio_id, competencia_id);
 
 -- Equipamentos
 CREATE TABLE IF NOT EXISTS fato_cnes_equipamento (
@@ -85,7 +102,6 @@ CREATE TABLE IF NOT EXISTS fato_cnes_equipamento (
   loaded_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   PRIMARY KEY (competencia_id, municipio_id, item_id)
 );
-CREATE INDEX IF NOT EXISTS idx_fato_equip_mun_comp ON fato_cnes_equipamento(municipio_id, competencia_id);
 
 -- Tipo de unidade (TOTAL INTEGER)
 CREATE TABLE IF NOT EXISTS fato_cnes_tipo_unidade (
@@ -96,7 +112,6 @@ CREATE TABLE IF NOT EXISTS fato_cnes_tipo_unidade (
   loaded_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   PRIMARY KEY (competencia_id, municipio_id, item_id)
 );
-CREATE INDEX IF NOT EXISTS idx_fato_tipoun_mun_comp ON fato_cnes_tipo_unidade(municipio_id, competencia_id);
 
 -- =========================
 -- SIOPS (RAW)
@@ -112,9 +127,110 @@ CREATE TABLE IF NOT EXISTS siops_tabelas (
   PRIMARY KEY (municipio_id, ano, periodo, tabela_idx),
   CONSTRAINT chk_siops_matrix_arr_or_obj CHECK (jsonb_typeof(matrix) IN ('array','object'))
 );
-CREATE INDEX IF NOT EXISTS idx_siops_mun_ano ON siops_tabelas(municipio_id, ano);
-CREATE INDEX IF NOT EXISTS idx_siops_matrix_gin ON siops_tabelas USING GIN (matrix);
 
+-- =========================
+-- CHANGE FEED (loaded_at)
+-- =========================
+CREATE TABLE IF NOT EXISTS etl_change_cursor (
+  consumidor    TEXT NOT NULL,
+  dataset       TEXT NOT NULL,
+  watermark     TIMESTAMPTZ NOT NULL,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (consumidor, dataset)
+);
+
+-- Cache negativo: (dataset, município, competência) cuja página veio OK e sem dados
+CREATE TABLE IF NOT EXISTS etl_celula_vazia (
+  dataset          TEXT    NOT NULL,
+  codigo_municipio CHAR(6) NOT NULL,
+  vcomp            CHAR(6) NOT NULL,
+  verificado_em    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (dataset, codigo_municipio, vcomp)
+);
+
+-- Células cuja busca falhou: reagendadas com backoff exponencial (ver agenda_coleta.py)
+CREATE TABLE IF NOT EXISTS etl_celula_falha (
+  dataset            TEXT    NOT NULL,
+  codigo_municipio   CHAR(6) NOT NULL,
+  vcomp              CHAR(6) NOT NULL,
+  tentativas         INTEGER NOT NULL DEFAULT 1,
+  ultima_falha       TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  proxima_tentativa  TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (dataset, codigo_municipio, vcomp)
+);
+
+-- Checkpoint de execuções com prazo (ver checkpoint_carga.py)
+CREATE TABLE IF NOT EXISTS etl_checkpoint (
+  dataset       TEXT    NOT NULL,
+  vcomp         CHAR(6) NOT NULL,
+  concluidos    TEXT[]  NOT NULL,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (dataset, vcomp)
+);
+
+-- Limite global de requisições (compartilhado por processos/hosts; ver limite_global.py)
+CREATE TABLE IF NOT EXISTS etl_rate_limit (
+  chave        TEXT PRIMARY KEY,
+  proximo_slot TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+"""
+
+# Lápides: o DELETE do --refresh (db_utils.remover_ausentes) registra aqui a
+# chave apagada, com removido_em = NOW() da transação (mesma regra do loaded_at).
+# O change feed mescla as lápides às linhas; a versão da API avança porque o loader
+# chama publicar_carga também quando o refresh só apagou.
+# Uma linha por chave: apagar de novo só avança removido_em.
+DDL_REMOCAO = r"""
+CREATE TABLE IF NOT EXISTS etl_remocao (
+  tabela          TEXT    NOT NULL,
+  competencia_id  INTEGER NOT NULL,
+  municipio_id    INTEGER NOT NULL,
+  item_id         INTEGER NOT NULL,
+  removido_em     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (tabela, competencia_id, municipio_id, item_id)
+);
+CREATE INDEX IF NOT EXISTS idx_etl_remocao_tabela_em ON etl_remocao(tabela, removido_em);
+"""
+
+# Versão por dataset: avança logo depois do commit de cada carga, numa transação
+# curta à parte (eventos_carga.avancar_versoes), para a linha não ficar travada
+# durante a carga; a API valida o cache lendo só estas linhas (MAX(loaded_at) varria os fatos).
+DDL_VERSAO = r"""
+CREATE TABLE IF NOT EXISTS etl_versao_dataset (
+  dataset       TEXT PRIMARY KEY,
+  versao        BIGINT NOT NULL,
+  atualizado_em TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+INSERT INTO etl_versao_dataset (dataset, versao)
+VALUES ('leito', 1), ('equipamento', 1), ('tipo_unidade', 1), ('siops', 1)
+ON CONFLICT (dataset) DO NOTHING;
+"""
+
+# Índices secundários. Em bancos já populados são criados com CONCURRENTLY
+# (sem bloquear escrita/leitura do painel); ver aplicar_migracoes().
+INDICES = [
+    "CREATE INDEX IF NOT EXISTS idx_dim_municipio_uf_nome ON dim_municipio(uf, nome)",
+    "CREATE INDEX IF NOT EXISTS idx_dim_competencia_ano_mes ON dim_competencia(ano, mes)",
+    "CREATE INDEX IF NOT EXISTS idx_dim_item_cnes_tipo_grupo ON dim_item_cnes(tipo, grupo)",
+    "CREATE INDEX IF NOT EXISTS idx_fato_leito_mun_comp ON fato_cnes_leito(municipio_id, competencia_id)",
+    "CREATE INDEX IF NOT EXISTS idx_fato_equip_mun_comp ON fato_cnes_equipamento(municipio_id, competencia_id)",
+    "CREATE INDEX IF NOT EXISTS idx_fato_tipoun_mun_comp ON fato_cnes_tipo_unidade(municipio_id, competencia_id)",
+    "CREATE INDEX IF NOT EXISTS idx_siops_mun_ano ON siops_tabelas(municipio_id, ano)",
+    "CREATE INDEX IF NOT EXISTS idx_siops_matrix_gin ON siops_tabelas USING GIN (matrix)",
+    # BRIN: minúsculo e barato de manter. Serve enquanto os blocos do fim da heap
+    # concentram os loaded_at recentes (carga só de inserções). Não é garantido:
+    # loaded_at é o NOW() do início da transação (cargas longas/concorrentes
+    # intercalam tempos), e o upsert/--refresh grava a versão nova onde houver
+    # espaço livre (HOT, páginas limpas pelo VACUUM), não no fim. Com updates os
+    # intervalos por bloco se alargam e "loaded_at >= T" lê cada vez mais blocos;
+    # só um CLUSTER/reescrita da tabela devolve a ordem física.
+    "CREATE INDEX IF NOT EXISTS idx_fato_leito_loaded_brin  ON fato_cnes_leito        USING BRIN (loaded_at)",
+    "CREATE INDEX IF NOT EXISTS idx_fato_equip_loaded_brin  ON fato_cnes_equipamento  USING BRIN (loaded_at)",
+    "CREATE INDEX IF NOT EXISTS idx_fato_tipoun_loaded_brin ON fato_cnes_tipo_unidade USING BRIN (loaded_at)",
+    "CREATE INDEX IF NOT EXISTS idx_siops_loaded_brin       ON siops_tabelas          USING BRIN (loaded_at)",
+]
+
+DDL_VIEWS = r"""
 -- =========================
 -- VIEWS
 -- =========================
@@ -124,7 +240,8 @@ SELECT
   d.vcomp, d.ano, d.mes, d.data_ref,
   m.nome AS municipio_nome, m.uf,
   i.codigo AS codigo_item, i.grupo AS grupo_item, i.descricao AS descricao_item,
-  f.existente, f.sus, f.habilitados, f.loaded_at
+  f.existente, f.sus, f.habilitados, f.loaded_at,
+  m.codigo_municipio
 FROM fato_cnes_leito f
 JOIN dim_competencia d ON d.competencia_id = f.competencia_id
 JOIN dim_municipio   m ON m.municipio_id   = f.municipio_id
@@ -136,7 +253,8 @@ SELECT
   d.vcomp, d.ano, d.mes, d.data_ref,
   m.nome AS municipio_nome, m.uf,
   i.codigo AS codigo_item, i.grupo AS grupo_item, i.descricao AS descricao_item,
-  f.existentes, f.em_uso, f.existentes_sus, f.em_uso_sus, f.loaded_at
+  f.existentes, f.em_uso, f.existentes_sus, f.em_uso_sus, f.loaded_at,
+  m.codigo_municipio
 FROM fato_cnes_equipamento f
 JOIN dim_competencia d ON d.competencia_id = f.competencia_id
 JOIN dim_municipio   m ON m.municipio_id   = f.municipio_id
@@ -148,13 +266,25 @@ SELECT
   d.vcomp, d.ano, d.mes, d.data_ref,
   m.nome AS municipio_nome, m.uf,
   i.codigo AS codigo_item, i.grupo AS grupo_item, i.descricao AS descricao_item,
-  f.total, f.loaded_at
+  f.total, f.loaded_at,
+  m.codigo_municipio
 FROM fato_cnes_tipo_unidade f
 JOIN dim_competencia d ON d.competencia_id = f.competencia_id
 JOIN dim_municipio   m ON m.municipio_id   = f.municipio_id
 JOIN dim_item_cnes   i ON i.item_id        = f.item_id;
+
+CREATE OR REPLACE VIEW vw_siops_tabelas AS
+SELECT
+  s.municipio_id, m.codigo_municipio, m.nome AS municipio_nome, m.uf,
+  s.ano, s.periodo, s.tabela_idx, s.titulo, s.matrix, s.loaded_at
+FROM siops_tabelas s
+JOIN dim_municipio m ON m.municipio_id = s.municipio_id;
 """
 
+# DDL completo num script só: para schema novo/vazio (ex.: benchmark_carga.py)
+DDL = DDL_TABELAS + "".join(f"{i};\n" for i in INDICES) + DDL_VIEWS
+
+
 def ensure_database(cfg: DBConfig):
     """
     Cria o banco cfg.database se ainda não existir.
@@ -172,22 +302,178 @@ def ensure_database(cfg: DBConfig):
             cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(cfg.database)))
     conn.close()
 
-def create_schema(cfg: DBConfig):
+# =========================
+# MIGRAÇÕES VERSIONADAS
+# =========================
+# Cada passo é aplicado uma vez e registrado (com checksum) em etl_schema_migracao.
+# Mudança de schema = NOVO passo no fim da lista; passo já aplicado não se edita
+# (o checksum acusa). A impressão digital da lista inteira fica no COMMENT da
+# tabela de controle: "schema em dia" custa uma consulta ao catálogo.
+
+@dataclass(frozen=True)
+class Migracao:
+    versao: int
+    nome: str
+    comandos: tuple[str, ...]
+    concorrente: bool = False  # CREATE INDEX CONCURRENTLY, um comando por vez, fora de transação
+
+    @property
+    def checksum(self) -> str:
+        txt = "\n;\n".join(re.sub(r"\s+", " ", c).strip() for c in self.comandos)
+        return hashlib.sha256(txt.encode("utf-8")).hexdigest()
+
+MIGRACOES = [
+    Migracao(1, "tabelas base (dimensões, fatos, SIOPS, controle ETL)", (DDL_TABELAS,)),
+    Migracao(2, "índices secundários", tuple(INDICES), concorrente=True),
+    Migracao(3, "views do painel", (DDL_VIEWS,)),
+    Migracao(4, "lápides de remoção do refresh (change feed)", (DDL_REMOCAO,)),
+    Migracao(5, "versão por dataset (cache da API)", (DDL_VERSAO,)),
+]
+
+TABELA_MIGRACAO = "etl_schema_migracao"
+_LOCK_MIGRACAO = 7_160_046  # pg_advisory_lock: um migrador por vez
+
+def impressao_schema(migracoes=MIGRACOES) -> str:
+    base = ";".join(f"{m.versao}:{m.checksum}" for m in migracoes)
+    return hashlib.sha256(base.encode()).hexdigest()[:32]
+
+def schema_em_dia(conn) -> bool:
+    """Uma consulta; NULL se a tabela de controle nem existe."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT obj_description(to_regclass(%s), 'pg_class')", (TABELA_MIGRACAO,))
+        return cur.fetchone()[0] == impressao_schema()
+
+def _criar_indice_concorrente(cur, comando: str):
+    comando = comando.replace("CREATE INDEX IF NOT EXISTS", "CREATE INDEX CONCURRENTLY IF NOT EXISTS", 1)
+    nome = re.search(r"IF NOT EXISTS\s+(\w+)", comando)[1]
+    # build CONCURRENTLY interrompido deixa o índice INVALID (e o IF NOT EXISTS o pularia)
+    cur.execute("""
+        SELECT NOT i.indisvalid FROM pg_index i
+        WHERE i.indexrelid = to_regclass(%s)
+    """, (nome,))
+    r = cur.fetchone()
+    if r and r[0]:
+        print(f"[DB] índice {nome} inválido (build interrompido): recriando")
+        cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(nome)))
+    cur.execute(comando)
+
+def aplicar_migracoes(conn) -> int:
     """
-    Executa o DDL no banco alvo.
+    Aplica os passos pendentes (conn em autocommit). Retorna quantos aplicou.
+    Passos transacionais entram junto com o próprio registro; os concorrentes,
+    comando a comando (CONCURRENTLY não roda em transação) e são idempotentes.
     """
-    dsn = as_dsn(cfg)
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
     with conn.cursor() as cur:
-        cur.execute(DDL)
-    conn.close()
-    print("✅ Schema criado/atualizado com sucesso (tipo_unidade.total = INTEGER).")
+        cur.execute("SELECT pg_advisory_lock(%s)", (_LOCK_MIGRACAO,))
+        try:
+            if schema_em_dia(conn):  # outro processo terminou enquanto esperávamos
+                return 0
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {TABELA_MIGRACAO} (
+                  versao      INTEGER PRIMARY KEY,
+                  nome        TEXT NOT NULL,
+                  checksum    TEXT NOT NULL,
+                  aplicada_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                  duracao_ms  INTEGER
+                )
+            """)
+            cur.execute(f"SELECT versao, checksum FROM {TABELA_MIGRACAO}")
+            aplicadas = dict(cur.fetchall())
+            for m in MIGRACOES:
+                if m.versao in aplicadas and aplicadas[m.versao] != m.checksum:
+                    raise SystemExit(
+                        f"[DB] migração {m.versao} ({m.nome}) foi alterada depois de aplicada; "
+                        "não edite passos antigos, acrescente um novo em MIGRACOES"
+                    )
+
+            n = 0
+            for m in MIGRACOES:
+                if m.versao in aplicadas:
+                    continue
+                print(f"[DB] aplicando migração {m.versao}: {m.nome}")
+                t0 = time.monotonic()
+                registro = (f"INSERT INTO {TABELA_MIGRACAO} (versao, nome, checksum, duracao_ms) "
+                            "VALUES (%s, %s, %s, %s)")
+                if m.concorrente:
+                    for c in m.comandos:
+                        _criar_indice_concorrente(cur, c)
+                    cur.execute(registro, (m.versao, m.nome, m.checksum, int((time.monotonic() - t0) * 1000)))
+                else:
+                    cur.execute("BEGIN")
+                    try:
+                        for c in m.comandos:
+                            cur.execute(c)
+                        cur.execute(registro, (m.versao, m.nome, m.checksum, int((time.monotonic() - t0) * 1000)))
+                        cur.execute("COMMIT")
+                    except Exception:
+                        cur.execute("ROLLBACK")
+                        raise
+                n += 1
+            cur.execute(sql.SQL("COMMENT ON TABLE {} IS {}").format(
+                sql.Identifier(TABELA_MIGRACAO), sql.Literal(impressao_schema())))
+            return n
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_MIGRACAO,))
+
+def create_schema(cfg: DBConfig, conn=None):
+    """
+    Leva o banco alvo à versão atual do schema (só os passos pendentes).
+    """
+    conn = conn or psycopg2.connect(as_dsn(cfg))
+    conn.autocommit = True
+    try:
+        if schema_em_dia(conn):
+            print(f"[DB] Schema em dia (versão {MIGRACOES[-1].versao}).")
+            return
+        n = aplicar_migracoes(conn)
+    finally:
+        conn.close()
+    print(f"✅ Schema criado/atualizado com sucesso ({n} migração(ões) aplicada(s); versão {MIGRACOES[-1].versao}).")
+
+def status_schema(cfg: DBConfig):
+    conn = psycopg2.connect(as_dsn(cfg))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (TABELA_MIGRACAO,))
+            aplicadas = {}
+            if cur.fetchone()[0]:
+                cur.execute(f"SELECT versao, checksum, aplicada_em, duracao_ms FROM {TABELA_MIGRACAO}")
+                aplicadas = {v: (c, a, d) for v, c, a, d in cur.fetchall()}
+        for m in MIGRACOES:
+            a = aplicadas.get(m.versao)
+            if a is None:
+                estado = "PENDENTE"
+            elif a[0] != m.checksum:
+                estado = "ALTERADA (checksum difere)"
+            else:
+                estado = f"aplicada em {a[1]:%Y-%m-%d %H:%M} ({a[2]} ms)"
+            print(f"  {m.versao:3d}  {m.nome:55s} {estado}")
+        print(f"[DB] em dia: {'sim' if schema_em_dia(conn) else 'não'}")
+    finally:
+        conn.close()
+
+def _conectar_se_existe(cfg: DBConfig):
+    try:
+        return psycopg2.connect(as_dsn(cfg))
+    except psycopg2.OperationalError as e:
+        if "does not exist" in str(e) or "não existe" in str(e):
+            return None
+        raise
 
 def main():
+    ap = argparse.ArgumentParser(description="Cria o banco e aplica as migrações pendentes do schema")
+    ap.add_argument("--status", action="store_true", help="Lista as migrações e se o schema está em dia")
+    args = ap.parse_args()
+
     cfg = DBConfig()  # usa PGHOST/PGPORT/PGUSER/PGPASSWORD/PGDATABASE se definidos, senão os defaults do db_config.py
-    ensure_database(cfg)
-    create_schema(cfg)
+    if args.status:
+        status_schema(cfg)
+        return
+    # caminho comum (banco existe, schema em dia): uma conexão e uma consulta
+    conn = _conectar_se_existe(cfg)
+    if conn is None:
+        ensure_database(cfg)
+    create_schema(cfg, conn)
 
 if __name__ == "__main__":
     main()
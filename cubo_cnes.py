@@ -0,0 +1,539 @@
+# cubo_cnes.py
+"""
+Cubo NumPy dos fatos CNES (competência × município × item × métrica), gravado
+em .npy memory-mappable, para consultas analíticas no próprio processo.
+
+    python cubo_cnes.py exportar --raiz cubos [--datasets leito,equipamento] [--formato auto]
+    python cubo_cnes.py medir --raiz cubos --dataset leito [--repeticoes 20]
+
+    from cubo_cnes import abrir
+    cubo = abrir("cubos", "leito")
+    cubo.serie("existente", municipio="140010")           # soma por competência
+    cubo.ranking("202401", "sus", grupo="CIRÚRGICO")       # municípios, valor desc
+    cubo.por_grupo("existente")                           # matriz competência × grupo
+    cubo.agregar("sus", por=("competencia", "municipio"), vcomps=["202401", "202402"])
+
+Layout:
+    <raiz>/<dataset>/manifest.json      eixos, formato, versão do dataset, pasta atual
+    <raiz>/<dataset>/v<AAAAMMDDhhmmssffffff>/   (UTC, com microssegundos)
+                                        denso:   valores.npy [métrica, comp, mun, item] int32
+                                                 presente.npy [comp, mun, item] bool
+                                        esparso: comp.npy, mun.npy, item.npy (int32, linhas
+                                                 em ordem comp, mun, item), valores.npy
+                                                 [métrica, linha] int32, offsets.npy (início
+                                                 de cada célula competência × município)
+
+- Eixos em ordem de vcomp, codigo_municipio e (grupo, codigo) do item: um grupo
+  é uma faixa contígua do eixo de itens.
+- A métrica é o primeiro eixo (não o último): cada métrica é um bloco contíguo
+  e uma consulta só toca as páginas da métrica pedida.
+- "auto" grava o formato de menos bytes: denso quando a maior parte das células
+  existe, esparso (COO ordenado por competência, município) quando não; no
+  esparso, filtro de competência/município vira fatias contíguas via offsets.
+- NULL vira 0 (dá a mesma soma do SUM do Postgres); 'presente' / as linhas do
+  esparso separam célula ausente de zero.
+- abrir() só lê o manifest: os .npy vêm com np.load(mmap_mode="r"), as páginas
+  entram do page cache sob demanda e são as mesmas para todos os processos que
+  abrem o cubo (workers da API, notebooks, scripts) — nada é copiado para o heap.
+- Exportar grava numa pasta de versão nova e troca o manifest por último (.tmp +
+  os.replace); quem está com o cubo aberto continua lendo a versão anterior, que
+  fica em disco até o próximo export. Cubo.atualizar() relê o manifest se mudou.
+- O export pula o dataset quando etl_versao_dataset.versao (que avança depois
+  de cada commit de carga, ver eventos_carga) não mudou desde o último. A versão
+  é lida no mesmo snapshot REPEATABLE READ dos dados e gravada no manifest; como
+  ela avança depois dos dados, no pior caso o próximo export refaz o mesmo fato.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+from db_config import DBConfig
+from pool_db import conexao, imprimir_resumo
+from seletores import lista_csv
+from importacao_tardia import tardio
+
+pd = tardio("pandas")
+
+MANIFEST = "manifest.json"
+FORMATOS = ("auto", "denso", "esparso")
+EIXOS = ("competencia", "municipio", "item", "grupo")
+
+DATASETS_CUBO = {
+    "leito":        {"tabela": "fato_cnes_leito",        "metricas": ["existente", "sus", "habilitados"]},
+    "equipamento":  {"tabela": "fato_cnes_equipamento",  "metricas": ["existentes", "em_uso", "existentes_sus", "em_uso_sus"]},
+    "tipo_unidade": {"tabela": "fato_cnes_tipo_unidade", "metricas": ["total"]},
+}
+
+
+def _dir_dataset(raiz: str, dataset: str) -> str:
+    return os.path.join(raiz, dataset)
+
+def carregar_manifesto(raiz: str, dataset: str) -> dict | None:
+    path = os.path.join(_dir_dataset(raiz, dataset), MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+# ------------------------------ exportação ------------------------------
+
+def versao_fato(conn, dataset: str) -> int | None:
+    """Versão do dataset em etl_versao_dataset (None se o dataset nunca foi carregado)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT versao FROM etl_versao_dataset WHERE dataset = %s", (dataset,))
+        r = cur.fetchone()
+    return r[0] if r else None
+
+def _fato_vazio(conn, tabela: str) -> bool:
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {tabela})")
+        return cur.fetchone()[0]
+
+def _ler_fato(conn, tabela: str, metricas: list[str]):
+    """COPY do fato inteiro (ids + métricas, NULL -> 0) para um DataFrame int32."""
+    cols = ["competencia_id", "municipio_id", "item_id"] + metricas
+    sel = ", ".join(cols[:3] + [f"COALESCE({m}, 0)" for m in metricas])
+    with tempfile.SpooledTemporaryFile(max_size=256 << 20) as buf:
+        with conn.cursor() as cur:
+            cur.copy_expert(f"COPY (SELECT {sel} FROM {tabela}) TO STDOUT WITH (FORMAT csv)", buf)
+        buf.seek(0)
+        return pd.read_csv(buf, header=None, names=cols, dtype=np.int32, engine="c")
+
+def _eixo(conn, sql: str, ids: np.ndarray) -> tuple[np.ndarray, list[tuple]]:
+    """(posição no eixo indexada pelo id da dimensão, linhas da dimensão na ordem do eixo)."""
+    with conn.cursor() as cur:
+        cur.execute(sql, (ids.tolist(),))
+        linhas = cur.fetchall()
+    pos = np.full(int(ids.max()) + 1, -1, dtype=np.int32)
+    pos[[r[0] for r in linhas]] = np.arange(len(linhas), dtype=np.int32)
+    return pos, [r[1:] for r in linhas]
+
+def exportar(conn, dataset: str, raiz: str, formato: str = "auto", forcar: bool = False) -> dict | None:
+    """
+    Materializa o fato do dataset em <raiz>/<dataset>. Devolve o manifest novo,
+    ou None se o fato não mudou desde o último export (e não há 'forcar').
+    """
+    spec = DATASETS_CUBO[dataset]
+    tabela, metricas = spec["tabela"], spec["metricas"]
+    anterior = carregar_manifesto(raiz, dataset)
+
+    t0 = time.perf_counter()
+    with conn.cursor() as cur:  # versão e dados do mesmo snapshot
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    versao = versao_fato(conn, dataset)
+    if anterior and versao is not None and anterior.get("versao") == versao and not forcar:
+        conn.rollback()
+        print(f"[CUBO] {dataset}: fato sem mudanças desde {anterior['gerado_em']}; export pulado")
+        return None
+    if _fato_vazio(conn, tabela):
+        conn.rollback()
+        print(f"[CUBO] {dataset}: {tabela} vazio; nada a exportar")
+        return None
+
+    df = _ler_fato(conn, tabela, metricas)
+    pos_c, comps = _eixo(conn, """
+        SELECT competencia_id, vcomp FROM dim_competencia
+        WHERE competencia_id = ANY(%s) ORDER BY vcomp""", np.unique(df["competencia_id"].to_numpy()))
+    pos_m, muns = _eixo(conn, """
+        SELECT municipio_id, codigo_municipio, nome, uf FROM dim_municipio
+        WHERE municipio_id = ANY(%s) ORDER BY codigo_municipio""", np.unique(df["municipio_id"].to_numpy()))
+    pos_i, itens = _eixo(conn, """
+        SELECT item_id, codigo, grupo, descricao FROM dim_item_cnes
+        WHERE item_id = ANY(%s) ORDER BY grupo NULLS FIRST, codigo""", np.unique(df["item_id"].to_numpy()))
+    conn.rollback()
+    t_leitura = time.perf_counter() - t0
+
+    c = pos_c[df["competencia_id"].to_numpy()]
+    m = pos_m[df["municipio_id"].to_numpy()]
+    i = pos_i[df["item_id"].to_numpy()]
+    vals = np.stack([df[k].to_numpy() for k in metricas])
+    del df
+
+    n, K, C, M, I = len(c), len(metricas), len(comps), len(muns), len(itens)
+    bytes_denso = K * C * M * I * 4 + C * M * I
+    bytes_esparso = n * (12 + 4 * K) + 8 * (C * M + 1)
+    if formato == "auto":
+        formato = "denso" if bytes_denso <= bytes_esparso else "esparso"
+
+    pasta = "v" + datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")  # µs: dois exports no mesmo segundo
+    d = _dir_dataset(raiz, dataset)
+    tmp = os.path.join(d, pasta + ".tmp")
+    os.makedirs(tmp)
+    try:
+        if formato == "denso":
+            # open_memmap: o cubo é preenchido direto no arquivo, sem uma cópia inteira na RAM
+            out = np.lib.format.open_memmap(os.path.join(tmp, "valores.npy"), mode="w+",
+                                            dtype=np.int32, shape=(K, C, M, I))
+            for k in range(K):
+                out[k, c, m, i] = vals[k]
+            out.flush()
+            del out
+            presente = np.lib.format.open_memmap(os.path.join(tmp, "presente.npy"), mode="w+",
+                                                 dtype=np.bool_, shape=(C, M, I))
+            presente[c, m, i] = True
+            presente.flush()
+            del presente
+        else:
+            ordem = np.lexsort((i, m, c))
+            c, m = c[ordem], m[ordem]
+            np.save(os.path.join(tmp, "comp.npy"), c)
+            np.save(os.path.join(tmp, "mun.npy"), m)
+            np.save(os.path.join(tmp, "item.npy"), i[ordem])
+            np.save(os.path.join(tmp, "valores.npy"), np.ascontiguousarray(vals[:, ordem]))
+            celula = c.astype(np.int64) * M + m   # crescente: linhas em ordem (comp, mun)
+            np.save(os.path.join(tmp, "offsets.npy"),
+                    np.searchsorted(celula, np.arange(C * M + 1), side="left").astype(np.int64))
+        os.replace(tmp, os.path.join(d, pasta))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    grupos, inicio = [], []
+    for pos, (_, grupo, _) in enumerate(itens):
+        if not grupos or grupos[-1] != grupo:
+            grupos.append(grupo)
+            inicio.append(pos)
+    manifesto = {
+        "dataset": dataset, "tabela": tabela, "formato": formato, "metricas": metricas,
+        "versao": versao, "linhas": n, "pasta": pasta,
+        "gerado_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "vcomps": [r[0] for r in comps],
+        "municipios": [list(r) for r in muns],
+        "itens": [list(r) for r in itens],
+        "grupos": grupos, "grupo_inicio": inicio,
+        "bytes": bytes_denso if formato == "denso" else bytes_esparso,
+    }
+    path = os.path.join(d, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+    # fica a versão nova e a anterior (pode estar aberta em algum processo)
+    manter = {pasta, anterior["pasta"] if anterior else None}
+    for nome in os.listdir(d):
+        if nome.startswith("v") and nome not in manter and os.path.isdir(os.path.join(d, nome)):
+            shutil.rmtree(os.path.join(d, nome), ignore_errors=True)
+
+    print(f"[CUBO] {dataset}: {n} linha(s) -> {formato} {K}x{C}x{M}x{I} "
+          f"({manifesto['bytes'] / 2**20:.1f} MiB; densidade {n / max(1, C * M * I):.0%}) "
+          f"em {time.perf_counter() - t0:.1f}s (leitura {t_leitura:.1f}s)")
+    return manifesto
+
+# ------------------------------ consulta ------------------------------
+
+class CuboCNES:
+    """
+    Cubo aberto com memory map. Os eixos vêm do manifest:
+      vcomps, municipios (codigo_municipio), itens (codigo), grupos
+    e agregar() devolve arrays int64 alinhados a eles.
+    """
+
+    def __init__(self, raiz: str, dataset: str):
+        self.raiz = raiz
+        self.dataset = dataset
+        self._mtime = None
+        self._carregar()
+
+    def _carregar(self):
+        path = os.path.join(_dir_dataset(self.raiz, self.dataset), MANIFEST)
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, encoding="utf-8") as f:
+            man = json.load(f)
+        d = os.path.join(_dir_dataset(self.raiz, self.dataset), man["pasta"])
+
+        def mapa(nome):
+            return np.load(os.path.join(d, nome + ".npy"), mmap_mode="r")
+
+        self.manifesto = man
+        self.formato = man["formato"]
+        self.metricas = man["metricas"]
+        self.vcomps = man["vcomps"]
+        self.municipios = [r[0] for r in man["municipios"]]
+        self.itens = [r[0] for r in man["itens"]]
+        self.grupos = man["grupos"]
+        self.valores = mapa("valores")
+        if self.formato == "denso":
+            self.presente = mapa("presente")
+        else:
+            self.comp, self.mun, self.item, self.offsets = mapa("comp"), mapa("mun"), mapa("item"), mapa("offsets")
+        inicio = man["grupo_inicio"]
+        self._grupo_item = np.repeat(np.arange(len(inicio), dtype=np.int32),
+                                     np.diff(inicio + [len(self.itens)]))
+        self._pos = {"competencia": {v: p for p, v in enumerate(self.vcomps)},
+                     "municipio": {v: p for p, v in enumerate(self.municipios)},
+                     "item": {v: p for p, v in enumerate(self.itens)},
+                     "grupo": {v: p for p, v in enumerate(self.grupos)}}
+        self._mtime = mtime
+
+    def atualizar(self) -> bool:
+        """Reabre o cubo se o exportador gravou uma versão nova. True se trocou."""
+        path = os.path.join(_dir_dataset(self.raiz, self.dataset), MANIFEST)
+        if os.stat(path).st_mtime_ns == self._mtime:
+            return False
+        self._carregar()
+        return True
+
+    def rotulos(self, eixo: str) -> list:
+        return {"competencia": self.vcomps, "municipio": self.municipios,
+                "item": self.itens, "grupo": self.grupos}[eixo]
+
+    # ---------------- seleção / agregação ----------------
+
+    def _posicoes(self, eixo: str, valores) -> np.ndarray | None:
+        if valores is None:
+            return None
+        if isinstance(valores, str):
+            valores = [valores]
+        pos = self._pos[eixo]
+        faltando = [v for v in valores if v not in pos]
+        if faltando:
+            raise ValueError(f"{eixo} fora do cubo {self.dataset}: {', '.join(map(str, faltando))}")
+        return np.array(sorted(pos[v] for v in valores), dtype=np.int32)
+
+    def agregar(self, metrica: str | None, por: tuple = (), vcomps=None, municipios=None,
+                itens=None, grupos=None) -> np.ndarray:
+        """
+        Soma de 'metrica' (None: número de células presentes) agrupada pelos
+        eixos de 'por' (competencia, municipio, item, grupo), com filtros
+        opcionais em cada eixo (um código ou uma lista). O resultado tem um eixo
+        por entrada de 'por', na ordem pedida e no tamanho inteiro do eixo
+        (posições filtradas ficam 0).
+        """
+        for e in por:
+            if e not in EIXOS:
+                raise ValueError(f"eixo inválido: {e} (opções: {', '.join(EIXOS)})")
+        if "item" in por and "grupo" in por:
+            raise ValueError("agrupe por item ou por grupo, não pelos dois")
+        if metrica is not None and metrica not in self.metricas:
+            raise ValueError(f"métrica inválida: {metrica} (opções: {', '.join(self.metricas)})")
+
+        sc = self._posicoes("competencia", vcomps)
+        sm = self._posicoes("municipio", municipios)
+        si = self._posicoes("item", itens)
+        if grupos is not None:
+            sg = self._posicoes("grupo", grupos)
+            gi = np.flatnonzero(np.isin(self._grupo_item, sg)).astype(np.int32)
+            si = gi if si is None else np.intersect1d(si, gi)
+
+        k = None if metrica is None else self.metricas.index(metrica)
+        if self.formato == "denso":
+            return self._agregar_denso(k, por, sc, sm, si)
+        return self._agregar_esparso(k, por, sc, sm, si)
+
+    def _tamanho(self, eixo: str) -> int:
+        return len(self.rotulos(eixo))
+
+    def _agregar_denso(self, k, por, sc, sm, si) -> np.ndarray:
+        a = self.presente if k is None else self.valores[k]   # [comp, mun, item], ainda mapeado
+        sels = (sc, sm, si)
+        for ax, s in enumerate(sels):
+            if s is not None:
+                a = np.take(a, s, axis=ax)
+        canon = ("competencia", "municipio", "item")
+        eixo_item = "grupo" if "grupo" in por else "item"
+        manter = tuple(ax for ax, e in enumerate(canon) if e in por or (e == "item" and eixo_item in por))
+        somar = tuple(ax for ax in range(3) if ax not in manter)
+        r = a.sum(axis=somar, dtype=np.int64) if somar else np.asarray(a, dtype=np.int64)
+        nomes = [canon[ax] for ax in manter]
+        # volta ao tamanho inteiro de cada eixo mantido (filtros viram zeros)
+        for pos_r, ax in enumerate(manter):
+            s = sels[ax]
+            if canon[ax] == "item" and eixo_item == "grupo":
+                gi = self._grupo_item if s is None else self._grupo_item[s]
+                um = (gi[:, None] == np.arange(len(self.grupos))).astype(np.int64)
+                r = np.moveaxis(np.moveaxis(r, pos_r, -1) @ um, -1, pos_r)
+                nomes[pos_r] = "grupo"
+            elif s is not None:
+                cheio = np.zeros(r.shape[:pos_r] + (self._tamanho(canon[ax]),) + r.shape[pos_r + 1:], np.int64)
+                idx = [slice(None)] * r.ndim
+                idx[pos_r] = s
+                cheio[tuple(idx)] = r
+                r = cheio
+        return np.transpose(r, [nomes.index(e) for e in por]) if por else r
+
+    def _agregar_esparso(self, k, por, sc, sm, si) -> np.ndarray:
+        if sc is None and sm is None:
+            linhas = slice(None)
+        else:  # cada célula (comp, mun) é uma faixa contígua de linhas
+            M = len(self.municipios)
+            cs = np.arange(len(self.vcomps)) if sc is None else sc
+            ms = np.arange(M) if sm is None else sm
+            celulas = (cs[:, None].astype(np.int64) * M + ms).ravel()
+            inicio, fim = self.offsets[celulas], self.offsets[celulas + 1]
+            tam = fim - inicio
+            linhas = np.repeat(inicio - np.cumsum(tam) + tam, tam) + np.arange(tam.sum())
+        cols = {"competencia": self.comp[linhas], "municipio": self.mun[linhas], "item": self.item[linhas]}
+        v = None if k is None else self.valores[k][linhas]
+        if si is not None:
+            f = np.isin(cols["item"], si)
+            cols = {e: a[f] for e, a in cols.items()}
+            v = None if v is None else v[f]
+        if "grupo" in por:
+            cols["grupo"] = self._grupo_item[cols["item"]]
+        if not por:
+            return np.int64(len(cols["item"]) if v is None else v.sum(dtype=np.int64))
+        tamanhos = tuple(self._tamanho(e) for e in por)
+        chave = np.ravel_multi_index(tuple(cols[e] for e in por), tamanhos)
+        # pesos em float64: exatos até 2^53, folga de sobra para somas de INTEGER
+        r = np.bincount(chave, weights=None if v is None else v.astype(np.float64),
+                        minlength=int(np.prod(tamanhos)))
+        return r.astype(np.int64).reshape(tamanhos)
+
+    # ---------------- consultas prontas (mesmas respostas da api_painel) ----------------
+
+    def serie(self, metrica: str, municipio: str | None = None, item: str | None = None,
+              grupo: str | None = None) -> list[dict]:
+        filtros = dict(municipios=municipio, itens=item, grupos=grupo)
+        soma = self.agregar(metrica, por=("competencia",), **filtros)
+        n = self.agregar(None, por=("competencia",), **filtros)
+        return [{"vcomp": self.vcomps[p], "valor": int(soma[p])} for p in np.flatnonzero(n)]
+
+    def ranking(self, vcomp: str, metrica: str, item: str | None = None, grupo: str | None = None,
+                limite: int | None = None) -> list[dict]:
+        filtros = dict(vcomps=vcomp, itens=item, grupos=grupo)
+        soma = self.agregar(metrica, por=("municipio",), **filtros)
+        n = self.agregar(None, por=("municipio",), **filtros)
+        pos = np.flatnonzero(n)
+        pos = pos[np.lexsort((pos, -soma[pos]))]   # valor desc, codigo_municipio asc (eixo já ordenado)
+        info = self.manifesto["municipios"]
+        return [{"codigo_municipio": info[p][0], "municipio": info[p][1], "uf": info[p][2],
+                 "valor": int(soma[p])} for p in pos[:limite]]
+
+    def por_grupo(self, metrica: str, municipio: str | None = None, vcomps=None) -> np.ndarray:
+        """Matriz [competência, grupo] (rótulos: self.vcomps, self.grupos)."""
+        return self.agregar(metrica, por=("competencia", "grupo"), municipios=municipio, vcomps=vcomps)
+
+
+_abertos: dict[tuple[str, str], CuboCNES] = {}
+
+def abrir(raiz: str, dataset: str) -> CuboCNES:
+    """Cubo do processo para (raiz, dataset); reabre se houve export novo."""
+    chave = (os.path.abspath(raiz), dataset)
+    cubo = _abertos.get(chave)
+    if cubo is None:
+        cubo = _abertos[chave] = CuboCNES(raiz, dataset)
+    else:
+        cubo.atualizar()
+    return cubo
+
+# ------------------------------ medição ------------------------------
+
+def _sql_serie(conn, tabela, metrica, municipio):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT d.vcomp, SUM(f.{metrica})::bigint
+            FROM {tabela} f
+            JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+            JOIN dim_municipio  mu ON mu.municipio_id  = f.municipio_id
+            WHERE mu.codigo_municipio = %s
+            GROUP BY d.vcomp ORDER BY d.vcomp
+        """, (municipio,))
+        return [{"vcomp": v, "valor": int(s or 0)} for v, s in cur.fetchall()]
+
+def _sql_ranking(conn, tabela, metrica, vcomp):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT mu.codigo_municipio, mu.nome, mu.uf, SUM(f.{metrica})::bigint AS valor
+            FROM {tabela} f
+            JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+            JOIN dim_municipio  mu ON mu.municipio_id  = f.municipio_id
+            WHERE d.vcomp = %s
+            GROUP BY mu.codigo_municipio, mu.nome, mu.uf
+            ORDER BY valor DESC, mu.codigo_municipio
+        """, (vcomp,))
+        return [{"codigo_municipio": c, "municipio": n, "uf": uf, "valor": int(v or 0)}
+                for c, n, uf, v in cur.fetchall()]
+
+def _sql_por_grupo(conn, tabela, metrica):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT d.vcomp, i.grupo, SUM(f.{metrica})::bigint
+            FROM {tabela} f
+            JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+            JOIN dim_item_cnes   i ON i.item_id        = f.item_id
+            GROUP BY d.vcomp, i.grupo
+        """)
+        return {(v, g): int(s or 0) for v, g, s in cur.fetchall()}
+
+def medir(args):
+    """Mesmas consultas no Postgres e no cubo: confere os resultados e compara tempos."""
+    t0 = time.perf_counter()
+    cubo = CuboCNES(args.raiz, args.dataset)
+    t_abrir = time.perf_counter() - t0
+    tabela = cubo.manifesto["tabela"]
+    metrica = args.metrica or cubo.metricas[0]
+    municipio = cubo.municipios[len(cubo.municipios) // 2]
+    vcomp = cubo.vcomps[-1]
+    print(f"[CUBO] {args.dataset}: {cubo.formato}, {cubo.manifesto['linhas']} linha(s), "
+          f"{len(cubo.vcomps)} competência(s) x {len(cubo.municipios)} município(s) x {len(cubo.itens)} item(ns); "
+          f"abrir: {t_abrir * 1000:.1f} ms")
+
+    def no_cubo_por_grupo():
+        r = cubo.por_grupo(metrica)
+        n = cubo.agregar(None, por=("competencia", "grupo"))
+        return {(cubo.vcomps[c], cubo.grupos[g]): int(r[c, g]) for c, g in zip(*np.nonzero(n))}
+
+    consultas = [
+        ("série município", lambda c: _sql_serie(c, tabela, metrica, municipio),
+         lambda: cubo.serie(metrica, municipio=municipio)),
+        ("ranking vcomp", lambda c: _sql_ranking(c, tabela, metrica, vcomp),
+         lambda: cubo.ranking(vcomp, metrica)),
+        ("soma por grupo", lambda c: _sql_por_grupo(c, tabela, metrica), no_cubo_por_grupo),
+    ]
+    divergentes = 0
+    with conexao("leitura", DBConfig(), autocommit=True) as conn:
+        for nome, sql, npy in consultas:
+            tempos = {}
+            for lado, fn in (("pg", lambda: sql(conn)), ("cubo", npy)):
+                res = fn()  # aquece (cache do PG / páginas do cubo)
+                t0 = time.perf_counter()
+                for _ in range(args.repeticoes):
+                    fn()
+                tempos[lado] = (time.perf_counter() - t0) / args.repeticoes
+                if lado == "pg":
+                    esperado = res
+                elif res != esperado:
+                    divergentes += 1
+                    print(f"[CUBO] DIVERGÊNCIA em {nome}")
+            print(f"  {nome:16s} pg {tempos['pg'] * 1000:8.2f} ms   cubo {tempos['cubo'] * 1000:8.2f} ms   "
+                  f"{tempos['pg'] / max(tempos['cubo'], 1e-9):6.1f}x")
+    if divergentes:
+        sys.exit(1)
+
+def main():
+    ap = argparse.ArgumentParser(description="Cubo NumPy (memory map) dos fatos CNES")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("exportar", help="Materializa os fatos CNES em .npy")
+    ex.add_argument("--raiz", default="cubos")
+    ex.add_argument("--datasets", metavar="DS,DS", help="Padrão: " + ",".join(DATASETS_CUBO))
+    ex.add_argument("--formato", choices=FORMATOS, default="auto")
+    ex.add_argument("--forcar", action="store_true", help="Exporta mesmo sem mudança no fato")
+    me = sub.add_parser("medir", help="Compara consultas no Postgres e no cubo")
+    me.add_argument("--raiz", default="cubos")
+    me.add_argument("--dataset", choices=list(DATASETS_CUBO), default="leito")
+    me.add_argument("--metrica")
+    me.add_argument("--repeticoes", type=int, default=20)
+    args = ap.parse_args()
+
+    if args.cmd == "medir":
+        medir(args)
+        return
+    datasets = lista_csv(args.datasets) or list(DATASETS_CUBO)
+    invalidos = [d for d in datasets if d not in DATASETS_CUBO]
+    if invalidos:
+        ap.error(f"dataset(s) desconhecido(s): {', '.join(invalidos)}")
+    with conexao("leitura", DBConfig(), statement_timeout="0") as conn:
+        for ds in datasets:
+            exportar(conn, ds, args.raiz, args.formato, args.forcar)
+    imprimir_resumo()
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
 # db_utils.py
+import io
+import os
+import csv
+import time
+import random
 import psycopg2
+from operator import itemgetter
 from psycopg2.extras import execute_values
 from typing import Iterable, Mapping, Any
 from db_config import DBConfig, as_dsn
@@ -40,14 +46,19 @@ def get_or_create_competencia(conn, vcomp: str) -> int:
     ano = int(vcomp[:4]); mes = int(vcomp[4:6])
     data_ref = date(ano, mes, 1)
     with conn.cursor() as cur:
+        # DO NOTHING: ano/mes/data_ref derivam do vcomp, não há o que atualizar; e
+        # sem DO UPDATE a linha (a mesma para todos os escritores da competência) não é travada
         cur.execute("""
             INSERT INTO dim_competencia (vcomp, ano, mes, data_ref)
             VALUES (%s, %s, %s, %s)
-            ON CONFLICT (vcomp)
-            DO UPDATE SET ano=EXCLUDED.ano, mes=EXCLUDED.mes, data_ref=EXCLUDED.data_ref
+            ON CONFLICT (vcomp) DO NOTHING
             RETURNING competencia_id;
         """, (vcomp, ano, mes, data_ref))
-        return cur.fetchone()[0]
+        r = cur.fetchone()
+        if r is None:
+            cur.execute("SELECT competencia_id FROM dim_competencia WHERE vcomp = %s", (vcomp,))
+            r = cur.fetchone()
+        return r[0]
 
 def get_or_create_item(conn, tipo: str, codigo: str, grupo: str|None, descricao: str|None) -> int:
     with conn.cursor() as cur:
@@ -66,9 +77,17 @@ def upsert_dicts(
     table: str,
     rows: Iterable[Mapping[str, Any]],
     pkey_cols: list[str],
-    update_cols: list[str]
+    update_cols: list[str],
+    somente_alterados: bool = False
 ):
-    rows = list(rows)
+    """
+    somente_alterados=True: linhas existentes só são reescritas (e loaded_at só
+    avança) se alguma coluna de update_cols mudou; retorna quantas foram de fato
+    inseridas/atualizadas.
+    As linhas vão em ordem de chave: escritores concorrentes na mesma tabela
+    travam as linhas na mesma ordem (sem ciclo = sem deadlock entre páginas).
+    """
+    rows = sorted(rows, key=itemgetter(*pkey_cols))
     if not rows:
         return 0
 
@@ -78,13 +97,292 @@ def upsert_dicts(
     set_clause = ", ".join([f"{c}=EXCLUDED.{c}" for c in update_cols])
     pkeys = ", ".join(pkey_cols)
 
+    where = ""
+    if somente_alterados:
+        alvo = ", ".join(f"t.{c}" for c in update_cols)
+        novo = ", ".join(f"EXCLUDED.{c}" for c in update_cols)
+        where = f"WHERE ({alvo}) IS DISTINCT FROM ({novo}) RETURNING 1"
+
     sql = f"""
-        INSERT INTO {table} ({", ".join(cols)})
+        INSERT INTO {table} AS t ({", ".join(cols)})
         VALUES %s
         ON CONFLICT ({pkeys})
-        DO UPDATE SET {set_clause}, loaded_at=NOW();
+        DO UPDATE SET {set_clause}, loaded_at=NOW()
+        {where};
     """
 
     with conn.cursor() as cur:
+        if somente_alterados:
+            return len(execute_values(cur, sql, rows, template=template, page_size=1000, fetch=True))
         execute_values(cur, sql, rows, template=template, page_size=1000)
     return len(rows)
+
+def travar_celulas(conn, table: str, rows: list[Mapping[str, Any]]) -> int:
+    """
+    Trava, até o fim da transação e em ordem (competencia_id, municipio_id), as
+    células de 'rows' (advisory lock por tabela/competência/município). Para
+    upsert + remover_ausentes na mesma transação: dois refresh da mesma célula
+    passam a se enfileirar em vez de travar linhas um do outro. Um FOR UPDATE nas
+    linhas não basta: em READ COMMITTED ele não vê as linhas que outro escritor
+    inseriu depois do snapshot, e essas acabam travadas fora de ordem.
+    """
+    pares = sorted({(r["competencia_id"], r["municipio_id"]) for r in rows})
+    if not pares:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT count(pg_advisory_xact_lock(hashtext(%s || ':' || c), m))
+            FROM (SELECT c, m FROM unnest(%s::int[], %s::int[]) AS u(c, m) ORDER BY c, m) s
+        """, (table, [p[0] for p in pares], [p[1] for p in pares]))
+        return cur.fetchone()[0]
+
+def celulas_existentes(conn, vcomp: str, codigos_municipio) -> list[dict]:
+    """
+    {competencia_id, municipio_id} das células (vcomp, município) cujas dimensões já
+    existem — para remover_ausentes/travar_celulas de páginas que vieram vazias
+    (sem dimensão não há linha de fato a apagar; nada é criado aqui).
+    """
+    codigos = sorted(set(codigos_municipio))
+    if not codigos:
+        return []
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT d.competencia_id, m.municipio_id
+            FROM dim_competencia d, dim_municipio m
+            WHERE d.vcomp = %s AND m.codigo_municipio = ANY(%s::text[])
+            ORDER BY 1, 2
+        """, (vcomp, codigos))
+        return [{"competencia_id": c, "municipio_id": m} for c, m in cur.fetchall()]
+
+def remover_ausentes(conn, table: str, rows: list[Mapping[str, Any]], vazias=()) -> int:
+    """
+    Para cada (competencia_id, municipio_id) presente em 'rows', apaga os itens do
+    fato que não vieram mais na página (célula revisada para fora pelo CNES).
+    'vazias' ({competencia_id, municipio_id}, ver celulas_existentes) são células
+    buscadas com sucesso cuja página veio sem dados: todos os itens delas saem.
+    Cada chave apagada vira uma lápide em etl_remocao, na mesma transação, para
+    o change feed e a versão da API enxergarem a remoção.
+    """
+    chaves = sorted({(r["competencia_id"], r["municipio_id"], r["item_id"]) for r in rows})
+    celulas = sorted({(c[0], c[1]) for c in chaves} | {(v["competencia_id"], v["municipio_id"]) for v in vazias})
+    if not celulas:
+        return 0
+    # trava as linhas a apagar em ordem de PK (a mesma do upsert_dicts) antes do DELETE
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            WITH novos(competencia_id, municipio_id, item_id) AS (
+                SELECT * FROM unnest(%s::int[], %s::int[], %s::int[])
+            ), celulas(competencia_id, municipio_id) AS (
+                SELECT * FROM unnest(%s::int[], %s::int[])
+            ), alvo AS (
+                SELECT f.competencia_id, f.municipio_id, f.item_id FROM {table} f
+                WHERE (f.competencia_id, f.municipio_id) IN (SELECT competencia_id, municipio_id FROM celulas)
+                  AND NOT EXISTS (
+                    SELECT 1 FROM novos n
+                    WHERE n.competencia_id = f.competencia_id
+                      AND n.municipio_id = f.municipio_id
+                      AND n.item_id = f.item_id
+                  )
+                ORDER BY f.competencia_id, f.municipio_id, f.item_id
+                FOR UPDATE
+            ), apagadas AS (
+                DELETE FROM {table} f USING alvo a
+                WHERE (f.competencia_id, f.municipio_id, f.item_id) = (a.competencia_id, a.municipio_id, a.item_id)
+                RETURNING f.competencia_id, f.municipio_id, f.item_id
+            )
+            INSERT INTO etl_remocao (tabela, competencia_id, municipio_id, item_id)
+            SELECT %s, competencia_id, municipio_id, item_id FROM apagadas
+            ORDER BY competencia_id, municipio_id, item_id
+            ON CONFLICT (tabela, competencia_id, municipio_id, item_id)
+            DO UPDATE SET removido_em = EXCLUDED.removido_em
+        """, ([c[0] for c in chaves], [c[1] for c in chaves], [c[2] for c in chaves],
+              [c[0] for c in celulas], [c[1] for c in celulas], table))
+        return cur.rowcount
+
+def competencias_refresh(conn, table: str, competencias: list[str], n: int) -> list[str]:
+    """
+    Janela de refresh: as N últimas competências publicadas + as posteriores à
+    última já carregada em 'table' (fato com competencia_id).
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT MAX(d.vcomp) FROM {table} f
+            JOIN dim_competencia d ON d.competencia_id = f.competencia_id
+        """)
+        ultima = cur.fetchone()[0]
+    corte = competencias[-n] if 0 < n <= len(competencias) else (competencias[0] if competencias else None)
+    return [v for v in competencias if v >= corte or ultima is None or v > ultima]
+
+# ========= carga em lote (COPY + resolução de dimensões em massa) =========
+
+def resolver_competencias(conn, vcomps: Iterable[str]) -> dict[str, int]:
+    """
+    Garante dim_competencia para todos os vcomps e devolve {vcomp: competencia_id}
+    em um único round trip.
+    """
+    vals = []
+    for vcomp in sorted(set(vcomps)):
+        ano = int(vcomp[:4]); mes = int(vcomp[4:6])
+        vals.append((vcomp, ano, mes, date(ano, mes, 1)))
+    if not vals:
+        return {}
+    with conn.cursor() as cur:
+        res = execute_values(cur, """
+            INSERT INTO dim_competencia (vcomp, ano, mes, data_ref)
+            VALUES %s
+            ON CONFLICT (vcomp)
+            DO UPDATE SET ano=EXCLUDED.ano, mes=EXCLUDED.mes, data_ref=EXCLUDED.data_ref
+            RETURNING vcomp, competencia_id;
+        """, vals, page_size=1000, fetch=True)
+    return {v.strip(): i for v, i in res}
+
+def resolver_municipios(conn, municipios: Iterable[tuple[str, str, str]]) -> dict[str, int]:
+    """
+    municipios: (codigo_municipio, uf, nome). Devolve {codigo_municipio: municipio_id}.
+    """
+    uniq = {}
+    for codigo, uf, nome in municipios:
+        uniq[str(codigo)] = (str(codigo), uf, nome)
+    if not uniq:
+        return {}
+    vals = [uniq[k] for k in sorted(uniq)]
+    with conn.cursor() as cur:
+        res = execute_values(cur, """
+            INSERT INTO dim_municipio (codigo_municipio, uf, nome)
+            VALUES %s
+            ON CONFLICT (codigo_municipio)
+            DO UPDATE SET uf = EXCLUDED.uf, nome = EXCLUDED.nome
+            RETURNING codigo_municipio, municipio_id;
+        """, vals, page_size=1000, fetch=True)
+    return {c: i for c, i in res}
+
+def resolver_itens(conn, tipo: str, itens: Iterable[tuple[str, str | None, str | None]]) -> dict[str, int]:
+    """
+    itens: (codigo, grupo, descricao) de um mesmo 'tipo'. Devolve {codigo: item_id}.
+    Mesma semântica de get_or_create_item (descricao nula não apaga a existente).
+    """
+    uniq = {}
+    for codigo, grupo, descricao in itens:
+        uniq[str(codigo)] = (tipo, str(codigo), grupo, descricao)
+    if not uniq:
+        return {}
+    vals = [uniq[k] for k in sorted(uniq)]
+    with conn.cursor() as cur:
+        res = execute_values(cur, """
+            INSERT INTO dim_item_cnes (tipo, codigo, grupo, descricao)
+            VALUES %s
+            ON CONFLICT (tipo, codigo)
+            DO UPDATE SET grupo=EXCLUDED.grupo,
+                         descricao=COALESCE(EXCLUDED.descricao, dim_item_cnes.descricao)
+            RETURNING codigo, item_id;
+        """, vals, page_size=1000, fetch=True)
+    return {c: i for c, i in res}
+
+def criar_staging(conn, table: str) -> str:
+    """
+    Cria (ou recria) uma tabela temporária com as colunas de 'table', sem índices.
+    """
+    stg = f"stg_{table}"
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS pg_temp.{stg}")
+        cur.execute(f"CREATE TEMP TABLE {stg} (LIKE {table} INCLUDING DEFAULTS)")
+    return stg
+
+def copy_rows(conn, table: str, cols: list[str], rows: Iterable[tuple]) -> int:
+    """
+    COPY FROM STDIN (CSV) de tuplas já na ordem de 'cols'. None vira NULL.
+    """
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    n = 0
+    for r in rows:
+        w.writerow(["" if v is None else v for v in r])
+        n += 1
+    if not n:
+        return 0
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)", buf)
+    return n
+
+def merge_staging(
+    conn,
+    stg: str,
+    table: str,
+    pkey_cols: list[str],
+    update_cols: list[str],
+    agg: str | None = "SUM"
+) -> int:
+    """
+    INSERT ... SELECT da staging para 'table' com ON CONFLICT DO UPDATE.
+    agg="SUM" agrega duplicatas de chave (mesma regra dos dedupe_*_batch);
+    agg=None assume chave única na staging (DISTINCT ON descarta eventuais repetições).
+    """
+    pkeys = ", ".join(pkey_cols)
+    set_clause = ", ".join([f"{c}=EXCLUDED.{c}" for c in update_cols])
+    if agg:
+        sel = ", ".join(pkey_cols + [f"{agg}({c})" for c in update_cols])
+        src = f"SELECT {sel} FROM {stg} GROUP BY {pkeys} ORDER BY {pkeys}"  # ordem de trava determinística
+    else:
+        sel = ", ".join(pkey_cols + update_cols)
+        src = f"SELECT DISTINCT ON ({pkeys}) {sel} FROM {stg} ORDER BY {pkeys}"
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO {table} ({pkeys}, {", ".join(update_cols)})
+            {src}
+            ON CONFLICT ({pkeys})
+            DO UPDATE SET {set_clause}, loaded_at=NOW();
+        """)
+        n = cur.rowcount
+        cur.execute(f"DROP TABLE IF EXISTS pg_temp.{stg}")
+    return n
+
+# ========= escritas concorrentes: retentativa de deadlock / serialização =========
+
+RETENTATIVAS = int(os.getenv("DB_RETENTATIVAS", "6"))
+ERROS_TRANSITORIOS = {
+    "40P01": "deadlock",
+    "40001": "serialização",
+    "55P03": "lock_timeout",
+}
+retentativas = {motivo: 0 for motivo in ERROS_TRANSITORIOS.values()}
+
+def gravar_com_retentativa(conn, gravar, pendencias=(), tentativas: int = RETENTATIVAS, rotulo: str = ""):
+    """
+    Roda gravar(conn) + flush das 'pendencias' (CacheNegativo, AgendaColeta,
+    Checkpoint...) e faz commit — uma transação curta. Em deadlock, falha de
+    serialização ou lock_timeout: rollback, espera exponencial com jitter e
+    repete tudo (gravar precisa ser repetível: nada de consumir geradores).
+    As pendências só são limpas depois do commit. A versão dos datasets
+    publicados (eventos_carga.publicar_carga) avança logo após o commit, numa
+    transação curta à parte.
+    """
+    from eventos_carga import avancar_versoes, descartar_versoes  # eventos_carga importa db_utils
+
+    for tentativa in range(1, tentativas + 1):
+        try:
+            res = gravar(conn)
+            for p in pendencias:
+                p.flush(conn)
+            conn.commit()
+        except psycopg2.Error as e:
+            descartar_versoes(conn)
+            if conn.closed:
+                raise
+            conn.rollback()
+            motivo = ERROS_TRANSITORIOS.get(e.pgcode)
+            if motivo is None or tentativa == tentativas:
+                raise
+            retentativas[motivo] += 1
+            espera = min(2.0, 0.05 * 2 ** (tentativa - 1)) * random.uniform(0.5, 1.5)
+            print(f"[RETRY] {rotulo or 'gravação'}: {motivo} (tentativa {tentativa}/{tentativas}); "
+                  f"nova tentativa em {espera * 1000:.0f} ms")
+            time.sleep(espera)
+            continue
+        except BaseException:
+            descartar_versoes(conn)
+            raise
+        for p in pendencias:
+            p.limpar()
+        avancar_versoes(conn)
+        return res
@@ -0,0 +1,258 @@
+# descoberta_competencias.py
+"""
+Descobre quais competências o CNES já publicou, com o mínimo de requisições.
+
+- Última publicada: busca binária entre a última conhecida (cache) e o mês
+  corrente, sondando a página do próprio dataset (leito, equipamento,
+  tipo_unidade) para um município que sempre tem dados (MUNICIPIO_SONDA, a
+  capital). Publicação é monotônica (se AAAAMM saiu, os meses anteriores
+  também), então bastam ~log2(n) sondas.
+- Primeira execução (sem cache): se a competência inicial vier vazia (ex.: leito
+  só começa em 201202), avança mês a mês até INICIO_MAX_SONDAS procurando o
+  primeiro com dados; os meses vazios do caminho viram lacunas. Se nenhum tiver
+  dados, avisa com [WARN] e devolve a grade inteira até o mês corrente, sem
+  gravar cache (as células vazias caem no cache negativo).
+- Lacunas: com --lacunas, cada mês ainda não confirmado do intervalo é sondado
+  uma única vez; o resultado de meses antigos fica no cache para sempre e os
+  vazios recentes (até LACUNA_RECHECAR_MESES da última publicada) são revistos.
+- O resultado fica em cache (JSON) por CACHE_TTL_HORAS, um arquivo por dataset
+  e competência inicial: dentro desse prazo, nenhuma sonda é feita.
+- As sondas passam pelo cliente_cnes (retry de transitórios com backoff, AIMD,
+  limite global). Se uma sonda falha mesmo assim, a descoberta não derruba a
+  carga: fica com a maior competência já confirmada (no mínimo a 'ultima' do
+  cache), avisa com [WARN] e não renova o cache, para a próxima execução sondar
+  de novo.
+
+Lacunas só são procuradas com --lacunas (CLI) ou lacunas=True: os loaders e
+scrapers não passam isso, então no caminho normal nenhuma lacuna nova é
+descoberta — a grade vai até a última publicada e um mês sem dados custa uma
+volta pelos municípios, cujas células vazias caem no cache negativo
+(cache_negativo.py). Rode `python descoberta_competencias.py --lacunas` de vez
+em quando para tirar esses meses da grade.
+
+Uso na carga:
+    competencias = competencias_publicadas(VCOMP_INICIO, VCOMP_FIM, dataset="leito")
+
+CLI:
+    python descoberta_competencias.py [--dataset leito] [--inicio 201201] [--lacunas] [--forcar]
+"""
+
+import os
+import json
+import argparse
+from datetime import date, datetime, timezone, timedelta
+
+# -------------------- Config --------------------
+MUNICIPIO_SONDA = "140010"  # Boa Vista (capital de RR): tem dados em todas as competências publicadas
+CACHE_DIR = os.getenv("CNES_CACHE_DIR", ".cache_painel")
+CACHE_TTL_HORAS = 12
+LACUNA_RECHECAR_MESES = 6
+INICIO_MAX_SONDAS = 24      # meses sondados à frente da inicial, na primeira execução
+VCOMP_INICIO_PADRAO = "201201"
+DATASET_PADRAO = "leito"
+
+# dataset -> (módulo do scraper, função de parse); a URL e os headers vêm do módulo
+SONDAS = {
+    "leito":        ("scrape_cnes_leito", "parse_tabela_tipo_leito"),
+    "equipamento":  ("scrape_cnes_rr_equipamentos", "parse_equipamentos"),
+    "tipo_unidade": ("scrape_cnes_rr_tipo_unidade", "parse_tipos_unidade"),
+}
+
+
+def vcomp_str(v) -> str | None:
+    """Aceita 'AAAAMM', (ano, mes) ou None."""
+    if v is None:
+        return None
+    if isinstance(v, (tuple, list)):
+        return f"{int(v[0]):04d}{int(v[1]):02d}"
+    return str(v)
+
+def _mes_seguinte(vcomp: str, n: int = 1) -> str:
+    y, m = int(vcomp[:4]), int(vcomp[4:6]) - 1 + n
+    return f"{y + m // 12:04d}{m % 12 + 1:02d}"
+
+def _meses(inicio: str, fim: str) -> list[str]:
+    out, v = [], inicio
+    while v <= fim:
+        out.append(v)
+        v = _mes_seguinte(v)
+    return out
+
+def cache_arquivo(dataset: str = DATASET_PADRAO, inicio: str = VCOMP_INICIO_PADRAO) -> str:
+    """Um cache por (dataset, competência inicial): grades diferentes não se misturam."""
+    return os.path.join(CACHE_DIR, f"competencias_cnes_{dataset}_{inicio}.json")
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+# -------------------- sonda --------------------
+
+class SondaFalhou(RuntimeError):
+    """A sonda não obteve resposta conclusiva (falha de rede/HTTP/parse já com retries)."""
+
+
+def sondar(vcomp: str, dataset: str = DATASET_PADRAO) -> bool:
+    """
+    True se a competência tem dados publicados para MUNICIPIO_SONDA na página do dataset.
+    Levanta SondaFalhou quando não dá para concluir nada (nada vai para o cache).
+    """
+    import importlib
+    from cliente_cnes import buscar_pagina
+
+    nome_mod, nome_parse = SONDAS[dataset]
+    mod = importlib.import_module(nome_mod)
+    df = buscar_pagina(dataset, mod.CNES_URL, {"VEstado": mod.UF_CODE, "VMun": MUNICIPIO_SONDA, "VComp": vcomp},
+                       getattr(mod, nome_parse), MUNICIPIO_SONDA, vcomp, headers=mod.HEADERS, timeout=mod.TIMEOUT)
+    if df is None:
+        raise SondaFalhou(f"sonda {MUNICIPIO_SONDA} VComp={vcomp} sem resposta conclusiva")
+    return not df.empty
+
+# -------------------- cache --------------------
+
+def carregar_cache(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"ultima": None, "verificado_em": None, "confirmadas": [], "vazias": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def salvar_cache(cache: dict, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def _cache_valido(cache: dict) -> bool:
+    if not cache.get("ultima") or not cache.get("verificado_em"):
+        return False
+    t = datetime.fromisoformat(cache["verificado_em"])
+    return _agora() - t < timedelta(hours=CACHE_TTL_HORAS)
+
+# -------------------- descoberta --------------------
+
+def descobrir(inicio: str = VCOMP_INICIO_PADRAO, lacunas: bool = False, forcar: bool = False,
+              dataset: str = DATASET_PADRAO, sonda=None, cache_path: str | None = None) -> dict:
+    """
+    Atualiza e devolve o cache: {'ultima', 'confirmadas', 'vazias', 'verificado_em', 'sondas'}.
+    'confirmadas' = sondadas com dados; 'vazias' = sondadas sem dados (lacunas), com a data.
+    """
+    if sonda is None:
+        sonda = lambda v: sondar(v, dataset)
+    cache_path = cache_path or cache_arquivo(dataset, inicio)
+    cache = carregar_cache(cache_path)
+    if _cache_valido(cache) and not forcar and not lacunas:
+        cache["sondas"] = 0
+        return cache
+
+    hoje = date.today()
+    teto = f"{hoje.year:04d}{hoje.month:02d}"
+    confirmadas = set(cache.get("confirmadas", []))
+    vazias = dict(cache.get("vazias", {}))
+    sondas = 0
+
+    def sondar_registrando(v: str, lacuna: bool) -> bool:
+        nonlocal sondas
+        sondas += 1
+        ok = sonda(v)
+        if ok:
+            confirmadas.add(v)
+            vazias.pop(v, None)
+        elif lacuna:
+            vazias[v] = _agora().isoformat(timespec="seconds")
+        return ok
+
+    # ---- última publicada: busca binária em [lo, teto] ----
+    lo = cache.get("ultima")
+    try:
+        if lo is None:
+            # primeira execução: a inicial pode ser anterior ao começo da série
+            for v in _meses(inicio, teto)[:INICIO_MAX_SONDAS]:
+                if sondar_registrando(v, lacuna=True):
+                    lo = v
+                    break
+            if lo is None:
+                print(f"[WARN] {dataset}: nenhuma competência com dados para a sonda {MUNICIPIO_SONDA} "
+                      f"em {INICIO_MAX_SONDAS} mês(es) a partir de {inicio}; enumerando {inicio}..{teto} "
+                      f"sem filtro. Cache não gravado.")
+                return {"ultima": teto, "verificado_em": None, "confirmadas": sorted(confirmadas),
+                        "vazias": {}, "sondas": sondas}
+            if lo != inicio:
+                print(f"[DESC] {dataset}: série começa em {lo} (meses anteriores viram lacunas)")
+        meses = _meses(lo, teto)
+        a, b = 0, len(meses) - 1  # invariante: meses[a] publicado
+        while a < b:
+            meio = (a + b + 1) // 2
+            if sondar_registrando(meses[meio], lacuna=False):
+                a = meio
+            else:
+                b = meio - 1
+        ultima = meses[a]
+
+        # ---- lacunas: sonda só o que nunca foi confirmado (vazias recentes são revistas) ----
+        if lacunas:
+            limite_recheck = _mes_seguinte(ultima, -LACUNA_RECHECAR_MESES)
+            for v in _meses(inicio, ultima):
+                if v in confirmadas:
+                    continue
+                if v in vazias and v < limite_recheck:
+                    continue
+                sondar_registrando(v, lacuna=True)
+    except SondaFalhou as e:
+        # sem cache e sem nenhuma sonda concluída, o melhor palpite seguro é a inicial
+        conhecida = max(confirmadas | {lo or inicio})
+        print(f"[WARN] descoberta de competências interrompida ({e}); "
+              f"usando a última confirmada: {conhecida}. Cache não renovado.")
+        parcial = {"ultima": conhecida, "verificado_em": cache.get("verificado_em"),
+                   "confirmadas": sorted(confirmadas), "vazias": vazias}
+        if conhecida in confirmadas:
+            # o progresso fica (a próxima busca parte daqui), mas sem renovar o TTL
+            salvar_cache(parcial, cache_path)
+        parcial["sondas"] = sondas
+        return parcial
+
+    cache = {
+        "ultima": ultima,
+        "verificado_em": _agora().isoformat(timespec="seconds"),
+        "confirmadas": sorted(confirmadas),
+        "vazias": vazias,
+    }
+    salvar_cache(cache, cache_path)
+    cache["sondas"] = sondas
+    return cache
+
+def intervalo_competencias(inicio, fim) -> list[str]:
+    """Todos os meses de [inicio, fim], sem sondar: para quando a carga recebe o intervalo explícito."""
+    return _meses(vcomp_str(inicio), vcomp_str(fim))
+
+def ultima_publicada(**kw) -> str:
+    return descobrir(**kw)["ultima"]
+
+def competencias_publicadas(inicio=None, fim=None, **kw) -> list[str]:
+    """
+    Grade de competências com dados: [inicio, min(fim, última publicada)] sem as lacunas conhecidas.
+    'inicio'/'fim' aceitam 'AAAAMM', (ano, mes) ou None. Lacunas novas só entram
+    com lacunas=True (ver docstring do módulo); os loaders não passam.
+    Nunca levanta por falha de rede na sonda (ver descobrir).
+    """
+    inicio = vcomp_str(inicio) or VCOMP_INICIO_PADRAO
+    cache = descobrir(inicio=inicio, **kw)
+    fim = min(vcomp_str(fim) or cache["ultima"], cache["ultima"])
+    vazias = cache.get("vazias", {})
+    return [v for v in _meses(inicio, fim) if v not in vazias]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Descobre competências CNES publicadas")
+    ap.add_argument("--dataset", default=DATASET_PADRAO, choices=sorted(SONDAS))
+    ap.add_argument("--inicio", default=VCOMP_INICIO_PADRAO)
+    ap.add_argument("--lacunas", action="store_true", help="Sonda meses ainda não verificados para achar lacunas")
+    ap.add_argument("--forcar", action="store_true", help="Ignora o TTL do cache")
+    args = ap.parse_args()
+
+    cache = descobrir(inicio=args.inicio, lacunas=args.lacunas, forcar=args.forcar, dataset=args.dataset)
+    print(f"[DESC] última publicada: {cache['ultima']} (sondas={cache['sondas']})")
+    lac = sorted(v for v in cache.get("vazias", {}) if v >= args.inicio)
+    print(f"[DESC] lacunas conhecidas: {', '.join(lac) if lac else 'nenhuma'}")
+
+if __name__ == "__main__":
+    main()
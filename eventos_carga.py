@@ -0,0 +1,149 @@
+# eventos_carga.py
+"""
+Eventos de conclusão de carga via LISTEN/NOTIFY do Postgres.
+
+Publicação (nos loaders):
+    publicar_carga(conn, "leito", municipios=["140010", ...], vcomp="202401")
+    conn.commit()
+
+  O NOTIFY é transacional: só é entregue aos ouvintes quando a transação da
+  carga faz COMMIT (e é descartado num ROLLBACK). Por isso chame ANTES do commit.
+
+  publicar_carga também marca o dataset para avançar a versão em
+  etl_versao_dataset: é o que a API consulta para validar o cache (uma linha por
+  dataset, em vez de MAX(loaded_at) sobre os fatos). O incremento NÃO entra na
+  transação da carga — a linha ficaria travada até o commit e cargas paralelas
+  do mesmo dataset andariam em fila. db_utils.gravar_com_retentativa chama
+  avancar_versoes(conn) logo depois do COMMIT, numa transação curta só dela
+  (e descartar_versoes no ROLLBACK). Quem comita por conta própria faz o mesmo:
+
+    publicar_carga(conn, "leito", ...); conn.commit(); avancar_versoes(conn)
+
+  A versão avança sempre depois dos dados: um leitor pode ver dados novos com a
+  versão antiga (e recalcular na próxima leitura), nunca o contrário.
+
+Assinatura (consumidores):
+    for ev in escutar(DBConfig(), datasets={"leito"}):
+        print(ev["dataset"], ev["vcomp"], ev["municipios"])
+
+Payload (JSON):
+    {"dataset": "leito"|"equipamento"|"tipo_unidade"|"siops",
+     "vcomp": "AAAAMM"|null, "ano": int|null, "periodo": str|null,
+     "municipios": ["140010", ...]}
+"""
+
+import json
+import select
+import threading
+import weakref
+
+import psycopg2
+
+from db_config import DBConfig
+from db_utils import get_conn
+
+CANAL = "painel_carga"
+MAX_PAYLOAD = 7000  # limite do Postgres é 8000 bytes; deixa folga
+MUNICIPIOS_POR_EVENTO = 400
+
+# conexão -> datasets publicados na transação corrente (versão a avançar após o commit)
+_versoes_pendentes = weakref.WeakKeyDictionary()
+_versoes_lock = threading.Lock()
+
+
+def _payloads(dataset: str, municipios: list[str], vcomp=None, ano=None, periodo=None):
+    base = {"dataset": dataset, "vcomp": vcomp, "ano": ano, "periodo": periodo}
+    municipios = sorted(set(municipios))
+    if not municipios:
+        yield json.dumps({**base, "municipios": []}, ensure_ascii=False)
+        return
+    for i in range(0, len(municipios), MUNICIPIOS_POR_EVENTO):
+        p = json.dumps({**base, "municipios": municipios[i:i + MUNICIPIOS_POR_EVENTO]}, ensure_ascii=False)
+        if len(p.encode("utf-8")) > MAX_PAYLOAD:
+            raise ValueError("payload de NOTIFY excede o limite; reduza MUNICIPIOS_POR_EVENTO")
+        yield p
+
+def publicar_carga(conn, dataset: str, municipios, vcomp: str | None = None,
+                   ano: int | None = None, periodo: str | None = None) -> int:
+    """
+    Enfileira NOTIFY(s) na transação corrente de 'conn' e marca a versão do
+    dataset para avançar depois do commit (avancar_versoes). Retorna quantos eventos.
+    Listas grandes de municípios são quebradas em vários eventos.
+    """
+    with _versoes_lock:
+        _versoes_pendentes.setdefault(conn, set()).add(dataset)
+    n = 0
+    with conn.cursor() as cur:
+        for payload in _payloads(dataset, list(municipios), vcomp, ano, periodo):
+            cur.execute("SELECT pg_notify(%s, %s)", (CANAL, payload))
+            n += 1
+    return n
+
+def avancar_versoes(conn) -> list[str]:
+    """
+    Depois do COMMIT da carga: +1 na versão de cada dataset publicado em 'conn',
+    numa transação curta (a linha fica travada só o tempo do UPDATE). Uma falha
+    aqui não desfaz a carga: avisa e segue (os eventos da carga já invalidaram o
+    cache da API; a próxima carga do dataset avança a versão).
+    """
+    with _versoes_lock:
+        datasets = sorted(_versoes_pendentes.pop(conn, ()))
+    if not datasets:
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO etl_versao_dataset (dataset, versao)
+                SELECT unnest(%s::text[]), 1
+                ON CONFLICT (dataset)
+                DO UPDATE SET versao = etl_versao_dataset.versao + 1, atualizado_em = NOW()
+            """, (datasets,))
+        conn.commit()
+    except psycopg2.Error as e:
+        if not conn.closed:
+            conn.rollback()
+        print(f"[WARN] versão de {', '.join(datasets)} não avançada após a carga: {e.pgerror or e}")
+    return datasets
+
+def descartar_versoes(conn):
+    """ROLLBACK da carga: o que publicar_carga marcou em 'conn' não vale mais."""
+    with _versoes_lock:
+        _versoes_pendentes.pop(conn, None)
+
+def escutar(cfg: DBConfig, datasets: set[str] | None = None, timeout: float = 5.0, parar=None):
+    """
+    Gerador de eventos (dicts) publicados por publicar_carga.
+    - datasets: filtra por dataset (None = todos)
+    - timeout: intervalo de espera no select(); a cada volta checa 'parar'
+    - parar: callable opcional; quando retornar True o gerador termina
+    """
+    conn = get_conn(cfg)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CANAL}")
+        while not (parar and parar()):
+            if select.select([conn], [], [], timeout) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                n = conn.notifies.pop(0)
+                try:
+                    ev = json.loads(n.payload)
+                except ValueError:
+                    print(f"[EVT] payload inválido ignorado: {n.payload[:80]!r}")
+                    continue
+                if datasets is None or ev.get("dataset") in datasets:
+                    yield ev
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # depuração: imprime os eventos à medida que chegam
+    print(f"[EVT] Escutando canal '{CANAL}' (Ctrl+C para sair)")
+    try:
+        for ev in escutar(DBConfig()):
+            print(json.dumps(ev, ensure_ascii=False))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,49 @@
+# importacao_tardia.py
+"""
+Import tardio de dependências pesadas (pandas, bs4, requests, selenium...).
+
+    pd = tardio("pandas")
+    BeautifulSoup = tardio("bs4", "BeautifulSoup")
+
+O módulo só é importado no primeiro acesso a um atributo (pd.DataFrame) ou na
+primeira chamada (BeautifulSoup(html, "lxml")). Assim o --help, a validação de
+argumentos e os caminhos que não parseiam nada (etapa do banco, competências já
+carregadas) não pagam centenas de ms de import. Os módulos que usam nomes
+tardios em anotações precisam de `from __future__ import annotations`.
+
+Orçamento de import dos pontos de entrada: medir_importacao.py.
+"""
+
+import importlib
+
+
+class _Tardio:
+    __slots__ = ("_modulo", "_atributo", "_alvo")
+
+    def __init__(self, modulo: str, atributo: str | None = None):
+        self._modulo = modulo
+        self._atributo = atributo
+        self._alvo = None
+
+    def _carregar(self):
+        alvo = self._alvo
+        if alvo is None:
+            alvo = importlib.import_module(self._modulo)  # o lock de import já serializa threads
+            if self._atributo:
+                alvo = getattr(alvo, self._atributo)
+            self._alvo = alvo
+        return alvo
+
+    def __getattr__(self, nome):
+        return getattr(self._carregar(), nome)
+
+    def __call__(self, *args, **kwargs):
+        return self._carregar()(*args, **kwargs)
+
+    def __repr__(self):
+        alvo = self._modulo + (f".{self._atributo}" if self._atributo else "")
+        return f"<tardio {alvo} ({'carregado' if self._alvo is not None else 'pendente'})>"
+
+
+def tardio(modulo: str, atributo: str | None = None):
+    return _Tardio(modulo, atributo)
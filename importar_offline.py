@@ -0,0 +1,384 @@
+# importar_offline.py
+"""
+Importa para o banco, sem tocar a rede, as saídas dos scrapers standalone:
+
+  - CSVs CNES (SAIDA_ARQUIVO ou por mês), ex.:
+      cnes_rr_tipo_leito_201202_202508.csv   -> fato_cnes_leito
+      cnes_rr_equipamentos_202401.csv        -> fato_cnes_equipamento
+      cnes_rr_tipo_unidade_201202_202508.csv -> fato_cnes_tipo_unidade
+  - árvore do scraper_siops.py:
+      siops_csv/<municipio>/<ano>/periodo_<p>/siops_tableNN_<slug>.csv -> siops_tabelas
+  - saída colunar particionada (saida_particionada.py), ex.:
+      saida_cnes/leito/   saida_cnes/equipamento/   saida_siops/siops/
+
+Fluxo CNES: lê o CSV em blocos (pandas chunksize), normaliza cabeçalhos com o mesmo
+_fix_headers do loader correspondente, resolve as dimensões em massa (um INSERT ...
+RETURNING por dimensão e bloco) e faz COPY para uma staging temporária. No fim, um
+único INSERT ... SELECT ... GROUP BY ... ON CONFLICT leva tudo para o fato (somando
+duplicatas de chave, como os dedupe_*_batch dos loaders).
+
+Os scrapers gravam o CSV em append (mode="a"): rodar de novo sobre o mesmo arquivo
+repete o cabeçalho no meio dos dados e repete meses. Linhas com VComp não numérico
+(cabeçalhos repetidos) são descartadas, e cada célula (VComp, município) vale só
+pela última sequência de linhas em que aparece (a última execução): o SUM fica
+só para itens repetidos dentro de uma mesma página.
+
+SIOPS: o município vem do nome da pasta (slug); é resolvido contra dim_municipio,
+então rode antes ao menos uma carga CNES (ou qualquer coisa que popule dim_municipio).
+
+Uso:
+  python importar_offline.py cnes_rr_tipo_leito_201202_202508.csv
+  python importar_offline.py --dataset equipamento saida_equip.csv
+  python importar_offline.py siops_csv/
+  python importar_offline.py saida_cnes/leito saida_siops/siops
+  python importar_offline.py --backfill saida_cnes/leito   # carga inicial: índices adiados (backfill_carga.py)
+"""
+
+import os
+import re
+import csv
+import json
+import argparse
+import importlib
+import contextlib
+
+import pandas as pd
+
+from db_config import DBConfig
+from db_utils import (
+    resolver_competencias, resolver_municipios, resolver_itens,
+    criar_staging, copy_rows, merge_staging, gravar_com_retentativa
+)
+from eventos_carga import publicar_carga
+from pool_db import conexao, imprimir_resumo
+
+CHUNKSIZE = 50_000
+PKEY_FATO = ["competencia_id", "municipio_id", "item_id"]
+
+DATASETS_CSV = {
+    "leito": {
+        "prefixos": ("cnes_rr_tipo_leito",),
+        "tipo": "leito",
+        "tabela": "fato_cnes_leito",
+        "loader": "cnes_tipo_leito_to_pg",
+        "metricas": {"Existente": "existente", "SUS": "sus", "Habilitados": "habilitados"},
+        "colunas_total": ["Grupo", "Codigo"],
+    },
+    "equipamento": {
+        "prefixos": ("cnes_rr_equipamentos",),
+        "tipo": "equipamento",
+        "tabela": "fato_cnes_equipamento",
+        "loader": "cnes_equipamentos_to_pg",
+        "metricas": {"Existentes": "existentes", "Em Uso": "em_uso",
+                     "Existentes SUS": "existentes_sus", "Em Uso SUS": "em_uso_sus"},
+        "colunas_total": ["Grupo", "Codigo", "Descricao"],
+    },
+    "tipo_unidade": {
+        "prefixos": ("cnes_rr_tipo_unidade",),
+        "tipo": "tipo_unidade",
+        "tabela": "fato_cnes_tipo_unidade",
+        "loader": "cnes_tipo_unidade_to_pg",
+        "metricas": {"Total": "total"},
+        "colunas_total": ["Grupo", "Codigo"],
+    },
+}
+
+RE_SIOPS_ARQ = re.compile(r"siops_table(\d+)_.*\.csv$", re.IGNORECASE)
+
+
+def detectar_dataset(path: str) -> str | None:
+    nome = os.path.basename(path).lower()
+    for ds, spec in DATASETS_CSV.items():
+        if nome.startswith(spec["prefixos"]):
+            return ds
+    return None
+
+def _opcional(v):
+    return None if pd.isna(v) else str(v)
+
+# ------------------------------ CNES ------------------------------
+
+def importar_blocos_cnes(conn, blocos, dataset: str, origem: str) -> int:
+    """
+    Carrega uma sequência de DataFrames no formato de saída dos scrapers CNES
+    (VComp, UF, Codigo_Municipio, Municipio, Grupo, Codigo, Descricao, métricas...).
+    """
+    spec = DATASETS_CSV[dataset]
+    fix_headers = importlib.import_module(spec["loader"])._fix_headers
+    metricas = spec["metricas"]
+    cols_db = PKEY_FATO + list(metricas.values())
+
+    stg = criar_staging(conn, spec["tabela"])
+    with conn.cursor() as cur:  # sequência de linhas contíguas de uma célula = uma página
+        cur.execute(f"ALTER TABLE {stg} ADD COLUMN pagina BIGINT NOT NULL")
+    lidas = 0
+    afetados = {}  # vcomp -> {codigo_municipio}
+    paginas, ultima_celula = 0, None
+    cabecalhos = 0
+
+    for bloco in blocos:
+        df = fix_headers(bloco)
+        faltando = [c for c in ("VComp", "Codigo_Municipio", "Codigo", "Descricao") if c not in df.columns]
+        if faltando:
+            raise ValueError(f"{origem}: colunas ausentes após normalização: {faltando} (colunas={list(df.columns)})")
+        df = df.astype({"VComp": str, "Codigo_Municipio": str, "Codigo": str})
+        # cabeçalho repetido por um append no mesmo CSV (ou lixo): VComp não é AAAAMM
+        valida = df["VComp"].str.fullmatch(r"\d{6}")
+        if not valida.all():
+            cabecalhos += int((~valida).sum())
+            df = df[valida]
+        if "Grupo" not in df.columns:
+            df["Grupo"] = pd.NA
+        if "UF" not in df.columns:
+            df["UF"] = "RR"
+        if "Municipio" not in df.columns:
+            df["Municipio"] = df["Codigo_Municipio"]
+
+        # remove TOTALs (mesmas colunas que o _is_total_row do loader olha); coluna a
+        # coluna, vetorizado — o join por linha custava ~80% do import
+        total = pd.Series(False, index=df.index)
+        for c in spec["colunas_total"]:
+            total |= df[c].fillna("").astype(str).str.upper().str.contains("TOTAL", regex=False)
+        df = df[~total]
+        if df.empty:
+            continue
+
+        for src in metricas:
+            if src not in df.columns:
+                df[src] = 0
+            df[src] = pd.to_numeric(df[src], errors="coerce").fillna(0).astype("int64")
+
+        comp_ids = resolver_competencias(conn, df["VComp"].unique())
+        mun_ids = resolver_municipios(conn, df[["Codigo_Municipio", "UF", "Municipio"]]
+                                      .drop_duplicates().itertuples(index=False, name=None))
+        itens = df[["Codigo", "Grupo", "Descricao"]].drop_duplicates("Codigo", keep="last")
+        item_ids = resolver_itens(conn, spec["tipo"], (
+            (c, _opcional(g), _opcional(d)) for c, g, d in itens.itertuples(index=False, name=None)
+        ))
+
+        # numera as páginas: muda a célula, nova página (continua entre blocos)
+        celula = df["VComp"] + "|" + df["Codigo_Municipio"]
+        nova = celula.ne(celula.shift(fill_value=ultima_celula))
+        pagina = paginas + nova.cumsum()
+        paginas, ultima_celula = int(pagina.iloc[-1]), celula.iloc[-1]
+
+        sub = df[["VComp", "Codigo_Municipio", "Codigo"] + list(metricas)]
+        lidas += copy_rows(conn, stg, cols_db + ["pagina"], (
+            (comp_ids[v], mun_ids[m], item_ids[c], *vals, p)
+            for (v, m, c, *vals), p in zip(sub.itertuples(index=False, name=None), pagina)
+        ))
+        for v, m in df[["VComp", "Codigo_Municipio"]].drop_duplicates().itertuples(index=False, name=None):
+            afetados.setdefault(v, set()).add(m)
+        conn.commit()  # dimensões do bloco liberadas já; a staging temporária sobrevive ao commit
+
+    if cabecalhos:
+        print(f"[IMP] {origem}: {cabecalhos} linha(s) com VComp inválido descartada(s) (cabeçalho repetido?)")
+
+    def gravar(conn):
+        with conn.cursor() as cur:
+            # célula repetida (CSV rodado de novo em append): vale a última página
+            cur.execute(f"""
+                DELETE FROM {stg} s USING (
+                    SELECT competencia_id, municipio_id, MAX(pagina) AS pagina
+                    FROM {stg} GROUP BY competencia_id, municipio_id
+                ) u
+                WHERE s.competencia_id = u.competencia_id AND s.municipio_id = u.municipio_id
+                  AND s.pagina < u.pagina
+            """)
+            if cur.rowcount:
+                print(f"[IMP] {origem}: {cur.rowcount} linha(s) de células repetidas substituídas pela última ocorrência")
+        n = merge_staging(conn, stg, spec["tabela"], PKEY_FATO, list(metricas.values()), agg="SUM")
+        for vcomp, muns in sorted(afetados.items()):
+            publicar_carga(conn, dataset, muns, vcomp=vcomp)
+        return n
+
+    n = gravar_com_retentativa(conn, gravar, rotulo=f"{origem} merge")
+    print(f"[IMP] {origem} -> {spec['tabela']}: {lidas} linha(s) lidas, {n} upsert, "
+          f"{len(afetados)} competência(s)")
+    return n
+
+def importar_csv_cnes(conn, path: str, dataset: str, chunksize: int = CHUNKSIZE) -> int:
+    blocos = pd.read_csv(path, dtype=str, chunksize=chunksize)
+    return importar_blocos_cnes(conn, blocos, dataset, os.path.basename(path))
+
+def importar_particoes(conn, dir_dataset: str) -> int:
+    """
+    Diretório <raiz>/<dataset>/ com manifest.json (saida_particionada.py).
+    Cada partição vira um bloco; SIOPS vai direto para a staging de siops_tabelas.
+    """
+    from saida_particionada import carregar_manifesto, ler_particao
+
+    raiz, dataset = os.path.split(os.path.normpath(dir_dataset))
+    manifesto = carregar_manifesto(raiz, dataset)
+    arquivos = [os.path.join(dir_dataset, meta["arquivo"])
+                for _, meta in sorted(manifesto.get("particoes", {}).items())]
+    blocos = (ler_particao(a).to_pandas() for a in arquivos)
+
+    if dataset == "siops":
+        return importar_blocos_siops(conn, blocos, dir_dataset)
+    if dataset not in DATASETS_CSV:
+        raise ValueError(f"{dir_dataset}: dataset '{dataset}' desconhecido")
+    return importar_blocos_cnes(conn, blocos, dataset, dir_dataset)
+
+# ------------------------------ SIOPS ------------------------------
+
+def _catalogo_slug_municipios(conn) -> dict[str, tuple[int, str]]:
+    from scraper_siops import slugify
+    with conn.cursor() as cur:
+        cur.execute("SELECT municipio_id, codigo_municipio, nome FROM dim_municipio")
+        return {slugify(nome): (mid, cod) for mid, cod, nome in cur.fetchall()}
+
+def iter_arquivos_siops(raiz: str):
+    """
+    Gera (slug_municipio, ano, periodo, tabela_idx, caminho) da árvore siops_csv/.
+    """
+    for dirpath, _, arquivos in os.walk(raiz):
+        partes = os.path.relpath(dirpath, raiz).split(os.sep)
+        if len(partes) < 3 or not partes[-1].startswith("periodo_"):
+            continue
+        slug, ano, periodo = partes[-3], partes[-2], partes[-1][len("periodo_"):]
+        if not ano.isdigit():
+            continue
+        for arq in sorted(arquivos):
+            m = RE_SIOPS_ARQ.match(arq)
+            if m:
+                yield slug, int(ano), periodo, int(m.group(1)), os.path.join(dirpath, arq)
+
+def importar_arvore_siops(conn, raiz: str) -> int:
+    from tabela_siops import guess_title_from_table
+
+    catalogo = _catalogo_slug_municipios(conn)
+    stg = criar_staging(conn, "siops_tabelas")
+    cols = ["municipio_id", "ano", "periodo", "tabela_idx", "titulo", "matrix"]
+    desconhecidos, afetados = set(), {}
+
+    def linhas():
+        for slug, ano, periodo, idx, path in iter_arquivos_siops(raiz):
+            if slug not in catalogo:
+                desconhecidos.add(slug)
+                continue
+            mun_id, cod = catalogo[slug]
+            with open(path, newline="", encoding="utf-8") as f:
+                matrix = list(csv.reader(f))
+            if not matrix:
+                continue
+            titulo = guess_title_from_table(matrix)
+            tnorm = (titulo or "").strip().lower()
+            if tnorm.startswith("uf:") or tnorm.startswith("uf_"):
+                continue
+            afetados.setdefault((ano, periodo), set()).add(cod)
+            yield (mun_id, ano, periodo, idx, titulo, json.dumps(matrix, ensure_ascii=False))
+
+    lidas = copy_rows(conn, stg, cols, linhas())
+    conn.commit()
+
+    def gravar(conn):
+        n = merge_staging(conn, stg, "siops_tabelas",
+                          ["municipio_id", "ano", "periodo", "tabela_idx"], ["titulo", "matrix"], agg=None)
+        for (ano, periodo), muns in sorted(afetados.items()):
+            publicar_carga(conn, "siops", muns, ano=ano, periodo=periodo)
+        return n
+
+    n = gravar_com_retentativa(conn, gravar, rotulo=f"{raiz} merge")
+    for slug in sorted(desconhecidos):
+        print(f"[WARN] SIOPS: município '{slug}' não encontrado em dim_municipio — arquivos ignorados.")
+    print(f"[IMP] {raiz} -> siops_tabelas: {lidas} tabela(s) lidas, {n} upsert")
+    return n
+
+def importar_blocos_siops(conn, blocos, origem: str) -> int:
+    """
+    DataFrames com (municipio, ano, periodo, tabela_idx, titulo, matrix) — partições
+    do scraper_siops.py em modo colunar. O município é resolvido pelo nome.
+    """
+    from scraper_siops import slugify
+
+    catalogo = _catalogo_slug_municipios(conn)
+    stg = criar_staging(conn, "siops_tabelas")
+    cols = ["municipio_id", "ano", "periodo", "tabela_idx", "titulo", "matrix"]
+    desconhecidos, afetados = set(), {}
+
+    def linhas():
+        for df in blocos:
+            for nome, ano, periodo, idx, titulo, matrix in df[
+                ["municipio", "ano", "periodo", "tabela_idx", "titulo", "matrix"]
+            ].itertuples(index=False, name=None):
+                slug = slugify(nome)
+                if slug not in catalogo:
+                    desconhecidos.add(slug)
+                    continue
+                mun_id, cod = catalogo[slug]
+                afetados.setdefault((int(ano), periodo), set()).add(cod)
+                yield (mun_id, int(ano), periodo, int(idx), titulo, matrix)
+
+    lidas = copy_rows(conn, stg, cols, linhas())
+    conn.commit()
+
+    def gravar(conn):
+        n = merge_staging(conn, stg, "siops_tabelas",
+                          ["municipio_id", "ano", "periodo", "tabela_idx"], ["titulo", "matrix"], agg=None)
+        for (ano, periodo), muns in sorted(afetados.items()):
+            publicar_carga(conn, "siops", muns, ano=ano, periodo=periodo)
+        return n
+
+    n = gravar_com_retentativa(conn, gravar, rotulo=f"{origem} merge")
+    for slug in sorted(desconhecidos):
+        print(f"[WARN] SIOPS: município '{slug}' não encontrado em dim_municipio — partições ignoradas.")
+    print(f"[IMP] {origem} -> siops_tabelas: {lidas} tabela(s) lidas, {n} upsert")
+    return n
+
+# ------------------------------ main ------------------------------
+
+def tabela_destino(path: str, dataset: str | None = None) -> str | None:
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, "manifest.json")):
+            ds = os.path.basename(os.path.normpath(path))
+            return "siops_tabelas" if ds == "siops" else DATASETS_CSV.get(ds, {}).get("tabela")
+        return "siops_tabelas"
+    ds = dataset or detectar_dataset(path)
+    return DATASETS_CSV[ds]["tabela"] if ds else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Importa CSVs dos scrapers (CNES/SIOPS) sem acessar a rede")
+    ap.add_argument("caminhos", nargs="+",
+                    help="Arquivos CSV CNES, diretórios siops_csv/ e/ou diretórios de dataset particionado")
+    ap.add_argument("--dataset", choices=sorted(DATASETS_CSV), help="Força o dataset dos CSVs CNES")
+    ap.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    ap.add_argument("--backfill", action="store_true",
+                    help="Carga inicial em massa: adia os índices secundários das tabelas alvo, "
+                         "reconstrói em paralelo no fim e roda ANALYZE (ver backfill_carga.py)")
+    ap.add_argument("--forcar", action="store_true",
+                    help="Com --backfill: aceita tabelas alvo já populadas (o painel fica sem os índices até o fim)")
+    args = ap.parse_args()
+
+    cfg = DBConfig()
+    total = 0
+    with conexao("bulk", cfg) as conn:
+        modo = contextlib.nullcontext()
+        if args.backfill:
+            from backfill_carga import ModoBackfill
+            tabelas = {tabela_destino(p, args.dataset) for p in args.caminhos} - {None}
+            modo = ModoBackfill(conn, cfg, sorted(tabelas), forcar=args.forcar)
+        with modo:
+            total += _importar_caminhos(conn, args)
+    print(f"Concluído. Total upsert: {total}")
+    imprimir_resumo()
+
+def _importar_caminhos(conn, args) -> int:
+    total = 0
+    for path in args.caminhos:
+        if os.path.isdir(path):
+            if os.path.exists(os.path.join(path, "manifest.json")):
+                total += importar_particoes(conn, path)
+            else:
+                total += importar_arvore_siops(conn, path)
+            continue
+        ds = args.dataset or detectar_dataset(path)
+        if ds is None:
+            print(f"[WARN] {path}: não reconheci o dataset pelo nome; use --dataset. Pulando.")
+            continue
+        total += importar_csv_cnes(conn, path, ds, chunksize=args.chunksize)
+    return total
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# limite_global.py
+"""
+Limite global de requisições/s ao CNES, compartilhado por todos os processos de
+carga (cnes_*_to_pg.py rodando em paralelo, inclusive em hosts diferentes).
+
+Modelo: "próximo slot livre". Cada requisição reserva atomicamente o slot
+max(agora, proximo_slot) e empurra proximo_slot em 1/taxa; quem reservou um slot
+no futuro dorme até ele. A soma de todos os processos fica <= taxa.
+
+Backends (env CNES_LIMITE_GLOBAL):
+  - "pg"       : linha em etl_rate_limit; um UPDATE ... RETURNING por requisição
+                 (o lock de linha serializa a reserva; vale entre hosts);
+  - "arquivo"  : arquivo com fcntl.flock (mesmo host; CNES_LIMITE_ARQUIVO);
+  - vazio      : desligado (só o controle AIMD local do cliente_cnes).
+Taxa global: CNES_TAXA_GLOBAL (req/s, padrão 4).
+"""
+
+import os
+import time
+import threading
+
+TAXA_GLOBAL = float(os.getenv("CNES_TAXA_GLOBAL", "4"))
+BACKEND = os.getenv("CNES_LIMITE_GLOBAL", "").strip().lower()
+ARQUIVO = os.getenv("CNES_LIMITE_ARQUIVO", os.path.join(".cache_painel", "limite_cnes.lock"))
+CHAVE = "cnes"
+
+
+class LimiteGlobalPG:
+    def __init__(self, cfg=None, chave: str = CHAVE, taxa: float = TAXA_GLOBAL):
+        from pool_db import conexao
+        self.cfg, self._conexao = cfg, conexao
+        self.chave, self.intervalo = chave, 1.0 / taxa
+        with conexao("limite", cfg, autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO etl_rate_limit (chave) VALUES (%s) ON CONFLICT DO NOTHING", (chave,))
+
+    def adquirir(self) -> float:
+        """Reserva um slot e dorme até ele. Retorna a espera em segundos."""
+        # conexão do pool só durante o UPDATE; o sono é fora dela
+        with self._conexao("limite", self.cfg, autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE etl_rate_limit
+                SET proximo_slot = GREATEST(proximo_slot, clock_timestamp()) + make_interval(secs => %s)
+                WHERE chave = %s
+                RETURNING EXTRACT(EPOCH FROM (proximo_slot - make_interval(secs => %s) - clock_timestamp()))
+            """, (self.intervalo, self.chave, self.intervalo))
+            espera = float(cur.fetchone()[0])
+        if espera > 0:
+            time.sleep(espera)
+        return max(0.0, espera)
+
+    def fechar(self):
+        pass  # conexões são do pool do processo
+
+
+class LimiteGlobalArquivo:
+    def __init__(self, path: str = ARQUIVO, taxa: float = TAXA_GLOBAL):
+        self.path, self.intervalo = path, 1.0 / taxa
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+
+    def adquirir(self) -> float:
+        import fcntl
+        with self._lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                conteudo = f.read().strip()
+                agora = time.time()  # relógio de parede: comparável entre processos
+                slot = max(agora, float(conteudo) if conteudo else 0.0)
+                f.seek(0)
+                f.truncate()
+                f.write(repr(slot + self.intervalo))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        espera = slot - agora
+        if espera > 0:
+            time.sleep(espera)
+        return espera
+
+
+_limite = None
+_limite_lock = threading.Lock()
+
+def limite_global():
+    """Instância do processo conforme CNES_LIMITE_GLOBAL (ou None se desligado)."""
+    global _limite
+    if not BACKEND:
+        return None
+    with _limite_lock:
+        if _limite is None:
+            if BACKEND == "pg":
+                _limite = LimiteGlobalPG()
+            elif BACKEND == "arquivo":
+                _limite = LimiteGlobalArquivo()
+            else:
+                raise SystemExit(f"CNES_LIMITE_GLOBAL inválido: {BACKEND!r} (use 'pg' ou 'arquivo')")
+            print(f"[LIMITE] global {BACKEND}: {TAXA_GLOBAL:g} req/s")
+    return _limite
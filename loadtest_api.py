@@ -0,0 +1,89 @@
+# loadtest_api.py
+"""
+Load test simples da api_painel.py.
+
+Dispara N requisições com C threads sobre uma mistura de rotas e reporta
+p50/p95/p99, throughput e taxa de acerto do cache (header X-Cache).
+
+Uso:
+  python loadtest_api.py --url http://127.0.0.1:8080 --municipio 140010 --vcomp 202401 -n 2000 -c 8
+"""
+
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, int(round(p / 100.0 * (len(ordenados) - 1)))))
+    return ordenados[k]
+
+def montar_rotas(municipio: str, vcomp: str) -> list[str]:
+    rotas = []
+    for ds in ("leito", "equipamento", "tipo_unidade"):
+        rotas += [
+            f"/cnes/{ds}/serie?municipio={municipio}",
+            f"/cnes/{ds}/ranking?vcomp={vcomp}",
+            f"/cnes/{ds}/ultimo?municipio={municipio}",
+        ]
+    rotas.append(f"/siops/tabelas?municipio={municipio}&limite=20")
+    return rotas
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test da API do painel")
+    ap.add_argument("--url", default="http://127.0.0.1:8080")
+    ap.add_argument("--municipio", default="140010")
+    ap.add_argument("--vcomp", required=True)
+    ap.add_argument("-n", "--requisicoes", type=int, default=1000)
+    ap.add_argument("-c", "--concorrencia", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    rotas = montar_rotas(args.municipio, args.vcomp)
+    rnd = random.Random(args.seed)
+    plano = [rnd.choice(rotas) for _ in range(args.requisicoes)]
+
+    latencias, erros, hits = [], 0, 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def uma(rota: str):
+        nonlocal erros, hits
+        s = getattr(local, "s", None)
+        if s is None:
+            s = local.s = requests.Session()
+        t0 = time.perf_counter()
+        try:
+            r = s.get(args.url + rota, timeout=30)
+            ok = r.status_code == 200
+            hit = r.headers.get("X-Cache") == "HIT"
+        except Exception:
+            ok, hit = False, False
+        dt = (time.perf_counter() - t0) * 1000.0
+        with lock:
+            latencias.append(dt)
+            if not ok:
+                erros += 1
+            if hit:
+                hits += 1
+
+    print(f"[LT] {args.requisicoes} requisições, concorrência={args.concorrencia}, {len(rotas)} rotas")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as ex:
+        list(ex.map(uma, plano))
+    dur = time.perf_counter() - t0
+
+    print(f"[LT] duração={dur:.2f}s  throughput={len(latencias) / dur:.1f} req/s  erros={erros}")
+    print(f"[LT] p50={_percentil(latencias, 50):.2f}ms  p95={_percentil(latencias, 95):.2f}ms  "
+          f"p99={_percentil(latencias, 99):.2f}ms  max={max(latencias, default=0):.2f}ms")
+    print(f"[LT] cache hit={hits / max(1, len(latencias)):.1%}")
+
+if __name__ == "__main__":
+    main()
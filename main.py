@@ -1,15 +1,38 @@
 # main.py
+import os
 import subprocess
 import sys
+import time
 import argparse
 
-def run(script_name, args=None):
+from seletores import adicionar_seletores_cnes, lista_csv, argumentos_repassados
+
+SCRIPTS_DATASET = {
+    "leito":        "cnes_tipo_leito_to_pg.py",
+    "equipamento":  "cnes_equipamentos_to_pg.py",
+    "tipo_unidade": "cnes_tipo_unidade_to_pg.py",
+    "siops":        "siops_to_pg.py",
+}
+
+INICIO = time.monotonic()
+
+def run(script_name, args=None, extra=None):
     """
     Executa um script python usando o mesmo interpretador atual.
     """
-    cmd = [sys.executable, script_name]
+    cmd = [sys.executable, script_name] + (extra or [])
     if args and getattr(args, 'force', False):
         cmd.append("--force")
+    if args and getattr(args, 'refresh', None) and script_name.startswith("cnes_"):
+        cmd += ["--refresh", str(args.refresh)]
+    if args:
+        cmd += argumentos_repassados(args, script_name)
+    if args and getattr(args, 'max_runtime', None) and script_name.startswith("cnes_"):
+        restante = args.max_runtime - (time.monotonic() - INICIO)
+        if restante < 1:  # "0" no loader seria "sem prazo"
+            print(f"⏱  Prazo esgotado; {script_name} fica para a próxima execução")
+            return
+        cmd += ["--max-runtime", f"{restante:.1f}"]
     
     print(f"\n$ {' '.join(cmd)}")
     code = subprocess.call(cmd)
@@ -17,10 +40,34 @@ def run(script_name, args=None):
         print(f"❌ Erro ao executar {script_name} (código {code})")
         sys.exit(code)
 
+def exportar_cubos(args, datasets):
+    """Cubos NumPy dos datasets CNES carregados (o export pula os que não mudaram)."""
+    if args.cubos and datasets:
+        print("--- Cubos CNES ---")
+        run("cubo_cnes.py", extra=["exportar", "--raiz", args.cubos, "--datasets", ",".join(datasets)])
+
 def main():
     parser = argparse.ArgumentParser(description="Painel de Saúde - Pipeline de Dados")
     parser.add_argument("--force", action="store_true", help="Reprocessa dados já existentes no banco")
+    parser.add_argument("--refresh", type=int, metavar="N",
+                        help="CNES: reprocessa só as N últimas competências + as novas, gravando só o que mudou")
     
+    parser.add_argument("--datasets", metavar="DS,DS",
+                        help=f"Só estes datasets ({', '.join(SCRIPTS_DATASET)}); implica pular a etapa do banco")
+    parser.add_argument("--max-runtime", type=float, metavar="SEG",
+                        help="CNES: prazo total; cada loader recebe o tempo restante e deixa checkpoint")
+    adicionar_seletores_cnes(parser)
+    parser.add_argument("--ano", metavar="AAAA,AAAA", help="SIOPS: só estes anos")
+    parser.add_argument("--periodo", metavar="P,P", help="SIOPS: só estes períodos")
+    parser.add_argument("--cubos", metavar="DIR",
+                        help="Depois da carga CNES, exporta os cubos NumPy (cubo_cnes.py) para DIR")
+    # sessão de banco dos loaders (pool_db.py); repassados por env aos subprocessos
+    parser.add_argument("--pool-tamanho", type=int, metavar="N",
+                        help="Máximo de conexões ao Postgres por loader (padrão 4)")
+    parser.add_argument("--work-mem", metavar="MEM", help="work_mem das etapas de carga (ex.: 128MB)")
+    parser.add_argument("--commit-sincrono", action="store_true",
+                        help="Mantém synchronous_commit=on nas etapas de carga (padrão: off)")
+
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--db", action="store_true", help="Cria/atualiza apenas o banco e tabelas")
     group.add_argument("--cnes", action="store_true", help="Executa apenas a carga do CNES (leitos, equipamentos, unidades)")
@@ -29,6 +76,25 @@ def main():
 
     args = parser.parse_args()
 
+    if args.pool_tamanho:
+        os.environ["DB_POOL_TAMANHO"] = str(args.pool_tamanho)
+    if args.work_mem:
+        os.environ["DB_WORK_MEM"] = args.work_mem
+    if args.commit_sincrono:
+        os.environ["DB_COMMIT_SINCRONO"] = "1"
+
+    if args.datasets:
+        datasets = lista_csv(args.datasets)
+        invalidos = [d for d in datasets if d not in SCRIPTS_DATASET]
+        if invalidos:
+            parser.error(f"dataset(s) desconhecido(s): {', '.join(invalidos)}")
+        for ds in datasets:
+            print(f"--- Carga {ds} ---")
+            run(SCRIPTS_DATASET[ds], args)
+        exportar_cubos(args, [ds for ds in datasets if ds != "siops"])
+        print("\n🎉 Pipeline finalizado com sucesso.")
+        return
+
     # Se nenhum argumento de ação for passado, assume --all
     run_all = args.all or (not args.db and not args.cnes and not args.siops)
 
@@ -38,13 +104,13 @@ def main():
 
     if args.cnes or run_all:
         print("--- [2/3] Carga CNES ---")
-        run("cnes_tipo_leito_to_pg.py", args)
-        run("cnes_equipamentos_to_pg.py", args)
-        run("cnes_tipo_unidade_to_pg.py", args)
+        for ds in ("leito", "equipamento", "tipo_unidade"):
+            run(SCRIPTS_DATASET[ds], args)
+        exportar_cubos(args, ["leito", "equipamento", "tipo_unidade"])
 
     if args.siops or run_all:
         print("--- [3/3] Carga SIOPS ---")
-        run("siops_to_pg.py", args)
+        run(SCRIPTS_DATASET["siops"], args)
 
     print("\n🎉 Pipeline finalizado com sucesso.")
 
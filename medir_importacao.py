@@ -0,0 +1,101 @@
+# medir_importacao.py
+"""
+Orçamento de tempo de import dos pontos de entrada do pipeline.
+
+Cada módulo é importado num interpretador novo com `python -X importtime`
+(melhor de N execuções). Falha (código 1) se:
+  - o import passar do orçamento em ORCAMENTO_MS; ou
+  - algum módulo pesado (PESADOS) for carregado já no import — pandas, bs4,
+    requests, selenium etc. devem vir só quando a etapa roda (importacao_tardia.py).
+
+Assim `main.py --db`, `create_db_and_tables.py`, --help e recargas dirigidas que
+caem no "já carregado" sobem em bem menos de 1 s.
+
+Uso:
+  python medir_importacao.py
+  python medir_importacao.py --repeticoes 5 --modulos main,cnes_tipo_leito_to_pg
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+# ms de import (cumulativo do próprio módulo), sem contar o boot do interpretador
+ORCAMENTO_MS = {
+    "main": 50,
+    "create_db_and_tables": 100,
+    "seletores": 20,
+    "cnes_tipo_leito_to_pg": 150,
+    "cnes_equipamentos_to_pg": 150,
+    "cnes_tipo_unidade_to_pg": 150,
+    "siops_to_pg": 150,
+    "api_painel": 150,
+}
+PESADOS = {"pandas", "numpy", "bs4", "lxml", "requests", "urllib3", "selenium.webdriver", "webdriver_manager"}
+
+_LINHA = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\S.*)$")
+
+
+def medir(modulo: str, repeticoes: int) -> tuple[float, set[str]]:
+    """(ms cumulativos do import de `modulo`, pesados carregados)."""
+    melhor, pesados = None, set()
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(repeticoes):
+        p = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                           capture_output=True, text=True, cwd=raiz)
+        if p.returncode != 0:
+            raise SystemExit(f"[IMPORT] falha ao importar {modulo}:\n{p.stderr.strip().splitlines()[-1]}")
+        total = None
+        for linha in p.stderr.splitlines():
+            m = _LINHA.search(linha)
+            if not m:
+                continue
+            nome = m[3].strip()
+            if nome in PESADOS:
+                pesados.add(nome)
+            if nome == modulo:
+                total = int(m[2]) / 1000.0
+        if total is not None and (melhor is None or total < melhor):
+            melhor = total
+    return melhor or 0.0, pesados
+
+def boot_ms(repeticoes: int) -> float:
+    melhor = None
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        dt = (time.perf_counter() - t0) * 1000
+        melhor = dt if melhor is None else min(melhor, dt)
+    return melhor
+
+def main():
+    ap = argparse.ArgumentParser(description="Orçamento de tempo de import dos pontos de entrada")
+    ap.add_argument("--modulos", help=f"Lista CSV (padrão: {', '.join(ORCAMENTO_MS)})")
+    ap.add_argument("--repeticoes", type=int, default=3, help="Vale a melhor execução")
+    args = ap.parse_args()
+
+    modulos = [m.strip() for m in args.modulos.split(",")] if args.modulos else list(ORCAMENTO_MS)
+    print(f"[IMPORT] boot do interpretador: {boot_ms(args.repeticoes):.0f} ms")
+    falhas = []
+    for mod in modulos:
+        ms, pesados = medir(mod, args.repeticoes)
+        limite = ORCAMENTO_MS.get(mod)
+        marca = ""
+        if limite is not None and ms > limite:
+            falhas.append(f"{mod}: {ms:.0f} ms > orçamento {limite} ms")
+            marca = "  <-- ACIMA DO ORÇAMENTO"
+        if pesados:
+            falhas.append(f"{mod}: importa no load {', '.join(sorted(pesados))}")
+            marca += f"  <-- PESADOS: {', '.join(sorted(pesados))}"
+        print(f"  {mod:28s} {ms:7.1f} ms  (orçamento {limite if limite is not None else '-'} ms){marca}")
+
+    if falhas:
+        print("[FALHA] " + "\n[FALHA] ".join(falhas))
+        sys.exit(1)
+    print("[IMPORT] OK: dentro do orçamento")
+
+if __name__ == "__main__":
+    main()
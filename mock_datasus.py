@@ -0,0 +1,397 @@
+# mock_datasus.py
+"""
+Servidor local que imita CNES, IBGE e SIOPS para testes de carga/escala offline.
+
+Rotas:
+  GET  /Mod_Ind_Tipo_Leito.asp?VEstado=&VMun=&VComp=     (leitos)
+  GET  /Mod_Ind_Equipamento.asp?...                      (equipamentos)
+  GET  /Mod_Ind_Unidade.asp?...                          (tipos de unidade)
+  GET  /api/v1/localidades/estados/<uf>/municipios       (JSON do IBGE)
+  GET  /consleirespfiscal.php                            (formulário SIOPS)
+  POST /consleirespfiscal.php                            (resultado SIOPS)
+  GET  /_stats                                           (contadores do mock)
+
+Os dados são sintéticos mas determinísticos (mesma semente -> mesmas páginas),
+no mesmo layout HTML (latin-1, tabelas aninhadas, grupos com colspan, linha
+TOTAL) que os parsers esperam. Cardinalidade nacional: as 27 UFs com o número
+real de municípios (Roraima com nomes/códigos reais); --municipios-por-uf força
+outra escala. Municípios maiores (peso Zipf) têm mais itens e valores maiores;
+competências depois de --ultima vêm sem dados, como no site.
+
+Uso:
+  python mock_datasus.py --port 8099 --latencia-ms 80 --erro 0.02 --cauda 0.01 --cauda-ms 5000
+  export CNES_BASE_URL=http://127.0.0.1:8099 IBGE_BASE_URL=http://127.0.0.1:8099 \
+         SIOPS_URL=http://127.0.0.1:8099/consleirespfiscal.php
+"""
+
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+from datetime import date
+from html import escape
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# (sigla, nome, nº de municípios)
+UFS = {
+    11: ("RO", "Rondônia", 52), 12: ("AC", "Acre", 22), 13: ("AM", "Amazonas", 62),
+    14: ("RR", "Roraima", 15), 15: ("PA", "Pará", 144), 16: ("AP", "Amapá", 16),
+    17: ("TO", "Tocantins", 139), 21: ("MA", "Maranhão", 217), 22: ("PI", "Piauí", 224),
+    23: ("CE", "Ceará", 184), 24: ("RN", "Rio Grande do Norte", 167), 25: ("PB", "Paraíba", 223),
+    26: ("PE", "Pernambuco", 185), 27: ("AL", "Alagoas", 102), 28: ("SE", "Sergipe", 75),
+    29: ("BA", "Bahia", 417), 31: ("MG", "Minas Gerais", 853), 32: ("ES", "Espírito Santo", 78),
+    33: ("RJ", "Rio de Janeiro", 92), 35: ("SP", "São Paulo", 645), 41: ("PR", "Paraná", 399),
+    42: ("SC", "Santa Catarina", 295), 43: ("RS", "Rio Grande do Sul", 497),
+    50: ("MS", "Mato Grosso do Sul", 79), 51: ("MT", "Mato Grosso", 141), 52: ("GO", "Goiás", 246),
+    53: ("DF", "Distrito Federal", 1),
+}
+
+MUNICIPIOS_RR = [
+    (1400050, "Alto Alegre"), (1400027, "Amajari"), (1400100, "Boa Vista"), (1400159, "Bonfim"),
+    (1400175, "Cantá"), (1400209, "Caracaraí"), (1400233, "Caroebe"), (1400282, "Iracema"),
+    (1400308, "Mucajaí"), (1400407, "Normandia"), (1400456, "Pacaraima"), (1400472, "Rorainópolis"),
+    (1400506, "São João da Baliza"), (1400605, "São Luiz"), (1400704, "Uiramutã"),
+]
+CAPITAIS = {"140010"}  # peso máximo; nas UFs sintéticas o 1º município faz o papel
+
+GRUPOS_LEITO = [
+    ("CIRÚRGICO", ["BUCO MAXILO FACIAL", "CARDIOLOGIA", "CIRURGIA GERAL", "ENDOCRINOLOGIA", "GASTROENTEROLOGIA",
+                   "GINECOLOGIA", "NEFROLOGIAUROLOGIA", "NEUROCIRURGIA", "OFTALMOLOGIA", "ONCOLOGIA",
+                   "ORTOPEDIATRAUMATOLOGIA", "OTORRINOLARINGOLOGIA", "PLASTICA", "TORACICA"]),
+    ("CLÍNICO", ["AIDS", "CARDIOLOGIA", "CLINICA GERAL", "CRONICOS", "DERMATOLOGIA", "GERIATRIA",
+                 "HEMATOLOGIA", "NEFROUROLOGIA", "NEONATOLOGIA", "NEUROLOGIA", "ONCOLOGIA", "PNEUMOLOGIA"]),
+    ("OBSTÉTRICO", ["OBSTETRICIA CIRURGICA", "OBSTETRICIA CLINICA"]),
+    ("PEDIÁTRICO", ["PEDIATRIA CLINICA", "PEDIATRIA CIRURGICA"]),
+    ("OUTRAS ESPECIALIDADES", ["PSIQUIATRIA", "REABILITACAO", "TISIOLOGIA", "ACOLHIMENTO NOTURNO"]),
+    ("COMPLEMENTAR", ["UTI ADULTO - TIPO II", "UTI PEDIATRICA - TIPO II", "UTI NEONATAL - TIPO II",
+                      "UNIDADE INTERMEDIARIA NEONATAL", "UNIDADE ISOLAMENTO"]),
+]
+GRUPOS_EQUIP = [
+    ("EQUIPAMENTOS DE DIAGNOSTICO POR IMAGEM", ["GAMA CAMARA", "MAMOGRAFO COM COMANDO SIMPLES", "RAIO X ATE 100 MA",
+                                                "RAIO X DE 100 A 500 MA", "TOMOGRAFO COMPUTADORIZADO", "ULTRASSOM DOPPLER COLORIDO"]),
+    ("EQUIPAMENTOS DE INFRA-ESTRUTURA", ["CONTROLE AMBIENTAL/AR-CONDICIONADO CENTRAL", "GRUPO GERADOR", "USINA DE OXIGENIO"]),
+    ("EQUIPAMENTOS POR METODOS OPTICOS", ["ENDOSCOPIO DAS VIAS RESPIRATORIAS", "ENDOSCOPIO DIGESTIVO", "MICROSCOPIO CIRURGICO"]),
+    ("EQUIPAMENTOS POR METODOS GRAFICOS", ["ELETROCARDIOGRAFO", "ELETROENCEFALOGRAFO"]),
+    ("EQUIPAMENTOS PARA MANUTENCAO DA VIDA", ["BOMBA DE INFUSAO", "DESFIBRILADOR", "MONITOR DE ECG", "REANIMADOR PULMONAR/AMBU",
+                                              "RESPIRADOR/VENTILADOR", "BERCO AQUECIDO", "INCUBADORA"]),
+    ("OUTROS EQUIPAMENTOS", ["EQUIPO ODONTOLOGICO", "APARELHO DE DIATERMIA POR ULTRASSOM/ONDAS CURTAS", "FORNO DE BIER"]),
+]
+TIPOS_UNIDADE = ["POSTO DE SAUDE", "CENTRO DE SAUDE/UNIDADE BASICA", "POLICLINICA", "HOSPITAL GERAL",
+                 "HOSPITAL ESPECIALIZADO", "UNIDADE MISTA", "PRONTO SOCORRO GERAL", "CONSULTORIO ISOLADO",
+                 "CLINICA/CENTRO DE ESPECIALIDADE", "UNIDADE DE APOIO DIAGNOSE E TERAPIA (SADT ISOLADO)",
+                 "UNIDADE MOVEL TERRESTRE", "UNIDADE MOVEL DE NIVEL PRE-HOSPITALAR NA AREA DE URGENCIA",
+                 "FARMACIA", "UNIDADE DE VIGILANCIA EM SAUDE", "CENTRAL DE GESTAO EM SAUDE",
+                 "CENTRO DE ATENCAO PSICOSSOCIAL", "PRONTO ATENDIMENTO", "POLO ACADEMIA DA SAUDE",
+                 "CENTRAL DE REGULACAO DO ACESSO", "LABORATORIO DE SAUDE PUBLICA"]
+
+PAGINAS = {
+    "/Mod_Ind_Tipo_Leito.asp": "leito",
+    "/Mod_Ind_Equipamento.asp": "equipamento",
+    "/Mod_Ind_Unidade.asp": "tipo_unidade",
+}
+
+
+def _vcomp_padrao() -> str:
+    hoje = date.today()
+    m = hoje.year * 12 + hoje.month - 1 - 2  # ~2 meses de defasagem de publicação
+    return f"{m // 12:04d}{m % 12 + 1:02d}"
+
+def _rnd(seed: int, *partes) -> random.Random:
+    return random.Random(zlib.crc32(":".join(map(str, (seed,) + partes)).encode()))
+
+# -------------------- municípios --------------------
+
+_cache_mun = {}
+
+def municipios_uf(uf: int, por_uf: int | None = None) -> list[tuple[int, str]]:
+    """[(codigo_ibge_7, nome)] da UF (Roraima real; demais sintéticos)."""
+    chave = (uf, por_uf)
+    if chave not in _cache_mun:
+        if uf == 14 and por_uf is None:
+            lista = list(MUNICIPIOS_RR)
+        else:
+            sigla, _, n = UFS[uf]
+            n = por_uf or n
+            lista = [(int(f"{uf:02d}{(i + 1) * 10 if n < 1000 else i + 1:04d}{(uf + i) % 10}"), f"Município {sigla} {i + 1:03d}")
+                     for i in range(n)]
+        _cache_mun[chave] = lista
+    return _cache_mun[chave]
+
+def peso_municipio(uf: int, mun6: str, por_uf: int | None = None) -> float:
+    """Peso Zipf (1 = capital) usado para tamanho da rede de saúde."""
+    if mun6 in CAPITAIS:
+        return 1.0
+    codigos = [str(c)[:6] for c, _ in municipios_uf(uf, por_uf)]
+    rank = codigos.index(mun6) + 1 if mun6 in codigos else len(codigos)
+    if uf == 14:
+        rank += 1  # capital real já ocupa o rank 1
+    return 1.0 / rank ** 0.9
+
+# -------------------- páginas CNES --------------------
+
+def _moldura(titulo: str, corpo: str) -> str:
+    # layout do cnes2: tabelas de menu/cabeçalho em volta da tabela de dados
+    return (
+        "<html><head><title>CNES - Indicadores</title>"
+        "<meta http-equiv='Content-Type' content='text/html; charset=iso-8859-1'></head><body>"
+        "<table width='100%'><tr><td><img src='/img/cnes.gif'></td><td>Cadastro Nacional de Estabelecimentos de Saúde</td></tr></table>"
+        "<table width='100%'><tr><td><a href='/'>Início</a></td><td><a href='/Mod_Ind.asp'>Indicadores</a></td></tr></table>"
+        f"<table width='760' align='center'><tr><td class='titulo'>{escape(titulo)}</td></tr><tr><td>{corpo}</td></tr></table>"
+        "<table width='100%'><tr><td>DATASUS - Ministério da Saúde</td></tr></table></body></html>"
+    )
+
+def _sem_dados(titulo: str) -> str:
+    return _moldura(titulo, "<p><b>Nenhum registro encontrado para os parâmetros informados.</b></p>")
+
+def pagina_cnes(dataset: str, uf: int, mun6: str, vcomp: str, seed: int = 1,
+                ultima: str | None = None, vazio: float = 0.0, por_uf: int | None = None) -> str:
+    titulo = {"leito": "Tipos de Leito", "equipamento": "Equipamentos", "tipo_unidade": "Tipos de Estabelecimento"}[dataset]
+    r = _rnd(seed, dataset, mun6, vcomp)
+    if vcomp > (ultima or _vcomp_padrao()) or r.random() < vazio:
+        return _sem_dados(titulo)
+    peso = peso_municipio(uf, mun6, por_uf)
+    escala = max(1.0, 400 * peso)
+    cobertura = min(1.0, 0.15 + peso * 1.5)  # fração dos itens presentes
+    linhas = []
+
+    def _v(maximo):
+        return r.randint(0, max(1, int(maximo)))
+
+    if dataset == "leito":
+        cod = 0
+        for grupo, itens in GRUPOS_LEITO:
+            grp = []
+            for desc in itens:
+                cod += 1
+                if r.random() > cobertura:
+                    continue
+                ex = _v(escala / 8)
+                grp.append(f"<tr><td>{cod:02d}</td><td>{escape(desc)}</td><td align='right'>{ex}</td>"
+                           f"<td align='right'>{min(ex, _v(ex))}</td></tr>")
+            if grp:
+                quarta = "Habilitados" if grupo == "COMPLEMENTAR" else "Sus"
+                linhas.append(f"<tr><td colspan='4' bgcolor='#CCCCCC'><b>{grupo}</b></td></tr>")
+                linhas.append(f"<tr><td><b>Codigo</b></td><td><b>Descrição</b></td><td><b>Existente</b></td><td><b>{quarta}</b></td></tr>")
+                linhas += grp
+        ncols = 4
+    elif dataset == "equipamento":
+        cod = 0
+        cab = "<tr><td>Codigo</td><td>Descrição</td><td>Existentes</td><td>Em Uso</td><td>Existentes SUS</td><td>Em Uso SUS</td></tr>"
+        for gi, (grupo, itens) in enumerate(GRUPOS_EQUIP, start=1):
+            grp = []
+            for desc in itens:
+                cod += 1
+                if r.random() > cobertura:
+                    continue
+                ex = _v(escala / 10)
+                uso = min(ex, _v(ex))
+                exs = min(ex, _v(ex))
+                grp.append(f"<tr><td>{gi}{cod:02d}</td><td><a href='#'>{escape(desc)}</a></td><td>{ex}</td><td>{uso}</td>"
+                           f"<td>{exs}</td><td>{min(exs, uso)}</td></tr>")
+            if grp:
+                linhas.append(f"<tr><td colspan='6'><b>{grupo}</b></td></tr>")
+                linhas.append(cab)
+                linhas += grp
+        ncols = 6
+    else:
+        linhas.append("<tr><td>Codigo</td><td>Descrição</td><td>Total</td></tr>")
+        for cod, desc in enumerate(TIPOS_UNIDADE, start=1):
+            if r.random() > cobertura:
+                continue
+            linhas.append(f"<tr><td>{cod:02d}</td><td>{escape(desc)}</td><td>{_v(escala / 6) + 1}</td></tr>")
+        ncols = 3
+
+    if not any(l.startswith("<tr><td>") and l[8:9].isdigit() for l in linhas):
+        return _sem_dados(titulo)
+    linhas.append(f"<tr><td colspan='{ncols - 1}'><b>TOTAL</b></td><td>-</td></tr>")
+    tbody = r.random() < 0.5  # o site às vezes emite <tbody>
+    corpo = ("<table border='1' cellpadding='2'>" + ("<tbody>" if tbody else "") + "".join(linhas)
+             + ("</tbody>" if tbody else "") + "</table>")
+    return _moldura(titulo, corpo)
+
+# -------------------- SIOPS --------------------
+
+PERIODOS_SIOPS = ["1º Bimestre", "2º Bimestre", "3º Bimestre", "4º Bimestre", "5º Bimestre", "6º Bimestre"]
+
+def pagina_siops_form(por_uf: int | None = None) -> str:
+    ufs = "".join(f"<option value='{c}'>{escape(n)}</option>" for c, (_, n, _) in sorted(UFS.items(), key=lambda x: x[1][1]))
+    mun = {c: [nome for _, nome in municipios_uf(c, por_uf)] for c in UFS}
+    anos = "".join(f"<option>{a}</option>" for a in range(date.today().year, 2007, -1))
+    per = "".join(f"<option>{p}</option>" for p in PERIODOS_SIOPS)
+    return (
+        "<html><head><meta charset='utf-8'><title>SIOPS - Consulta LRF</title><script>"
+        f"var MUN={json.dumps(mun, ensure_ascii=False)};"
+        "function trocaUF(s){var m=document.getElementsByName('cmbMunicipio[]')[0];m.innerHTML='';"
+        "(MUN[s.value]||[]).forEach(function(n){var o=document.createElement('option');o.text=n;m.add(o);});}"
+        "</script></head><body>"
+        "<form method='post' action='consleirespfiscal.php'>"
+        "<select name='cmbUF' onchange='trocaUF(this)'><option value=''>Selecione</option>" + ufs + "</select>"
+        "<select name='cmbMunicipio[]' multiple size='8'></select>"
+        "<select name='cmbAno'>" + anos + "</select>"
+        "<select name='cmbPeriodo'>" + per + "</select>"
+        "<input type='submit' name='BtConsultar' value='Consultar'>"
+        "</form></body></html>"
+    )
+
+def _brl(v: float) -> str:
+    s = f"{v:,.2f}"
+    return s.replace(",", "X").replace(".", ",").replace("X", ".")
+
+def pagina_siops_resultado(municipio: str, ano: str, periodo: str, seed: int = 1, n_tabelas: int = 6) -> str:
+    r = _rnd(seed, "siops", municipio, ano, periodo)
+    tabelas = []
+    for t in range(1, n_tabelas + 1):
+        linhas = [
+            f"<tr><td colspan='4'>TABELA {t} - DEMONSTRATIVO {t}</td></tr>",
+            "<tr><td rowspan='2'>RECEITAS / DESPESAS</td><td rowspan='2'>PREVISÃO INICIAL</td>"
+            "<td colspan='2'>REALIZADAS</td></tr>",
+            "<tr><td>Até o Bimestre (b)</td><td>% (b/a) x 100</td></tr>",
+        ]
+        for k in range(1, r.randint(8, 25)):
+            prev = r.uniform(1e4, 5e7)
+            real = prev * r.uniform(0.2, 1.1)
+            pct = "N/A" if r.random() < 0.05 else _brl(100 * real / prev)
+            linhas.append(f"<tr><td>Item {t}.{k}</td><td>{_brl(prev)}</td><td>{_brl(real)}</td><td>{pct}</td></tr>")
+        tabelas.append("<table class='tam2 tdExterno'>" + "".join(linhas) + "</table>")
+    return (
+        "<html><head><meta charset='utf-8'></head><body>"
+        "<div class='lbltitulo'>Demonstrativo da Lei de Responsabilidade Fiscal</div>"
+        f"<div>{escape(municipio)} - {escape(ano)} - {escape(periodo)}</div>" + "".join(tabelas) + "</body></html>"
+    )
+
+# -------------------- servidor --------------------
+
+class ConfigMock:
+    def __init__(self, latencia_ms=50.0, jitter_ms=20.0, cauda=0.0, cauda_ms=5000.0, erro=0.0,
+                 vazio=0.02, ultima=None, seed=1, por_uf=None):
+        self.latencia_ms, self.jitter_ms = latencia_ms, jitter_ms
+        self.cauda, self.cauda_ms = cauda, cauda_ms
+        self.erro, self.vazio = erro, vazio
+        self.ultima = ultima or _vcomp_padrao()
+        self.seed, self.por_uf = seed, por_uf
+        self.stats = {"requisicoes": 0, "erros_503": 0, "lentas": 0}
+        self._lock = threading.Lock()
+        self._rnd = random.Random(seed)
+
+    def sortear(self) -> tuple[float, bool]:
+        """(atraso_s, responder_503) da próxima requisição."""
+        with self._lock:
+            self.stats["requisicoes"] += 1
+            lenta = self._rnd.random() < self.cauda
+            erro = self._rnd.random() < self.erro
+            atraso = max(0.0, self._rnd.gauss(self.latencia_ms, self.jitter_ms)) / 1000
+            if lenta:
+                self.stats["lentas"] += 1
+                atraso += self.cauda_ms / 1000
+            if erro:
+                self.stats["erros_503"] += 1
+        return atraso, erro
+
+
+def criar_handler(cfg: ConfigMock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _enviar(self, status: int, corpo: bytes, tipo: str):
+            self.send_response(status)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _simular_rede(self) -> bool:
+            atraso, erro = cfg.sortear()
+            if atraso:
+                time.sleep(atraso)
+            if erro:
+                self._enviar(503, b"Service Unavailable", "text/plain")
+                return False
+            return True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            qs = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if url.path == "/_stats":
+                return self._enviar(200, json.dumps(cfg.stats).encode(), "application/json")
+            if not self._simular_rede():
+                return
+            if url.path in PAGINAS:
+                try:
+                    uf = int(qs.get("VEstado", 14))
+                    html = pagina_cnes(PAGINAS[url.path], uf, qs.get("VMun", ""), qs.get("VComp", ""),
+                                       seed=cfg.seed, ultima=cfg.ultima, vazio=cfg.vazio, por_uf=cfg.por_uf)
+                except (ValueError, KeyError):
+                    return self._enviar(400, b"parametros invalidos", "text/plain")
+                return self._enviar(200, html.encode("latin-1", "replace"), "text/html; charset=iso-8859-1")
+            partes = url.path.strip("/").split("/")
+            if partes[:4] == ["api", "v1", "localidades", "estados"] and len(partes) == 6 and partes[5] == "municipios":
+                uf = int(partes[4]) if partes[4].isdigit() else None
+                if uf not in UFS:
+                    return self._enviar(404, b"[]", "application/json")
+                corpo = [{"id": c, "nome": n} for c, n in municipios_uf(uf, cfg.por_uf)]
+                return self._enviar(200, json.dumps(corpo, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+            if url.path == "/consleirespfiscal.php":
+                return self._enviar(200, pagina_siops_form(cfg.por_uf).encode("utf-8"), "text/html; charset=utf-8")
+            self._enviar(404, b"not found", "text/plain")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            n = int(self.headers.get("Content-Length") or 0)
+            form = parse_qs(self.rfile.read(n).decode("utf-8", "replace"))
+            if url.path.rstrip("/").endswith("consleirespfiscal.php"):
+                if not self._simular_rede():
+                    return
+                mun = (form.get("cmbMunicipio[]") or [""])[0]
+                html = pagina_siops_resultado(mun, (form.get("cmbAno") or [""])[0], (form.get("cmbPeriodo") or [""])[0], seed=cfg.seed)
+                return self._enviar(200, html.encode("utf-8"), "text/html; charset=utf-8")
+            self._enviar(404, b"not found", "text/plain")
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+def iniciar(cfg: ConfigMock, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Sobe o mock numa thread (port=0 = porta livre). Para com srv.shutdown()."""
+    srv = ThreadingHTTPServer((host, port), criar_handler(cfg))
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Mock local de CNES/IBGE/SIOPS")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latencia-ms", type=float, default=50.0, help="Latência média por resposta")
+    ap.add_argument("--jitter-ms", type=float, default=20.0, help="Desvio-padrão da latência")
+    ap.add_argument("--cauda", type=float, default=0.0, help="Fração de respostas lentas")
+    ap.add_argument("--cauda-ms", type=float, default=5000.0, help="Atraso extra das respostas lentas")
+    ap.add_argument("--erro", type=float, default=0.0, help="Fração de respostas HTTP 503")
+    ap.add_argument("--vazio", type=float, default=0.02, help="Fração de células sem dados")
+    ap.add_argument("--ultima", help="Última competência publicada (AAAAMM); depois dela as páginas vêm vazias")
+    ap.add_argument("--municipios-por-uf", type=int, help="Força N municípios por UF (padrão: números reais)")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    cfg = ConfigMock(latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms, cauda=args.cauda,
+                     cauda_ms=args.cauda_ms, erro=args.erro, vazio=args.vazio, ultima=args.ultima,
+                     seed=args.seed, por_uf=args.municipios_por_uf)
+    srv = ThreadingHTTPServer((args.host, args.port), criar_handler(cfg))
+    base = f"http://{args.host}:{args.port}"
+    print(f"[MOCK] Servindo em {base} (última competência {cfg.ultima}; Ctrl+C para sair)")
+    print(f"[MOCK] export CNES_BASE_URL={base} IBGE_BASE_URL={base} SIOPS_URL={base}/consleirespfiscal.php")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        print(f"[MOCK] {cfg.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# pool_db.py
+"""
+Pool de conexões do processo, com ajustes de sessão por etapa e métricas de espera.
+
+    from pool_db import conexao, imprimir_resumo
+    with conexao("carga") as conn:      # commit no fim, rollback em erro (como `with get_conn(...)`)
+        upsert_dicts(conn, ...)
+    with conexao("leitura", autocommit=True) as conn:
+        ...
+    imprimir_resumo()
+
+- Um pool por DSN e processo (loaders, importadores, API, limite global, builds
+  de índice do backfill). Tamanho máximo DB_POOL_TAMANHO: quem passa disso espera
+  (até DB_POOL_TIMEOUT s, depois PoolEsgotado) em vez de abrir mais uma conexão
+  no Postgres.
+- Cada etapa tem seus ajustes de sessão (ETAPAS), aplicados na retirada. A
+  conexão lembra o que já tem: retirar de novo para a mesma etapa não custa
+  round trip; trocar de etapa custa um (RESET ALL + set_config).
+- Métricas por etapa: retiradas, espera total/máx/p95, tempo em uso, timeouts;
+  do pool: conexões abertas e pico em uso. Espera alta numa etapa = pool pequeno
+  para a concorrência dela (ou outra etapa segurando conexão demais).
+
+Ajustes por env (o main.py repassa os seus flags assim para os loaders):
+  DB_POOL_TAMANHO (4)  DB_POOL_TIMEOUT (60)
+  DB_WORK_MEM         work_mem das etapas de carga (carga, bulk)
+  DB_COMMIT_SINCRONO  "1" mantém synchronous_commit=on nas etapas de carga
+"""
+
+import os
+import time
+import threading
+import contextlib
+from collections import deque
+
+import psycopg2
+
+from db_config import DBConfig, as_dsn
+
+TAMANHO = int(os.getenv("DB_POOL_TAMANHO", "4"))
+TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "60"))
+
+# synchronous_commit=off: um crash do servidor perde no máximo os últimos
+# commits (~3x wal_writer_delay), sem corromper nada; dados e checkpoint de
+# carga entram na mesma transação, então voltam juntos numa nova execução.
+ETAPAS = {
+    "padrao":  {},
+    "carga":   {"synchronous_commit": "off", "work_mem": "64MB"},   # loaders: lotes de upsert + controle
+    "bulk":    {"synchronous_commit": "off", "work_mem": "256MB"},  # importar_offline/reparse: GROUP BY da staging
+    "indice":  {"maintenance_work_mem": "256MB"},                   # builds de índice (backfill)
+    "leitura": {"statement_timeout": "30s"},                        # API e consultas de skip
+    "limite":  {},                                                   # UPDATE do limite global
+}
+for _e in ("carga", "bulk"):
+    if os.getenv("DB_WORK_MEM"):
+        ETAPAS[_e]["work_mem"] = os.getenv("DB_WORK_MEM")
+    if os.getenv("DB_COMMIT_SINCRONO") == "1":
+        ETAPAS[_e]["synchronous_commit"] = "on"
+
+
+class PoolEsgotado(RuntimeError):
+    pass
+
+
+class _Metricas:
+    __slots__ = ("retiradas", "espera_total", "espera_max", "esperas", "uso_total", "timeouts")
+
+    def __init__(self):
+        self.retiradas = 0
+        self.espera_total = self.espera_max = self.uso_total = 0.0
+        self.esperas = deque(maxlen=2000)
+        self.timeouts = 0
+
+    def p95(self) -> float:
+        if not self.esperas:
+            return 0.0
+        s = sorted(self.esperas)
+        return s[min(len(s) - 1, int(len(s) * 0.95))]
+
+
+class PoolDB:
+    def __init__(self, dsn: str, tamanho: int = TAMANHO, timeout: float = TIMEOUT):
+        self.dsn = dsn
+        self.tamanho = max(1, tamanho)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._livres = []      # LIFO: a mais recente tem cache/plano quentes no backend
+        self._sessao = {}      # id(conn) -> ajustes aplicados
+        self._abertas = 0
+        self._em_uso = 0
+        self.pico_em_uso = 0
+        self.metricas: dict[str, _Metricas] = {}
+
+    # ---------------- retirada / devolução ----------------
+
+    def _retirar(self, etapa: str):
+        t0 = time.monotonic()
+        nova = False
+        with self._cond:
+            while True:
+                if self._livres:
+                    conn = self._livres.pop()
+                    break
+                if self._abertas < self.tamanho:
+                    self._abertas += 1
+                    conn, nova = None, True
+                    break
+                restante = self.timeout - (time.monotonic() - t0)
+                if restante <= 0:
+                    self._metrica(etapa).timeouts += 1
+                    raise PoolEsgotado(f"[POOL] {etapa}: nenhuma conexão livre em {self.timeout:g}s "
+                                       f"(tamanho {self.tamanho}; ajuste DB_POOL_TAMANHO)")
+                self._cond.wait(restante)
+            self._em_uso += 1
+            self.pico_em_uso = max(self.pico_em_uso, self._em_uso)
+        if nova:
+            try:
+                conn = psycopg2.connect(self.dsn)
+            except Exception:
+                self._devolver(None, descartar=True)
+                raise
+        return conn, time.monotonic() - t0
+
+    def _devolver(self, conn, descartar: bool = False):
+        if conn is not None and (descartar or conn.closed):
+            self._sessao.pop(id(conn), None)
+            with contextlib.suppress(Exception):
+                conn.close()
+            conn = None
+        with self._cond:
+            self._em_uso -= 1
+            if conn is None:
+                self._abertas -= 1
+            else:
+                self._livres.append(conn)
+            self._cond.notify()
+
+    def _aplicar(self, conn, ajustes: dict):
+        alvo = tuple(sorted(ajustes.items()))
+        if self._sessao.get(id(conn), ()) == alvo:
+            return
+        partes, params = [], []
+        if self._sessao.get(id(conn)):
+            partes.append("RESET ALL;")
+        if alvo:
+            partes.append("SELECT " + ", ".join("set_config(%s, %s, false)" for _ in alvo))
+            for k, v in alvo:
+                params += [k, str(v)]
+        with conn.cursor() as cur:
+            cur.execute(" ".join(partes), params)
+        if not conn.autocommit:
+            conn.commit()  # SET é transacional: um rollback do chamador não pode desfazê-lo
+        self._sessao[id(conn)] = alvo
+
+    @contextlib.contextmanager
+    def conexao(self, etapa: str = "padrao", autocommit: bool = False, **ajustes):
+        """
+        Conexão do pool com os ajustes de ETAPAS[etapa] (+ 'ajustes', que têm
+        precedência). Sem autocommit: commit no fim, rollback em erro.
+        """
+        conn, espera = self._retirar(etapa)
+        t0 = time.monotonic()
+        descartar = False
+        try:
+            conn.autocommit = autocommit
+            self._aplicar(conn, {**ETAPAS.get(etapa, {}), **ajustes})
+            yield conn
+            if not conn.autocommit:
+                conn.commit()
+        except BaseException as e:
+            descartar = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not conn.closed and not descartar:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    descartar = True
+            raise
+        finally:
+            with self._cond:
+                m = self._metrica(etapa)
+                m.retiradas += 1
+                m.espera_total += espera
+                m.espera_max = max(m.espera_max, espera)
+                m.esperas.append(espera)
+                m.uso_total += time.monotonic() - t0
+            self._devolver(conn, descartar)
+
+    # ---------------- métricas ----------------
+
+    def _metrica(self, etapa: str) -> _Metricas:
+        m = self.metricas.get(etapa)
+        if m is None:
+            m = self.metricas[etapa] = _Metricas()
+        return m
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "tamanho": self.tamanho, "abertas": self._abertas, "em_uso": self._em_uso,
+                "pico_em_uso": self.pico_em_uso,
+                "etapas": {
+                    e: {"retiradas": m.retiradas, "espera_total_s": round(m.espera_total, 3),
+                        "espera_max_ms": round(m.espera_max * 1000, 1), "espera_p95_ms": round(m.p95() * 1000, 1),
+                        "uso_total_s": round(m.uso_total, 3), "timeouts": m.timeouts}
+                    for e, m in sorted(self.metricas.items())
+                },
+            }
+
+    def resumo(self) -> str:
+        s = self.stats()
+        linhas = [f"[POOL] pico {s['pico_em_uso']}/{s['tamanho']} conexões em uso, {s['abertas']} abertas"]
+        for e, m in s["etapas"].items():
+            linhas.append(f"[POOL]   {e:8s} {m['retiradas']:6d} retirada(s)  espera total {m['espera_total_s']:.2f}s "
+                          f"máx {m['espera_max_ms']:.0f} ms p95 {m['espera_p95_ms']:.0f} ms  "
+                          f"em uso {m['uso_total_s']:.1f}s" + (f"  TIMEOUTS {m['timeouts']}" if m["timeouts"] else ""))
+        return "\n".join(linhas)
+
+    def fechar(self):
+        with self._cond:
+            livres, self._livres = self._livres, []
+            self._abertas -= len(livres)
+        for c in livres:
+            self._sessao.pop(id(c), None)
+            with contextlib.suppress(Exception):
+                c.close()
+
+
+_pools: dict[str, PoolDB] = {}
+_pools_lock = threading.Lock()
+
+def pool(cfg: DBConfig | None = None) -> PoolDB:
+    """Pool do processo para o banco de 'cfg' (padrão: DBConfig())."""
+    dsn = as_dsn(cfg or DBConfig())
+    with _pools_lock:
+        p = _pools.get(dsn)
+        if p is None:
+            p = _pools[dsn] = PoolDB(dsn)
+        return p
+
+def conexao(etapa: str = "padrao", cfg: DBConfig | None = None, autocommit: bool = False, **ajustes):
+    return pool(cfg).conexao(etapa, autocommit=autocommit, **ajustes)
+
+def imprimir_resumo():
+    for p in list(_pools.values()):
+        if p.metricas:
+            print(p.resumo())
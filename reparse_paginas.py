@@ -0,0 +1,150 @@
+# reparse_paginas.py
+"""
+Re-parse em paralelo (ProcessPoolExecutor) das páginas CNES arquivadas.
+
+O parse (BeautifulSoup + _norm + regex) é CPU-bound; aqui cada página é lida e
+parseada num processo worker, que devolve só o essencial (colunas + tuplas).
+O processo pai junta os resultados em blocos e faz UMA carga em massa pelo mesmo
+caminho do importar_offline.py (dimensões em lote + COPY + merge).
+
+Uso:
+  CNES_ARQUIVO_PAGINAS=paginas python reparse_paginas.py --dataset leito
+  python reparse_paginas.py --dir paginas --dataset equipamento --workers 8 --vcomp-inicio 202001
+  python reparse_paginas.py --dir paginas --dataset tipo_unidade --sem-carga   # só mede o parse
+  python reparse_paginas.py --dir paginas --dataset leito --backfill        # carga inicial, índices adiados
+"""
+
+import os
+import time
+import argparse
+import importlib
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from arquivo_paginas import ARQUIVO_DIR, iter_paginas, ler_pagina
+
+PARSERS = {
+    "leito":        ("scrape_cnes_leito", "parse_tabela_tipo_leito"),
+    "equipamento":  ("scrape_cnes_rr_equipamentos", "parse_equipamentos"),
+    "tipo_unidade": ("scrape_cnes_rr_tipo_unidade", "parse_tipos_unidade"),
+}
+PAGINAS_POR_BLOCO = 500  # páginas acumuladas no pai antes de virar um DataFrame
+
+_parser_cache = {}
+
+def _parser(dataset: str):
+    fn = _parser_cache.get(dataset)
+    if fn is None:
+        mod, nome = PARSERS[dataset]
+        fn = _parser_cache[dataset] = getattr(importlib.import_module(mod), nome)
+    return fn
+
+def parse_pagina(tarefa):
+    """
+    Executa no worker. tarefa = (dataset, vmun, vcomp, caminho).
+    Retorna (vmun, vcomp, colunas, linhas) ou (vmun, vcomp, None, erro_str).
+    """
+    dataset, vmun, vcomp, path = tarefa
+    try:
+        html = ler_pagina(path)
+        df = _parser(dataset)(html)
+    except Exception as e:
+        return vmun, vcomp, None, f"{type(e).__name__}: {e}"
+    if df is None or df.empty:
+        from cliente_cnes import pagina_sem_dados
+        if not pagina_sem_dados(html):
+            return vmun, vcomp, None, "nenhuma tabela reconhecida e sem aviso de sem dados"
+        return vmun, vcomp, [], []
+    df = df.astype(object).where(df.notna(), None)
+    return vmun, vcomp, list(df.columns), list(df.itertuples(index=False, name=None))
+
+
+def _catalogo_municipios(conn) -> dict[str, tuple[str, str]]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT codigo_municipio, uf, nome FROM dim_municipio")
+        return {c: (uf, nome) for c, uf, nome in cur.fetchall()}
+
+def _blocos(resultados, catalogo, stats):
+    """
+    Agrupa resultados dos workers em DataFrames no formato de saída dos scrapers.
+    """
+    import pandas as pd
+
+    pend = []
+    for vmun, vcomp, cols, linhas in resultados:
+        stats["paginas"] += 1
+        if cols is None:
+            stats["erros"] += 1
+            print(f"[WARN] {vcomp}/{vmun}: falha no parse ({linhas})")
+            continue
+        if not linhas:
+            stats["vazias"] += 1
+            continue
+        uf, nome = catalogo.get(vmun, ("RR", vmun))
+        df = pd.DataFrame(linhas, columns=cols)
+        df.insert(0, "VComp", vcomp)
+        df.insert(1, "UF", uf)
+        df.insert(2, "Codigo_Municipio", vmun)
+        df.insert(3, "Municipio", nome)
+        pend.append(df)
+        stats["linhas"] += len(df)
+        if len(pend) >= PAGINAS_POR_BLOCO:
+            yield pd.concat(pend, ignore_index=True)
+            pend = []
+    if pend:
+        yield pd.concat(pend, ignore_index=True)
+
+def main():
+    ap = argparse.ArgumentParser(description="Re-parse paralelo das páginas CNES arquivadas")
+    ap.add_argument("--dataset", required=True, choices=sorted(PARSERS))
+    ap.add_argument("--dir", default=ARQUIVO_DIR, help="Raiz do arquivo de páginas (padrão: $CNES_ARQUIVO_PAGINAS)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunksize", type=int, default=16, help="Páginas por tarefa enviada ao worker")
+    ap.add_argument("--vcomp-inicio")
+    ap.add_argument("--vcomp-fim")
+    ap.add_argument("--sem-carga", action="store_true", help="Só parseia (benchmark); não grava no banco")
+    ap.add_argument("--backfill", action="store_true",
+                    help="Carga inicial: adia os índices secundários do fato e reconstrói no fim (backfill_carga.py)")
+    ap.add_argument("--forcar", action="store_true",
+                    help="Com --backfill: aceita o fato já populado (o painel fica sem os índices até o fim)")
+    args = ap.parse_args()
+
+    if not args.dir:
+        raise SystemExit("Informe --dir ou defina CNES_ARQUIVO_PAGINAS.")
+
+    tarefas = [(args.dataset, vmun, vcomp, path)
+               for vmun, vcomp, path in iter_paginas(args.dir, args.dataset, args.vcomp_inicio, args.vcomp_fim)]
+    if not tarefas:
+        print(f"[REPARSE] nenhuma página em {args.dir}/{args.dataset}")
+        return
+    print(f"[REPARSE] {len(tarefas)} página(s), workers={args.workers}")
+
+    stats = {"paginas": 0, "vazias": 0, "erros": 0, "linhas": 0}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as ex:
+        resultados = ex.map(parse_pagina, tarefas, chunksize=args.chunksize)
+        if args.sem_carga:
+            for _ in _blocos(resultados, {}, stats):
+                pass
+        else:
+            from db_config import DBConfig
+            from pool_db import conexao, imprimir_resumo
+            from importar_offline import DATASETS_CSV, importar_blocos_cnes
+            cfg = DBConfig()
+            with conexao("bulk", cfg) as conn:
+                catalogo = _catalogo_municipios(conn)
+                modo = contextlib.nullcontext()
+                if args.backfill:
+                    from backfill_carga import ModoBackfill
+                    modo = ModoBackfill(conn, cfg, [DATASETS_CSV[args.dataset]["tabela"]], forcar=args.forcar)
+                with modo:
+                    importar_blocos_cnes(conn, _blocos(resultados, catalogo, stats), args.dataset,
+                                         f"{args.dir}/{args.dataset}")
+            imprimir_resumo()
+    dur = time.perf_counter() - t0
+
+    print(f"[REPARSE] {stats['paginas']} página(s) em {dur:.2f}s = {stats['paginas'] / dur:.1f} páginas/s "
+          f"(vazias={stats['vazias']}, erros={stats['erros']}, linhas={stats['linhas']})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# saida_particionada.py
+"""
+Saída colunar particionada (Parquet ou Arrow IPC) para os scrapers standalone.
+
+Layout (estilo hive):
+    <raiz>/<dataset>/vcomp=202401/parte.parquet
+    <raiz>/<dataset>/ano=2023/periodo=1º/municipio=boa_vista/parte.parquet
+    <raiz>/<dataset>/manifest.json
+
+Formatos:
+  - "parquet": compressão zstd; o menor em disco, ótimo para arquivar/transferir.
+  - "arrow":   Arrow IPC (Feather v2) sem compressão; pode ser aberto com
+               memory map e lido sem cópia (só as páginas usadas vão para a RAM).
+
+O manifest registra cada partição gravada (linhas, sha256, data). Os scrapers
+consultam o manifest para pular partições já capturadas numa nova execução.
+Arquivos e manifest são gravados em .tmp + os.replace (uma queda no meio não
+deixa partição pela metade marcada como capturada).
+
+Requer pyarrow>=14 (pip install "pyarrow>=14"; concat_tables com promote_options).
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+
+MANIFEST = "manifest.json"
+EXTENSOES = {"parquet": "parquet", "arrow": "arrow"}
+
+
+def _pa():
+    try:
+        import pyarrow as pa
+        return pa
+    except ImportError:
+        raise SystemExit("Saída colunar requer pyarrow>=14: pip install \"pyarrow>=14\"")
+
+def chave_particao(chave: dict) -> str:
+    """{'vcomp': '202401'} -> 'vcomp=202401' (ordem das chaves preservada)."""
+    return "/".join(f"{k}={v}" for k, v in chave.items())
+
+def _dir_dataset(raiz: str, dataset: str) -> str:
+    return os.path.join(raiz, dataset)
+
+def carregar_manifesto(raiz: str, dataset: str) -> dict:
+    path = os.path.join(_dir_dataset(raiz, dataset), MANIFEST)
+    if not os.path.exists(path):
+        return {"dataset": dataset, "particoes": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _salvar_manifesto(raiz: str, dataset: str, manifesto: dict):
+    d = _dir_dataset(raiz, dataset)
+    os.makedirs(d, exist_ok=True)
+    tmp = os.path.join(d, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(d, MANIFEST))
+
+def particao_capturada(manifesto: dict, chave: dict) -> bool:
+    return chave_particao(chave) in manifesto.get("particoes", {})
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def gravar_particao(df, raiz: str, dataset: str, chave: dict, formato: str = "parquet",
+                    manifesto: dict | None = None) -> str:
+    """
+    Grava 'df' (pandas) como uma partição e atualiza o manifest. Retorna o caminho.
+    Se 'manifesto' for passado ele é atualizado in-place (evita reler o arquivo).
+    """
+    if formato not in EXTENSOES:
+        raise ValueError(f"formato inválido: {formato} (opções: {', '.join(EXTENSOES)})")
+    pa = _pa()
+    chave_txt = chave_particao(chave)
+    d = os.path.join(_dir_dataset(raiz, dataset), *chave_txt.split("/"))
+    os.makedirs(d, exist_ok=True)
+    path = os.path.join(d, f"parte.{EXTENSOES[formato]}")
+    tmp = path + ".tmp"
+
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    if formato == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(tabela, tmp, compression="zstd")
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(tabela, tmp, compression="uncompressed")
+    os.replace(tmp, path)
+
+    if manifesto is None:
+        manifesto = carregar_manifesto(raiz, dataset)
+    manifesto.setdefault("particoes", {})[chave_txt] = {
+        "arquivo": os.path.relpath(path, _dir_dataset(raiz, dataset)),
+        "formato": formato,
+        "linhas": int(tabela.num_rows),
+        "bytes": os.path.getsize(path),
+        "sha256": _sha256(path),
+        "gravado_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    _salvar_manifesto(raiz, dataset, manifesto)
+    return path
+
+def ler_particao(path: str):
+    """
+    Lê uma partição como pyarrow.Table. Arrow IPC é aberto via memory map (sem cópia).
+    """
+    pa = _pa()
+    if path.endswith(".arrow"):
+        with pa.memory_map(path, "r") as src:
+            return pa.ipc.open_file(src).read_all()
+    import pyarrow.parquet as pq
+    return pq.read_table(path, memory_map=True)
+
+def ler_particoes(raiz: str, dataset: str, filtro=None):
+    """
+    Concatena as partições do manifest cujo dict de chave satisfaz filtro(chave_dict).
+    Ex.: ler_particoes("saida_cnes", "leito", lambda k: k["vcomp"] >= "202401")
+    Retorna pyarrow.Table (ou None se nada casar).
+    """
+    pa = _pa()
+    manifesto = carregar_manifesto(raiz, dataset)
+    tabelas = []
+    for chave_txt, meta in sorted(manifesto.get("particoes", {}).items()):
+        chave = dict(p.split("=", 1) for p in chave_txt.split("/"))
+        if filtro is not None and not filtro(chave):
+            continue
+        tabelas.append(ler_particao(os.path.join(_dir_dataset(raiz, dataset), meta["arquivo"])))
+    if not tabelas:
+        return None
+    return pa.concat_tables(tabelas, promote_options="default")
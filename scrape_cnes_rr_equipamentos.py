@@ -1,28 +1,42 @@
 # scrape_cnes_rr_equipamentos.py
-import re, time, unicodedata
+from __future__ import annotations
+import os, re, unicodedata
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import warnings
+
+from importacao_tardia import tardio
+
+# pesados: só carregam quando uma página é de fato buscada/parseada
+pd = tardio("pandas")
+requests = tardio("requests")
+BeautifulSoup = tardio("bs4", "BeautifulSoup")
+# requisições ao cnes2 usam verify=False; filtra o aviso sem importar urllib3 aqui
+warnings.filterwarnings("ignore", message="Unverified HTTPS request")
+
+from cliente_cnes import buscar_pagina
+from descoberta_competencias import competencias_publicadas
 
 # -------------------- Config --------------------
 UF_CODE = 14  # Roraima
 VCOMP_INICIO = "201202"  # competência inicial (YYYYMM)
-VCOMP_FIM    = "202508"  # competência final (YYYYMM)
+VCOMP_FIM    = None      # competência final (YYYYMM); None = última publicada
 
 SAIDA_POR_MES = False
 SAIDA_ARQUIVO = "cnes_rr_equipamentos_201202_202508.csv"
+SAIDA_FORMATO = "csv"   # "csv" | "parquet" | "arrow" (colunar particionado por vcomp)
+SAIDA_DIR = "saida_cnes"  # raiz da saída colunar (ver saida_particionada.py)
 
-SLEEP_ENTRE_REQUISICOES = 0.8
+# espaçamento entre requisições: adaptativo (AIMD), ver cliente_cnes.py
 MAX_RETRIES = 3
 TIMEOUT = 30
 
-CNES_URL = "https://cnes2.datasus.gov.br/Mod_Ind_Equipamento.asp"
-IBGE_MUN_URL = f"https://servicodados.ibge.gov.br/api/v1/localidades/estados/{UF_CODE}/municipios"
+# bases sobrescrevíveis para apontar a um mock local (ver mock_datasus.py)
+CNES_BASE_URL = os.getenv("CNES_BASE_URL", "https://cnes2.datasus.gov.br").rstrip("/")
+IBGE_BASE_URL = os.getenv("IBGE_BASE_URL", "https://servicodados.ibge.gov.br").rstrip("/")
+CNES_URL = f"{CNES_BASE_URL}/Mod_Ind_Equipamento.asp"
+IBGE_MUN_URL = f"{IBGE_BASE_URL}/api/v1/localidades/estados/{UF_CODE}/municipios"
 HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; CNES-scraper)"}
 
 # -------------------- Utils ---------------------
@@ -142,32 +156,30 @@ def parse_equipamentos(html: str) -> pd.DataFrame | None:
 # ------------------ Scraper principal ------------------
 def fetch_equipamentos(vmun6: str, vcomp: str) -> pd.DataFrame | None:
     params = {"VEstado": UF_CODE, "VMun": vmun6, "VComp": vcomp}
-    last_ex = None
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            r = requests.get(CNES_URL, params=params, headers=HEADERS, timeout=TIMEOUT, verify=False)
-            r.raise_for_status()
-            r.encoding = "latin-1"  # página em ISO-8859-1
-            return parse_equipamentos(r.text)
-        except Exception as e:
-            last_ex = e
-            time.sleep(1.2 * attempt)
-    print(f"[ERRO] VMun={vmun6} VComp={vcomp} -> {last_ex}")
-    return None
+    # retry só para falhas transitórias; 4xx/parse = permanente (ver cliente_cnes.py)
+    return buscar_pagina("equipamento", CNES_URL, params, parse_equipamentos, vmun6, vcomp,
+                         headers=HEADERS, timeout=TIMEOUT, max_retries=MAX_RETRIES)
 
 # ------------------------ Runner ------------------------
 def main():
     municipios = baixar_municipios_ibge()  # [{'codigo': '140002', 'nome': 'Amajari'}, ...]
-    comps = list(gerar_competencias(VCOMP_INICIO, VCOMP_FIM))
+    comps = competencias_publicadas(VCOMP_INICIO, VCOMP_FIM, dataset="equipamento")  # só meses já publicados
 
     linhas_total = 0
     first_write = False
 
+    colunar = SAIDA_FORMATO != "csv"
+    if colunar:
+        from saida_particionada import carregar_manifesto, particao_capturada, gravar_particao
+        manifesto = carregar_manifesto(SAIDA_DIR, "equipamento")
+
     for vcomp in comps:
+        if colunar and particao_capturada(manifesto, {"vcomp": vcomp}):
+            print(f"[SKIP] {vcomp}: partição já capturada em {SAIDA_DIR}/equipamento")
+            continue
         registros_mes = []
         for m in municipios:
             df = fetch_equipamentos(m["codigo"], vcomp)
-            time.sleep(SLEEP_ENTRE_REQUISICOES)
             if df is None or df.empty:
                 continue
             # metadados
@@ -182,7 +194,12 @@ def main():
             continue
 
         df_mes = pd.concat(registros_mes, ignore_index=True)
-        if SAIDA_POR_MES:
+        if colunar:
+            path = gravar_particao(df_mes, SAIDA_DIR, "equipamento", {"vcomp": vcomp},
+                                   formato=SAIDA_FORMATO, manifesto=manifesto)
+            linhas_total += len(df_mes)
+            print(f"[OK] {vcomp}: {len(df_mes)} linhas -> {path}")
+        elif SAIDA_POR_MES:
             path = f"cnes_rr_equipamentos_{vcomp}.csv"
             df_mes.to_csv(path, index=False, encoding="utf-8")
             print(f"[OK] {vcomp}: {len(df_mes)} linhas -> {path}")
@@ -6,9 +6,12 @@ from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from decimal import Decimal, InvalidOperation
 from datetime import datetime
-import csv, time, re, unicodedata, os
+import csv, json, time, re, unicodedata, os
 
-URL = "http://siops.datasus.gov.br/consleirespfiscal.php"
+URL = os.getenv("SIOPS_URL", "http://siops.datasus.gov.br/consleirespfiscal.php")
+
+SAIDA_FORMATO = "csv"     # "csv" (árvore siops_csv/) | "parquet" | "arrow" (particionado)
+SAIDA_DIR = "saida_siops"  # raiz da saída colunar (ver saida_particionada.py)
 
 # ---------- util ----------
 def parse_brl_number(txt: str):
@@ -153,6 +156,12 @@ def save_matrix_csv(path, matrix):
 
 # ---------- fluxo principal ----------
 def main():
+    colunar = SAIDA_FORMATO != "csv"
+    if colunar:
+        import pandas as pd
+        from saida_particionada import carregar_manifesto, particao_capturada, gravar_particao
+        manifesto = carregar_manifesto(SAIDA_DIR, "siops")
+
     driver = setup_driver(headless=False)
     wait = WebDriverWait(driver, 30)
     ano_atual = datetime.now().year
@@ -196,6 +205,10 @@ def main():
                     print(f"→ {municipio} - {ano}: {len(periodos)} períodos: {periodos}")
 
                     for periodo in periodos:
+                        chave = {"ano": ano, "periodo": periodo, "municipio": slugify(municipio)}
+                        if colunar and particao_capturada(manifesto, chave):
+                            print(f"   ↷ {municipio} - Ano {ano} - Período {periodo}: já capturado")
+                            continue
                         print(f"   ⏳ {municipio} - Ano {ano} - Período {periodo}")
                         try:
                             select_uf = Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbUF"))))
@@ -224,7 +237,9 @@ def main():
                             print(f"      🔎 {len(tabelas)} tabelas encontradas")
 
                             out_dir = os.path.join("siops_csv", slugify(municipio), ano, f"periodo_{periodo}")
-                            os.makedirs(out_dir, exist_ok=True)
+                            if not colunar:
+                                os.makedirs(out_dir, exist_ok=True)
+                            linhas_particao = []
 
                             for idx, tbl in enumerate(tabelas, start=1):
                                 matrix = table_to_matrix(tbl)
@@ -235,10 +250,22 @@ def main():
                                     print(f"      ↷ Ignorando Tabela {idx:02d} ({titulo})")
                                     continue
                                 fname = f"siops_table{idx:02d}_{slug}.csv"
+                                if colunar:
+                                    linhas_particao.append({
+                                        "municipio": municipio, "ano": int(ano), "periodo": periodo,
+                                        "tabela_idx": idx, "titulo": titulo,
+                                        "matrix": json.dumps(matrix, ensure_ascii=False),
+                                    })
+                                    continue
                                 path = os.path.join(out_dir, fname)
                                 save_matrix_csv(path, matrix)
                                 print(f"      ✓ {fname}")
 
+                            if colunar and linhas_particao:
+                                path = gravar_particao(pd.DataFrame(linhas_particao), SAIDA_DIR, "siops", chave,
+                                                       formato=SAIDA_FORMATO, manifesto=manifesto)
+                                print(f"      ✓ {len(linhas_particao)} tabela(s) -> {path}")
+
                             driver.get(URL)
                             wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
 
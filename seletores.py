@@ -0,0 +1,74 @@
+# seletores.py
+"""
+Seletores de recarga dirigida, comuns ao main.py e aos loaders.
+
+  --vcomp-inicio AAAAMM / --vcomp-fim AAAAMM   faixa de competências (CNES)
+  --municipios 140010,140002                   códigos IBGE (6 ou 7 dígitos)
+  --ano 2023,2024 / --periodo 6,12             SIOPS
+
+Os seletores só estreitam o que é processado; para sobrescrever dados já
+carregados nas células escolhidas, combine com --force. Ex.: um mês ruim em Boa Vista
+    python cnes_tipo_leito_to_pg.py --vcomp-inicio 202403 --vcomp-fim 202403 --municipios 140010 --force
+Com --vcomp-inicio e --vcomp-fim juntos, os loaders CNES usam a faixa como veio,
+sem sondar quais competências já foram publicadas.
+"""
+
+import re
+
+
+def lista_csv(valor: str | None) -> list[str] | None:
+    if not valor:
+        return None
+    return [v.strip() for v in valor.split(",") if v.strip()]
+
+def codigos_municipio(valor: str | None) -> set[str] | None:
+    """Aceita código IBGE de 7 dígitos (com DV) ou de 6 (CNES); devolve 6 dígitos."""
+    itens = lista_csv(valor)
+    if itens is None:
+        return None
+    out = set()
+    for c in itens:
+        if not re.fullmatch(r"\d{6,7}", c):
+            raise SystemExit(f"Código de município inválido: {c!r}")
+        out.add(c[:6])
+    return out
+
+def _vcomp(valor: str | None) -> str | None:
+    if valor and not re.fullmatch(r"\d{4}(0[1-9]|1[0-2])", valor):
+        raise SystemExit(f"Competência inválida: {valor!r} (use AAAAMM)")
+    return valor
+
+def adicionar_seletores_cnes(ap):
+    ap.add_argument("--vcomp-inicio", type=_vcomp, metavar="AAAAMM", help="Primeira competência a processar")
+    ap.add_argument("--vcomp-fim", type=_vcomp, metavar="AAAAMM", help="Última competência a processar")
+    ap.add_argument("--municipios", metavar="COD,COD", help="Só estes municípios (código IBGE)")
+
+def adicionar_seletores_siops(ap):
+    ap.add_argument("--ano", metavar="AAAA,AAAA", help="Só estes anos")
+    ap.add_argument("--periodo", metavar="P,P", help="Só estes períodos (texto do combo do SIOPS)")
+    ap.add_argument("--municipios", metavar="COD,COD", help="Só estes municípios (código IBGE)")
+
+def filtrar_municipios(municipios: list[dict], codigos: set[str] | None) -> list[dict]:
+    """Filtra a lista [{'codigo','nome'}] do IBGE; avisa códigos que não existem na UF."""
+    if codigos is None:
+        return municipios
+    sel = [m for m in municipios if str(m["codigo"])[:6] in codigos]
+    faltando = codigos - {str(m["codigo"])[:6] for m in sel}
+    if faltando:
+        print(f"[WARN] município(s) fora da lista do IBGE ignorado(s): {', '.join(sorted(faltando))}")
+    return sel
+
+def argumentos_repassados(args, script: str) -> list[str]:
+    """Seletores do main.py que valem para o script (CNES ou SIOPS)."""
+    out = []
+    if script.startswith("cnes_"):
+        for flag in ("vcomp_inicio", "vcomp_fim"):
+            if getattr(args, flag, None):
+                out += ["--" + flag.replace("_", "-"), getattr(args, flag)]
+    elif script.startswith("siops_"):
+        for flag in ("ano", "periodo"):
+            if getattr(args, flag, None):
+                out += ["--" + flag, getattr(args, flag)]
+    if getattr(args, "municipios", None):
+        out += ["--municipios", args.municipios]
+    return out
@@ -1,19 +1,28 @@
 # siops_to_pg.py
+from __future__ import annotations
+import os
 import json
 import time
 import argparse
 from datetime import datetime
 
-import psycopg2
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import Select, WebDriverWait
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+from importacao_tardia import tardio
+
+# selenium/webdriver_manager só carregam quando o navegador é de fato aberto
+webdriver = tardio("selenium.webdriver")
+Service = tardio("selenium.webdriver.chrome.service", "Service")
+Select = tardio("selenium.webdriver.support.ui", "Select")
+WebDriverWait = tardio("selenium.webdriver.support.ui", "WebDriverWait")
+By = tardio("selenium.webdriver.common.by", "By")
+EC = tardio("selenium.webdriver.support.expected_conditions")
+ChromeDriverManager = tardio("webdriver_manager.chrome", "ChromeDriverManager")
 
 from db_config import DBConfig
-from db_utils import get_conn, upsert_dicts, get_or_create_municipio
+from db_utils import upsert_dicts, get_or_create_municipio, gravar_com_retentativa
+from pool_db import conexao, imprimir_resumo
+from seletores import adicionar_seletores_siops, lista_csv, codigos_municipio
+from eventos_carga import publicar_carga
+from tabela_siops import table_to_matrix, guess_title_from_table
 
 # Tenta reaproveitar função de municípios dos scrapers CNES
 try:
@@ -24,7 +33,7 @@ except Exception:
     except Exception:
         _baixar_mun = None
 
-URL = "http://siops.datasus.gov.br/consleirespfiscal.php"
+URL = os.getenv("SIOPS_URL", "http://siops.datasus.gov.br/consleirespfiscal.php")
 
 # ---------------------------------------------------------------------
 # util
@@ -71,72 +80,6 @@ def switch_to_results_context(driver, wait) -> bool:
     driver.switch_to.default_content()
     return False
 
-def table_to_matrix(tbl):
-    """
-    Converte <table> em matriz (respeitando colspan/rowspan).
-    """
-    rows = tbl.find_elements(By.XPATH, ".//tr")
-    matrix, span_down = [], []
-    for tr in rows:
-        cells = tr.find_elements(By.XPATH, ".//th | .//td")
-        if not span_down:
-            span_down = [None] * 64
-        row, col_idx = [], 0
-
-        def advance(cidx):
-            while True:
-                if cidx >= len(span_down):
-                    span_down.extend([None] * 16)
-                if cidx >= len(row):
-                    row.extend([""] * (cidx - len(row) + 1))
-                if span_down[cidx]:
-                    text, left = span_down[cidx]
-                    row[cidx] = text
-                    left -= 1
-                    span_down[cidx] = (text, left) if left > 0 else None
-                    cidx += 1
-                else:
-                    break
-            return cidx
-
-        col_idx = advance(col_idx)
-        for cell in cells:
-            txt = cell.get_attribute("innerText").strip()
-            colspan = cell.get_attribute("colspan")
-            rowspan = cell.get_attribute("rowspan")
-            cspan = int(colspan) if colspan and colspan.isdigit() else 1
-            rspan = int(rowspan) if rowspan and rowspan.isdigit() else 1
-
-            if col_idx + cspan > len(row):
-                row.extend([""] * (col_idx + cspan - len(row)))
-            for k in range(cspan):
-                row[col_idx + k] = txt
-            if rspan > 1:
-                for k in range(cspan):
-                    j = col_idx + k
-                    if j >= len(span_down):
-                        span_down.extend([None] * (j - len(span_down) + 1))
-                    span_down[j] = (txt, rspan - 1)
-            col_idx += cspan
-            col_idx = advance(col_idx)
-
-        while row and row[-1] == "":
-            row.pop()
-        matrix.append(row)
-
-    width = max((len(r) for r in matrix), default=0)
-    for r in matrix:
-        if len(r) < width:
-            r.extend([""] * (width - len(r)))
-    return matrix
-
-def guess_title_from_table(matrix):
-    for i in range(min(3, len(matrix))):
-        line = " ".join(cell for cell in matrix[i][:3] if cell).strip()
-        if line:
-            return line[:150]
-    return "tabela"
-
 def _catalogo_municipios_rr():
     """
     Dict: NOME_UPPER -> (codigo_ibge, nome_fmt)
@@ -155,7 +98,11 @@ def _catalogo_municipios_rr():
 # ---------------------------------------------------------------------
 # núcleo
 
-def run_and_store(headless=True, force=False, show=False):
+def run_and_store(headless=True, force=False, show=False, anos_sel=None, periodos_sel=None, municipios_sel=None):
+    """
+    anos_sel / periodos_sel: listas de texto (como no combo); municipios_sel: códigos IBGE (6 dígitos).
+    None = todos.
+    """
     if show:
         headless = False
 
@@ -181,6 +128,13 @@ def run_and_store(headless=True, force=False, show=False):
             if opt.text.strip()
         ]
         print(f"[UI] {len(municipios)} municípios carregados no combo.")
+        if municipios_sel is not None:
+            municipios = [m for m in municipios
+                          if catalogo.get(m.strip().upper(), ("",))[0][:6] in municipios_sel]
+            print(f"[SEL] municípios: {municipios}")
+            if not municipios:
+                print("[SEL] nenhum município do combo corresponde aos códigos informados.")
+                return
 
         # anos disponíveis
         anos_opts = [
@@ -189,130 +143,143 @@ def run_and_store(headless=True, force=False, show=False):
         ]
         ano_atual = datetime.now().year
         anos = [a for a in anos_opts if a.isdigit() and 2008 <= int(a) <= ano_atual]
+        if anos_sel is not None:
+            anos = [a for a in anos if a in anos_sel]
         print(f"[UI] Anos disponíveis: {anos}")
 
         cfg = DBConfig()
-        with get_conn(cfg) as conn:
-            for ano in anos:
-                # períodos dentro do ano
-                select_periodo = Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbPeriodo"))))
-                periodos = [opt.text.strip() for opt in select_periodo.options if opt.text.strip()]
-                print(f"[LOOP] Ano {ano}: períodos={periodos}")
-
-                for periodo in periodos:
-                    print(f"[STEP] Probe {ano}-{periodo} ...")
-                    try:
-                        # ---------- PROBE: verificar se existe dado no site ----------
-                        Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))).select_by_visible_text("Roraima")
-                        Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbMunicipio[]")))).select_by_visible_text(municipios[0])
-                        Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbAno")))).select_by_visible_text(ano)
-                        Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbPeriodo")))).select_by_visible_text(periodo)
-                        wait.until(EC.element_to_be_clickable((By.NAME, "BtConsultar"))).click()
-
-                        if not switch_to_results_context(driver, wait):
-                            print(f"[WARN] {ano}-{periodo}: sem contexto de resultado; pulando período.")
-                            driver.get(URL); wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
-                            Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
-                            continue
+        for ano in anos:
+            # períodos dentro do ano
+            select_periodo = Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbPeriodo"))))
+            periodos = [opt.text.strip() for opt in select_periodo.options if opt.text.strip()]
+            if periodos_sel is not None:
+                periodos = [p for p in periodos if p in periodos_sel]
+            print(f"[LOOP] Ano {ano}: períodos={periodos}")
+
+            for periodo in periodos:
+                print(f"[STEP] Probe {ano}-{periodo} ...")
+                try:
+                    # ---------- PROBE: verificar se existe dado no site ----------
+                    Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))).select_by_visible_text("Roraima")
+                    Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbMunicipio[]")))).select_by_visible_text(municipios[0])
+                    Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbAno")))).select_by_visible_text(ano)
+                    Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbPeriodo")))).select_by_visible_text(periodo)
+                    wait.until(EC.element_to_be_clickable((By.NAME, "BtConsultar"))).click()
+
+                    if not switch_to_results_context(driver, wait):
+                        print(f"[WARN] {ano}-{periodo}: sem contexto de resultado; pulando período.")
+                        driver.get(URL); wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
+                        Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+                        continue
 
-                        wait.until(lambda d: len(d.find_elements(By.CSS_SELECTOR, "table.tam2.tdExterno")) > 0)
-                        tabelas_probe = driver.find_elements(By.CSS_SELECTOR, "table.tam2.tdExterno")
-                        if not tabelas_probe:
-                            print(f"[SKIP] {ano}-{periodo}: site sem tabelas — pulando período.")
+                    wait.until(lambda d: len(d.find_elements(By.CSS_SELECTOR, "table.tam2.tdExterno")) > 0)
+                    tabelas_probe = driver.find_elements(By.CSS_SELECTOR, "table.tam2.tdExterno")
+                    if not tabelas_probe:
+                        print(f"[SKIP] {ano}-{periodo}: site sem tabelas — pulando período.")
+                        driver.get(URL); wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
+                        Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+                        continue
+
+                    # ---------- SKIP ÚNICO por (ano, periodo) ----------
+                    if not force:
+                        with conexao("leitura", cfg, autocommit=True) as conn, conn.cursor() as cur:
+                            cur.execute(
+                                "SELECT 1 FROM siops_tabelas WHERE ano=%s AND periodo=%s LIMIT 1",
+                                (int(ano), str(periodo))
+                            )
+                            existe = cur.fetchone() is not None
+                        if existe:
+                            print(f"[SKIP] {ano}-{periodo}: já existe no banco — pulando período.")
                             driver.get(URL); wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
                             Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
                             continue
 
-                        # ---------- SKIP ÚNICO por (ano, periodo) ----------
-                        if not force:
-                            with conn.cursor() as cur:
-                                cur.execute(
-                                    "SELECT 1 FROM siops_tabelas WHERE ano=%s AND periodo=%s LIMIT 1",
-                                    (int(ano), str(periodo))
-                                )
-                                if cur.fetchone():
-                                    print(f"[SKIP] {ano}-{periodo}: já existe no banco — pulando período.")
-                                    driver.get(URL); wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
-                                    Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
-                                    continue
-
-                        # ---------- RASPAGEM DE TODOS MUNICÍPIOS ----------
-                        driver.get(URL)
-                        wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
-                        Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+                    # ---------- RASPAGEM DE TODOS MUNICÍPIOS ----------
+                    driver.get(URL)
+                    wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
+                    Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+
+                    for municipio in municipios:
+                        try:
+                            Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))).select_by_visible_text("Roraima")
+                            Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbMunicipio[]")))).select_by_visible_text(municipio)
+                            Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbAno")))).select_by_visible_text(ano)
+                            Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbPeriodo")))).select_by_visible_text(periodo)
+                            wait.until(EC.element_to_be_clickable((By.NAME, "BtConsultar"))).click()
+
+                            if not switch_to_results_context(driver, wait):
+                                print(f"[WARN] {ano}-{periodo}/{municipio}: sem resultados; pulando município.")
+                                driver.get(URL); wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
+                                Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+                                continue
 
-                        for municipio in municipios:
-                            try:
-                                Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))).select_by_visible_text("Roraima")
-                                Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbMunicipio[]")))).select_by_visible_text(municipio)
-                                Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbAno")))).select_by_visible_text(ano)
-                                Select(wait.until(EC.presence_of_element_located((By.NAME, "cmbPeriodo")))).select_by_visible_text(periodo)
-                                wait.until(EC.element_to_be_clickable((By.NAME, "BtConsultar"))).click()
-
-                                if not switch_to_results_context(driver, wait):
-                                    print(f"[WARN] {ano}-{periodo}/{municipio}: sem resultados; pulando município.")
-                                    driver.get(URL); wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
-                                    Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+                            wait.until(lambda d: len(d.find_elements(By.CSS_SELECTOR, "table.tam2.tdExterno")) > 0)
+                            tabelas = driver.find_elements(By.CSS_SELECTOR, "table.tam2.tdExterno")
+
+                            # resolve municipio_id via catálogo
+                            nome_up = municipio.strip().upper()
+                            cod_ibge, nome_fmt = catalogo.get(nome_up, ("000000", municipio))
+
+                            # extração das tabelas é do navegador; a conexão só sai do pool para gravar
+                            batch = []
+                            for idx, tbl in enumerate(tabelas, start=1):
+                                matrix = table_to_matrix(tbl)
+                                titulo = guess_title_from_table(matrix)
+                                # ignora agregados UF
+                                tnorm = (titulo or "").strip().lower()
+                                if tnorm.startswith("uf:") or tnorm.startswith("uf_"):
                                     continue
-
-                                wait.until(lambda d: len(d.find_elements(By.CSS_SELECTOR, "table.tam2.tdExterno")) > 0)
-                                tabelas = driver.find_elements(By.CSS_SELECTOR, "table.tam2.tdExterno")
-
-                                # resolve municipio_id via catálogo
-                                nome_up = municipio.strip().upper()
-                                cod_ibge, nome_fmt = catalogo.get(nome_up, ("000000", municipio))
-                                mun_id = get_or_create_municipio(conn, cod_ibge, "RR", nome_fmt)
-
-                                batch = []
-                                for idx, tbl in enumerate(tabelas, start=1):
-                                    matrix = table_to_matrix(tbl)
-                                    titulo = guess_title_from_table(matrix)
-                                    # ignora agregados UF
-                                    tnorm = (titulo or "").strip().lower()
-                                    if tnorm.startswith("uf:") or tnorm.startswith("uf_"):
-                                        continue
-                                    batch.append({
-                                        "municipio_id": mun_id,
-                                        "ano": int(ano),
-                                        "periodo": str(periodo),
-                                        "tabela_idx": idx,
-                                        "titulo": titulo,
-                                        "matrix": json.dumps(matrix, ensure_ascii=False)
-                                    })
-
-                                if batch:
-                                    rows_total += upsert_dicts(
+                                batch.append({
+                                    "municipio_id": None,  # resolvido na gravação
+                                    "ano": int(ano),
+                                    "periodo": str(periodo),
+                                    "tabela_idx": idx,
+                                    "titulo": titulo,
+                                    "matrix": json.dumps(matrix, ensure_ascii=False)
+                                })
+
+                            if batch:
+                                def gravar(conn):
+                                    mun_id = get_or_create_municipio(conn, cod_ibge, "RR", nome_fmt)
+                                    for r in batch:
+                                        r["municipio_id"] = mun_id
+                                    n = upsert_dicts(
                                         conn,
                                         table="siops_tabelas",
                                         rows=batch,
                                         pkey_cols=["municipio_id","ano","periodo","tabela_idx"],
                                         update_cols=["titulo","matrix"]
                                     )
-                                    conn.commit()
-                                    print(f"[DB] {ano}-{periodo}/{municipio}: +{len(batch)} tabela(s).")
+                                    publicar_carga(conn, "siops", [cod_ibge], ano=int(ano), periodo=str(periodo))
+                                    return n
 
-                                # volta para próxima iteração
-                                driver.get(URL)
-                                wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
-                                Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
-                            except Exception as e:
-                                print(f"[WARN] {ano}-{periodo}/{municipio}: erro ({e}); continuando...")
-                                driver.get(URL)
-                                wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
-                                Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
-                                continue
+                                with conexao("carga", cfg) as conn:
+                                    rows_total += gravar_com_retentativa(conn, gravar, rotulo=f"{ano}-{periodo}/{municipio}")
+                                print(f"[DB] {ano}-{periodo}/{municipio}: +{len(batch)} tabela(s).")
 
-                    except Exception as e:
-                        print(f"[WARN] {ano}-{periodo}: falha no probe ({e}); pulando período.")
-                        driver.get(URL)
-                        wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
-                        Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
-                        continue
+                            # volta para próxima iteração
+                            driver.get(URL)
+                            wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
+                            Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+                        except Exception as e:
+                            print(f"[WARN] {ano}-{periodo}/{municipio}: erro ({e}); continuando...")
+                            driver.get(URL)
+                            wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
+                            Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+                            continue
+
+                except Exception as e:
+                    print(f"[WARN] {ano}-{periodo}: falha no probe ({e}); pulando período.")
+                    driver.get(URL)
+                    wait.until(EC.presence_of_element_located((By.NAME, "cmbUF")))
+                    Select(driver.find_element(By.NAME, "cmbUF")).select_by_visible_text("Roraima")
+                    continue
 
     finally:
         driver.quit()
 
     print(f"✅ SIOPS concluído. Total de linhas upsert: {rows_total}")
+    imprimir_resumo()
 
 # ---------------------------------------------------------------------
 
@@ -320,5 +287,8 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--force", action="store_true", help="Reprocessa anos/períodos já existentes no banco")
     ap.add_argument("--show", action="store_true", help="Mostra o navegador (sem headless)")
+    adicionar_seletores_siops(ap)
     args = ap.parse_args()
-    run_and_store(headless=not args.show, force=args.force, show=args.show)
+    run_and_store(headless=not args.show, force=args.force, show=args.show,
+                  anos_sel=lista_csv(args.ano), periodos_sel=lista_csv(args.periodo),
+                  municipios_sel=codigos_municipio(args.municipios))
@@ -0,0 +1,268 @@
+# stress_upserts.py
+"""
+Stress de escritores concorrentes na mesma competência (schema descartável).
+
+N threads, cada uma com sua conexão do pool, gravam rodadas sobre os mesmos
+municípios e itens de uma competência, como vários loaders/shards paralelos
+revisando a mesma janela de refresh: dimensões, upsert do fato e remoção dos
+itens que saíram da célula — com conjuntos de itens sorteados por rodada, então
+as células se sobrepõem entre escritores o tempo todo.
+
+Dois caminhos:
+  legado    linhas embaralhadas, dimensões e fato numa transação só, páginas
+            pequenas de upsert e DELETE sem ordem; deadlock = rodada perdida
+  ordenado  o caminho dos loaders: dimensões em transação própria e ordem de
+            chave, travar_celulas (células em ordem) + upsert_dicts +
+            remover_ausentes em ordem de PK, tudo via gravar_com_retentativa
+
+Reporta rodadas gravadas/perdidas, deadlocks, retentativas, linhas/s, p95 por
+rodada e amostras de backends esperando lock; no fim confere que cada célula
+ficou exatamente com o conjunto de itens da última rodada que a gravou.
+
+Uso:
+  python stress_upserts.py --escritores 8 --rodadas 30 --municipios 20 --itens 40
+  python stress_upserts.py --modo ordenado --escritores 16
+"""
+
+import io
+import sys
+import time
+import random
+import argparse
+import itertools
+import threading
+import contextlib
+
+from psycopg2.extras import execute_values
+
+import db_utils
+from db_config import DBConfig
+from db_utils import (
+    get_or_create_competencia, get_or_create_municipio, get_or_create_item,
+    upsert_dicts, travar_celulas, remover_ausentes, gravar_com_retentativa,
+)
+from pool_db import conexao, pool
+from eventos_carga import publicar_carga
+from create_db_and_tables import aplicar_migracoes
+
+SCHEMA = "bench_stress"
+TABELA = "fato_cnes_leito"
+PKEY = ["competencia_id", "municipio_id", "item_id"]
+METRICAS = ["existente", "sus", "habilitados"]
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    s = sorted(valores)
+    return s[min(len(s) - 1, int(len(s) * p / 100))]
+
+def _preparar(cfg):
+    with conexao("padrao", cfg, autocommit=True, search_path=SCHEMA) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            aplicar_migracoes(conn)
+
+def _sortear(rnd, args):
+    """Uma rodada: (municípios, itens) sorteados; cada município com ~80% dos itens."""
+    municipios = rnd.sample(range(args.municipios), max(1, args.municipios * 3 // 4))
+    return {m: sorted(rnd.sample(range(args.itens), max(1, args.itens * 4 // 5))) for m in municipios}
+
+def _cod_mun(m):
+    return f"{140000 + m:06d}"
+
+# ------------------------------ caminho legado ------------------------------
+
+def _rodada_legado(conn, vcomp, celulas, rnd) -> int:
+    """
+    Como era antes: ordem de chegada, transação longa, sem retentativa. A
+    competência já vem do get_or_create sem DO UPDATE: com ele, todos os
+    escritores faziam fila na mesma linha de dim_competencia e só um gravava por vez.
+    """
+    mun_ids, item_ids = {}, {}
+    comp_id = None
+    pares = [(m, i) for m, itens in celulas.items() for i in itens]
+    rnd.shuffle(pares)
+    rows = []
+    with conn.cursor() as cur:
+        for m, i in pares:
+            if comp_id is None:
+                comp_id = get_or_create_competencia(conn, vcomp)
+            if m not in mun_ids:
+                mun_ids[m] = get_or_create_municipio(conn, _cod_mun(m), "RR", f"Municipio {m}")
+            if i not in item_ids:
+                item_ids[i] = get_or_create_item(conn, "leito", str(i), "GRUPO", f"LEITO {i}")
+            rows.append({"competencia_id": comp_id, "municipio_id": mun_ids[m], "item_id": item_ids[i],
+                         "existente": rnd.randint(0, 50), "sus": rnd.randint(0, 30), "habilitados": rnd.randint(0, 20)})
+        execute_values(cur, f"""
+            INSERT INTO {TABELA} (competencia_id, municipio_id, item_id, existente, sus, habilitados)
+            VALUES %s
+            ON CONFLICT (competencia_id, municipio_id, item_id)
+            DO UPDATE SET existente=EXCLUDED.existente, sus=EXCLUDED.sus, habilitados=EXCLUDED.habilitados, loaded_at=NOW()
+        """, [tuple(r[c] for c in PKEY + METRICAS) for r in rows], page_size=50)
+        for m in rnd.sample(list(celulas), len(celulas)):
+            cur.execute(f"DELETE FROM {TABELA} WHERE competencia_id=%s AND municipio_id=%s AND item_id <> ALL(%s)",
+                        (comp_id, mun_ids[m], [item_ids[i] for i in celulas[m]]))
+    conn.commit()
+    return len(rows)
+
+# ------------------------------ caminho ordenado ------------------------------
+
+def _rodada_ordenada(conn, vcomp, celulas, rnd, rotulo, seq) -> tuple[int, int]:
+    def dimensoes(conn):
+        comp_id = get_or_create_competencia(conn, vcomp)
+        mun_ids = {m: get_or_create_municipio(conn, _cod_mun(m), "RR", f"Municipio {m}") for m in sorted(celulas)}
+        todos = sorted({i for itens in celulas.values() for i in itens})
+        item_ids = {i: get_or_create_item(conn, "leito", str(i), "GRUPO", f"LEITO {i}") for i in todos}
+        return comp_id, mun_ids, item_ids
+
+    comp_id, mun_ids, item_ids = gravar_com_retentativa(conn, dimensoes, rotulo=f"{rotulo} dims")
+    rows = [{"competencia_id": comp_id, "municipio_id": mun_ids[m], "item_id": item_ids[i],
+             "existente": rnd.randint(0, 50), "sus": rnd.randint(0, 30), "habilitados": rnd.randint(0, 20)}
+            for m, itens in celulas.items() for i in itens]
+    rnd.shuffle(rows)  # a ordem de chegada não importa: upsert_dicts ordena
+
+    def gravar(conn):
+        travar_celulas(conn, TABELA, rows)
+        upsert_dicts(conn, TABELA, rows, pkey_cols=PKEY, update_cols=METRICAS)
+        remover_ausentes(conn, TABELA, rows)
+        publicar_carga(conn, "leito", [_cod_mun(m) for m in celulas], vcomp=vcomp)  # versão avança após o commit
+        # ordem tomada com as travas da célula ainda presas: rodadas que disputam
+        # uma célula recebem números na mesma ordem em que comitam
+        return len(rows), next(seq)
+
+    return gravar_com_retentativa(conn, gravar, rotulo=rotulo)
+
+# ------------------------------ execução ------------------------------
+
+def _esperas_lock(cfg, parar: threading.Event, amostras: list):
+    with conexao("padrao", cfg, autocommit=True) as conn, conn.cursor() as cur:
+        while not parar.is_set():
+            cur.execute("""
+                SELECT count(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND wait_event_type = 'Lock'
+            """)
+            amostras.append(cur.fetchone()[0])
+            parar.wait(0.02)
+
+def rodar(cfg, modo: str, args) -> dict:
+    _preparar(cfg)
+    for k in db_utils.retentativas:
+        db_utils.retentativas[k] = 0
+    res = {"ok": 0, "perdidas": 0, "deadlocks": 0, "linhas": 0, "latencias": [], "erros": []}
+    ultima = {}          # município -> (ordem do commit, itens) da última rodada gravada
+    trava = threading.Lock()
+    seq = itertools.count()
+
+    def escritor(w):
+        rnd = random.Random(args.semente * 1000 + w)
+        with conexao("carga", cfg, search_path=SCHEMA) as conn:
+            for r in range(args.rodadas):
+                celulas = _sortear(rnd, args)
+                t0 = time.perf_counter()
+                try:
+                    if modo == "legado":
+                        n, k = _rodada_legado(conn, args.vcomp, celulas, rnd), None
+                    else:
+                        n, k = _rodada_ordenada(conn, args.vcomp, celulas, rnd, f"w{w} r{r}", seq)
+                except Exception as e:
+                    conn.rollback()
+                    with trava:
+                        res["perdidas"] += 1
+                        res["deadlocks"] += getattr(e, "pgcode", None) == "40P01"
+                        res["erros"].append(f"w{w} r{r}: {type(e).__name__}: {str(e).splitlines()[0]}")
+                    continue
+                with trava:
+                    res["ok"] += 1
+                    res["linhas"] += n
+                    res["latencias"].append(time.perf_counter() - t0)
+                    for m, itens in celulas.items():
+                        if k is not None and k > ultima.get(m, (-1,))[0]:
+                            ultima[m] = (k, itens)
+
+    amostras, parar = [], threading.Event()
+    monitor = threading.Thread(target=_esperas_lock, args=(cfg, parar, amostras), daemon=True)
+    monitor.start()
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=escritor, args=(w,)) for w in range(args.escritores)]
+    with contextlib.redirect_stdout(io.StringIO()):  # os [RETRY] de cada rodada; o resumo conta
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    res["duracao"] = time.perf_counter() - t0
+    parar.set()
+    monitor.join()
+    res["esperas_lock"] = amostras
+    res["retentativas"] = dict(db_utils.retentativas)
+    res["divergentes"] = _conferir(cfg, ultima) if modo == "ordenado" else None
+    return res
+
+def _conferir(cfg, ultima: dict) -> int:
+    """
+    Células cujo conjunto de itens no banco difere do da última rodada gravada.
+    Só vale para o caminho ordenado, que numera cada rodada com as travas presas.
+    """
+    with conexao("leitura", cfg, autocommit=True, search_path=SCHEMA) as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT m.codigo_municipio, array_agg(i.codigo::int ORDER BY i.codigo::int)
+            FROM {TABELA} f
+            JOIN dim_municipio m USING (municipio_id)
+            JOIN dim_item_cnes i USING (item_id)
+            GROUP BY m.codigo_municipio
+        """)
+        banco = {int(cod) - 140000: itens for cod, itens in cur.fetchall()}
+    return sum(1 for m, (_, itens) in ultima.items() if banco.get(m) != sorted(itens))
+
+def _imprimir(modo, res, args):
+    lat = res["latencias"]
+    esperas = res["esperas_lock"]
+    tentativas = sum(res["retentativas"].values())
+    print(f"  {modo:8s}: {res['ok']}/{args.escritores * args.rodadas} rodadas gravadas, "
+          f"{res['perdidas']} perdida(s) ({res['deadlocks']} por deadlock), "
+          f"{tentativas} retentativa(s) {res['retentativas'] if tentativas else ''}")
+    print(f"            {res['linhas'] / res['duracao']:,.0f} linhas/s em {res['duracao']:.1f}s, "
+          f"rodada p50 {_percentil(lat, 50) * 1000:.0f} ms p95 {_percentil(lat, 95) * 1000:.0f} ms; "
+          f"backends em espera de lock: média {sum(esperas) / max(1, len(esperas)):.1f}, máx {max(esperas, default=0)}")
+    if res["divergentes"] is not None:
+        print(f"            células divergentes da última gravação: {res['divergentes']}")
+    for e in res["erros"][:3]:
+        print(f"            {e}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Stress de upserts concorrentes na mesma competência")
+    ap.add_argument("--modo", choices=["ambos", "legado", "ordenado"], default="ambos")
+    ap.add_argument("--escritores", type=int, default=8)
+    ap.add_argument("--rodadas", type=int, default=30, help="Rodadas por escritor")
+    ap.add_argument("--municipios", type=int, default=20)
+    ap.add_argument("--itens", type=int, default=40)
+    ap.add_argument("--vcomp", default="202401")
+    ap.add_argument("--semente", type=int, default=1)
+    args = ap.parse_args()
+
+    cfg = DBConfig()
+    p = pool(cfg)
+    p.tamanho = max(p.tamanho, args.escritores + 2)  # escritores + monitor + preparo/conferência
+    print(f"[STRESS] {args.escritores} escritores x {args.rodadas} rodadas em {SCHEMA}.{TABELA}, "
+          f"competência {args.vcomp}: {args.municipios} municípios x {args.itens} itens")
+
+    modos = ["legado", "ordenado"] if args.modo == "ambos" else [args.modo]
+    falhou = False
+    try:
+        for modo in modos:
+            res = rodar(cfg, modo, args)
+            _imprimir(modo, res, args)
+            if modo == "ordenado":
+                falhou = bool(res["perdidas"] or res["divergentes"])
+    finally:
+        with conexao("padrao", cfg, autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    print(p.resumo())
+    if falhou:
+        print("[STRESS] FALHOU: o caminho ordenado perdeu rodadas ou divergiu")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
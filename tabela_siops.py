@@ -0,0 +1,76 @@
+# tabela_siops.py
+"""
+Conversão das tabelas de resultado do SIOPS em matriz de texto.
+
+Sem dependências: recebe qualquer objeto com a interface do WebElement usada
+aqui (find_elements(by, xpath) e get_attribute(nome)), seja o elemento do
+Selenium no siops_to_pg, seja o adaptador BeautifulSoup do benchmark_parsers.
+"""
+
+XPATH = "xpath"  # == selenium.webdriver.common.by.By.XPATH
+
+def table_to_matrix(tbl):
+    """
+    Converte <table> em matriz (respeitando colspan/rowspan).
+    """
+    rows = tbl.find_elements(XPATH, ".//tr")
+    matrix, span_down = [], []
+    for tr in rows:
+        cells = tr.find_elements(XPATH, ".//th | .//td")
+        if not span_down:
+            span_down = [None] * 64
+        row, col_idx = [], 0
+
+        def advance(cidx):
+            while True:
+                if cidx >= len(span_down):
+                    span_down.extend([None] * 16)
+                if cidx >= len(row):
+                    row.extend([""] * (cidx - len(row) + 1))
+                if span_down[cidx]:
+                    text, left = span_down[cidx]
+                    row[cidx] = text
+                    left -= 1
+                    span_down[cidx] = (text, left) if left > 0 else None
+                    cidx += 1
+                else:
+                    break
+            return cidx
+
+        col_idx = advance(col_idx)
+        for cell in cells:
+            txt = cell.get_attribute("innerText").strip()
+            colspan = cell.get_attribute("colspan")
+            rowspan = cell.get_attribute("rowspan")
+            cspan = int(colspan) if colspan and colspan.isdigit() else 1
+            rspan = int(rowspan) if rowspan and rowspan.isdigit() else 1
+
+            if col_idx + cspan > len(row):
+                row.extend([""] * (col_idx + cspan - len(row)))
+            for k in range(cspan):
+                row[col_idx + k] = txt
+            if rspan > 1:
+                for k in range(cspan):
+                    j = col_idx + k
+                    if j >= len(span_down):
+                        span_down.extend([None] * (j - len(span_down) + 1))
+                    span_down[j] = (txt, rspan - 1)
+            col_idx += cspan
+            col_idx = advance(col_idx)
+
+        while row and row[-1] == "":
+            row.pop()
+        matrix.append(row)
+
+    width = max((len(r) for r in matrix), default=0)
+    for r in matrix:
+        if len(r) < width:
+            r.extend([""] * (width - len(r)))
+    return matrix
+
+def guess_title_from_table(matrix):
+    for i in range(min(3, len(matrix))):
+        line = " ".join(cell for cell in matrix[i][:3] if cell).strip()
+        if line:
+            return line[:150]
+    return "tabela"